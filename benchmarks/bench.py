@@ -0,0 +1,317 @@
+"""
+Benchmark the parser, the serialization and the filter, and compare the
+results with the saved baselines to catch regressions.
+
+Each case runs in a fresh process, so that its peak RSS is its own. The pages
+are produced by `page_generator` and the items by `bench_io.make_item`, both
+deterministic, so the results are comparable across runs on the same machine.
+
+Usage:
+
+    # run all the cases and compare with 'benchmarks/baselines.json'
+    python benchmarks/bench.py
+
+    # run some cases only, and exit with 1 if any of them regresses
+    python benchmarks/bench.py --cases=parse,parse_fast --check
+
+    # save the results as the new baselines
+    python benchmarks/bench.py --save-baseline
+"""
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+import fire
+
+from bench_io import make_item
+from page_generator import generate_page
+from scrape_taobao import io
+from scrape_taobao.commands.filtor import filtor
+from scrape_taobao.core.parse_item_page import parse_item_page
+from scrape_taobao.store import open_item_store
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+# the metrics compared with the baselines, and whether the higher the better
+COMPARED_METRICS = [("rate", True), ("p90", False), ("peak_rss_mb", False)]
+
+
+def _timed(run: Callable[[int], None], indices: Sequence[int]) -> List[float]:
+    """
+    :return: seconds taken by `run` on each of the indices
+    """
+    latencies = []
+    for index in indices:
+        start = time.perf_counter()
+        run(index)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_parse(options: dict, fast: bool) -> Tuple[str, List[float], int]:
+    """
+    Parse the generated pages one by one.
+
+    The pages are generated right before being parsed, so that the peak RSS is
+    not inflated by holding all of them.
+    """
+
+    def gen(index):
+        return generate_page(
+            index,
+            tmall_ratio=options["tmall_ratio"],
+            skus=tuple(options["skus"]),
+            page_size=options["page_size"],
+        )
+
+    # warm up the imports and the caches
+    parse_item_page(gen(0), fast=fast)
+
+    latencies = []
+    for index in range(1, options["pages"] + 1):
+        page_source = gen(index)
+        latencies += _timed(
+            lambda _: parse_item_page(page_source, fast=fast), [index]
+        )
+    return "pages", latencies, len(latencies)
+
+
+def bench_dump(options: dict, fmt: str) -> Tuple[str, List[float], int]:
+    items = [make_item(i) for i in range(options["items"])]
+    with tempfile.TemporaryDirectory() as out_dir:
+        if fmt == "jsonl":
+            path = os.path.join(out_dir, "items.jsonl")
+            paths = [path] * len(items)
+        else:
+            paths = [
+                os.path.join(out_dir, "{}.{}".format(i, fmt))
+                for i in range(len(items))
+            ]
+
+        latencies = _timed(
+            lambda i: io.dump(items[i], paths[i], fmt), range(len(items))
+        )
+        return "items", latencies, len(latencies)
+
+
+def bench_load(options: dict, fmt: str) -> Tuple[str, List[float], int]:
+    with tempfile.TemporaryDirectory() as out_dir:
+        paths = [
+            os.path.join(out_dir, "{}.{}".format(i, fmt))
+            for i in range(options["items"])
+        ]
+        for i, path in enumerate(paths):
+            io.dump(make_item(i), path, fmt)
+
+        latencies = _timed(lambda i: io.load(paths[i], fmt), range(len(paths)))
+        return "items", latencies, len(latencies)
+
+
+def bench_filter(
+    options: dict, store: str, snapshot: bool = False
+) -> Tuple[str, List[float], int]:
+    """
+    Filter the stored items, each run goes over all of them.
+    """
+    n = options["items"]
+    with tempfile.TemporaryDirectory() as out_dir:
+        with open_item_store(store, out_dir) as item_store:
+            for i in range(n):
+                item_store.put("id={}".format(i), make_item(i))
+
+        def run(_):
+            with open(os.devnull, "w") as devnull:
+                with contextlib.redirect_stdout(devnull):
+                    filtor(
+                        out_dir,
+                        store=store,
+                        min_sales=1000,
+                        max_price=400,
+                        sort="-sales",
+                        limit=50,
+                        snapshot=snapshot,
+                        output="jsonl",
+                    )
+
+        # warm up, which also builds the snapshot
+        run(0)
+
+        # the rate is of the items, while the latencies are of the runs
+        latencies = _timed(run, range(options["runs"]))
+        return "items", latencies, n * len(latencies)
+
+
+CASES: Dict[str, Callable[[dict], Tuple[str, List[float], int]]] = {
+    "parse": lambda options: bench_parse(options, fast=False),
+    "parse_fast": lambda options: bench_parse(options, fast=True),
+    "dump_yaml": lambda options: bench_dump(options, "yaml"),
+    "load_yaml": lambda options: bench_load(options, "yaml"),
+    "dump_json": lambda options: bench_dump(options, "json"),
+    "load_json": lambda options: bench_load(options, "json"),
+    "dump_jsonl": lambda options: bench_dump(options, "jsonl"),
+    "filter_file": lambda options: bench_filter(options, "file"),
+    "filter_sqlite": lambda options: bench_filter(options, "sqlite"),
+    "filter_jsonl": lambda options: bench_filter(options, "jsonl"),
+    "filter_snapshot": lambda options: bench_filter(
+        options, "sqlite", snapshot=True
+    ),
+}
+
+
+def _run_case(name: str, options: dict) -> dict:
+    """
+    Run the case, in a fresh process.
+    """
+    unit, latencies, count = CASES[name](options)
+
+    # in KiB on linux, but in bytes on macos
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss /= 1024 * 1024 if sys.platform == "darwin" else 1024
+
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return dict(
+        unit=unit,
+        count=count,
+        rate=round(count / sum(latencies), 1),
+        p50=round(quantiles[49] * 1000, 3),
+        p90=round(quantiles[89] * 1000, 3),
+        p99=round(quantiles[98] * 1000, 3),
+        peak_rss_mb=round(peak_rss, 1),
+    )
+
+
+def _compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    :return: descriptions of the metrics regressed beyond the tolerance
+    """
+    regressions = []
+    for metric, higher_is_better in COMPARED_METRICS:
+        if not baseline.get(metric):
+            continue
+
+        change = result[metric] / baseline[metric] - 1
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append("{} {:+.0%}".format(metric, change))
+    return regressions
+
+
+def bench(
+    cases: Union[str, Sequence[str]] = None,
+    *,
+    pages: int = 100,
+    page_size: int = 240_000,
+    skus: Tuple[int, int] = (1, 60),
+    tmall_ratio: float = 0.25,
+    items: int = 1000,
+    runs: int = 5,
+    baseline: str = BASELINE_PATH,
+    save_baseline: bool = False,
+    tolerance: float = 0.2,
+    check: bool = False,
+):
+    """
+    Run the benchmarks and compare them with the baselines.
+
+    :param cases: names of the cases to run, separated by commas, default all
+    :param pages: number of the pages to parse
+    :param page_size: size of each generated page in bytes
+    :param skus: range of the number of skus of each taobao page
+    :param tmall_ratio: ratio of the tmall pages
+    :param items: number of the items to dump, load and filter
+    :param runs: number of the runs of each filter case
+    :param baseline: path of the baselines
+    :param save_baseline: save the results into the baselines, keeping the
+      baselines of the cases not run
+    :param tolerance: max ratio of the regression to tolerate
+    :param check: exit with 1 if any case regresses
+    """
+    if cases is None:
+        cases = list(CASES)
+    elif isinstance(cases, str):
+        cases = [case.strip() for case in cases.split(",") if case.strip()]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        raise ValueError("unknown cases: {}".format(", ".join(unknown)))
+
+    options = dict(
+        pages=pages,
+        page_size=page_size,
+        skus=list(skus),
+        tmall_ratio=tmall_ratio,
+        items=items,
+        runs=runs,
+    )
+
+    baselines = {}
+    if os.path.exists(baseline):
+        with open(baseline) as f:
+            baselines = json.load(f)
+        if baselines.get("options", options) != options:
+            print(
+                "warning: the baselines were measured with different options "
+                "{}".format(baselines["options"])
+            )
+
+    print(
+        "{:<18}{:>14}{:>10}{:>10}{:>10}{:>10}  {}".format(
+            "case", "rate", "p50 ms", "p90 ms", "p99 ms", "rss MB", "baseline"
+        )
+    )
+
+    results, regressed = {}, []
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            result = pool.apply(_run_case, (case, options))
+        results[case] = result
+
+        compared = "-"
+        case_baseline = baselines.get("cases", {}).get(case)
+        if case_baseline:
+            regressions = _compare(result, case_baseline, tolerance)
+            if regressions:
+                regressed.append(case)
+                compared = "REGRESSED " + ", ".join(regressions)
+            else:
+                compared = "ok ({:+.0%} rate)".format(
+                    result["rate"] / case_baseline["rate"] - 1
+                )
+
+        print(
+            "{:<18}{:>14}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.1f}  {}".format(
+                case,
+                "{:.0f} {}/s".format(result["rate"], result["unit"]),
+                result["p50"],
+                result["p90"],
+                result["p99"],
+                result["peak_rss_mb"],
+                compared,
+            )
+        )
+
+    if save_baseline:
+        baselines.update(
+            options=options,
+            python=platform.python_version(),
+            machine=platform.machine(),
+        )
+        baselines.setdefault("cases", {}).update(results)
+        with open(baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("baselines saved to {}".format(baseline))
+
+    if regressed and check:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    fire.Fire(bench)
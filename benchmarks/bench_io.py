@@ -0,0 +1,118 @@
+"""
+Benchmark the serialization of the parsed items through `dump` and `load`.
+
+Usage:
+
+    python benchmarks/bench_io.py --n=2000
+"""
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+
+import fire
+import yaml
+
+from scrape_taobao import io
+from scrape_taobao.bean.item_data import ItemChoiceData, ItemData, item_to_dict
+
+
+def make_item(index: int) -> dict:
+    """
+    Make a fake item, sized like a typical taobao item.
+    """
+    rnd = random.Random(index)
+    choices = [
+        ItemChoiceData(
+            tags=["1627207:{}".format(i), "20509:{}".format(i % 5)],
+            name="颜色分类 {} 尺码 {}".format(i, i % 5),
+            sku_id=str(4000000000000 + index * 100 + i),
+            price=round(rnd.uniform(10, 500), 2),
+            stock=rnd.randint(0, 1000),
+            oversold=rnd.random() < 0.1,
+        )
+        for i in range(rnd.randint(1, 30))
+    ]
+    prices = [c.price for c in choices]
+    item = ItemData(
+        platform=rnd.choice(["taobao", "tmall"]),
+        title="商品 {} - 淘宝网".format(index),
+        details={"属性{}".format(i): "值{}".format(i) for i in range(12)},
+        delivery_info="48小时内发货",
+        choices=choices,
+        price_range=(min(prices), max(prices)),
+        total_stock=sum(c.stock for c in choices),
+        sales=rnd.randint(0, 10000),
+    )
+    return item_to_dict(item)
+
+
+@contextmanager
+def pure_yaml():
+    """
+    Use the pure python yaml loader and dumper.
+    """
+    loader, dumper = io.YamlLoader, io.YamlDumper
+    io.YamlLoader, io.YamlDumper = yaml.FullLoader, yaml.Dumper
+    try:
+        yield
+    finally:
+        io.YamlLoader, io.YamlDumper = loader, dumper
+
+
+def bench_format(items, fmt: str, out_dir: str):
+    """
+    :return: items per second of dumping and of loading
+    """
+    if fmt == "jsonl":
+        path = os.path.join(out_dir, "items.jsonl")
+        start = time.perf_counter()
+        for item in items:
+            io.dump(item, path, fmt="jsonl")
+        dump_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loaded = list(io.iter_jsonl(path))
+        load_time = time.perf_counter() - start
+
+    else:
+        paths = [
+            os.path.join(out_dir, "{}.{}".format(i, fmt))
+            for i in range(len(items))
+        ]
+        start = time.perf_counter()
+        for item, path in zip(items, paths):
+            io.dump(item, path, fmt=fmt)
+        dump_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loaded = [io.load(path, fmt=fmt) for path in paths]
+        load_time = time.perf_counter() - start
+
+    assert len(loaded) == len(items)
+    return len(items) / dump_time, len(items) / load_time
+
+
+def bench_io(n: int = 2000):
+    """
+    Compare items per second of yaml, json and jsonl through `dump`/`load`.
+
+    :param n: number of items
+    """
+    items = [make_item(i) for i in range(n)]
+
+    cases = [("yaml (pure)", "yaml", pure_yaml)]
+    if io.YamlDumper is not yaml.Dumper:
+        cases.append(("yaml (libyaml)", "yaml", nullcontext))
+    cases += [("json", "json", nullcontext), ("jsonl", "jsonl", nullcontext)]
+
+    print("{:<16}{:>14}{:>14}".format("format", "dump/s", "load/s"))
+    for name, fmt, context in cases:
+        with tempfile.TemporaryDirectory() as out_dir, context():
+            dump_rate, load_rate = bench_format(items, fmt, out_dir)
+        print("{:<16}{:>14.0f}{:>14.0f}".format(name, dump_rate, load_rate))
+
+
+if __name__ == "__main__":
+    fire.Fire(bench_io)
@@ -0,0 +1,295 @@
+"""
+Generate synthetic taobao and tmall item pages for benchmarking.
+
+The pages carry every node the parsers look for, i.e. the `skuMap` and the
+`propertyMemoMap` of a configurable number of skus, `J_StrPrice`,
+`J_SpanStock`, `J_SellCounter`, `J_ServiceMarkInfo` and `attributes-list` of
+taobao, and the `ItemHeader--salesDesc--*`, `Price--priceText--*`,
+`ItemDetail--attrs--*`, `delivery-info` and the `skuBase` and `skuCore` of
+tmall. They are padded with
+boilerplate markup, styles and scripts up to the given size, like the real
+pages are.
+
+Usage:
+
+    python benchmarks/page_generator.py ./bench-pages --n=200 --skus=60
+"""
+import json
+import os
+import random
+from typing import Tuple, Union
+
+import fire
+
+# ids of the sku properties and the names of their values
+PROPERTIES = {
+    "1627207": ["黑色", "白色", "红色", "蓝色", "灰色", "卡其色", "粉色", "绿色"],
+    "20509": ["S", "M", "L", "XL", "2XL", "3XL", "4XL"],
+    "122216343": ["标准款", "加绒款", "加厚款"],
+}
+
+BRANDS = ["Foo & Bar", "Acme", "优衣库", "李宁", "安踏", "无印良品"]
+
+FILLER_BLOCK = """<div class="tb-nav-item" data-spm="d{n}">
+  <a href="//s.taobao.com/search?q=item{n}&amp;spm=a21bo.{n}" target="_blank"
+     class="J_NavLink tb-link" title="热门推荐 {n}">热门推荐 {n}</a>
+  <img src="//img.alicdn.com/imgextra/i{m}/{n}/O1CN01{n}_!!0-item_pic.jpg_60x60q90.jpg"
+       alt="" width="60" height="60"/>
+</div>
+<!-- recommend {n} -->
+<style>.tb-nav-item-{n}{{margin:0 {m}px;padding:{m}px;color:#ff{m}{m}00}}</style>
+<script>window.g_config && g_config.push({{"id":{n},"track":"/tb.{n}.{m}"}});</script>
+"""
+
+
+def _pad(html: str, page_size: int, rnd: random.Random) -> str:
+    """
+    Pad the page with boilerplate before and after the content, up to the
+    page size in bytes.
+    """
+    blocks = []
+    size = len(html.encode("utf-8"))
+    while size < page_size:
+        block = FILLER_BLOCK.format(
+            n=rnd.randint(0, 10**9), m=rnd.randint(1, 9)
+        )
+        blocks.append(block)
+        size += len(block)
+
+    head, tail = blocks[: len(blocks) // 2], blocks[len(blocks) // 2 :]
+    return html.replace("<!--HEAD-->", "".join(head)).replace(
+        "<!--TAIL-->", "".join(tail)
+    )
+
+
+def _sku_props(skus: int) -> list:
+    """
+    Choose the properties and their values, whose combinations cover the skus.
+    """
+    props, combinations = [], 1
+    for pid, names in PROPERTIES.items():
+        if combinations >= skus:
+            break
+        props.append((pid, names))
+        combinations *= len(names)
+    return props or [next(iter(PROPERTIES.items()))]
+
+
+def generate_taobao_page(
+    index: int, *, skus: int = 20, page_size: int = 0, seed: int = 0
+) -> str:
+    """
+    Generate a taobao item page.
+
+    :param index: index of the item, used as its sales and its title
+    :param skus: number of skus, 0 means no `skuMap`
+    :param page_size: pad the page up to such number of bytes
+    :param seed: seed of the random contents
+    """
+    rnd = random.Random(seed * 1000003 + index)
+
+    sku_map, memo_map = {}, {}
+    if skus > 0:
+        props = _sku_props(skus)
+        for k in range(skus):
+            tags, rest = [], k
+            for pid, names in props:
+                vid = rest % len(names)
+                rest //= len(names)
+                tags.append("{}:{}".format(pid, vid))
+                memo_map["{}:{}".format(pid, vid)] = names[vid]
+            sku_map[";{};".format(";".join(tags))] = {
+                "skuId": str(4000000000000 + index * 1000 + k),
+                "price": "{:.2f}".format(rnd.uniform(9.9, 999.0)),
+                "stock": str(rnd.randint(0, 2000)),
+                "oversold": rnd.random() < 0.05,
+            }
+
+    prices = [float(attrs["price"]) for attrs in sku_map.values()] or [
+        rnd.uniform(9.9, 999.0)
+    ]
+    attributes = "".join(
+        '<li title="{v}">{k}:&nbsp;{v}</li>'.format(k=k, v=v)
+        for k, v in [("品牌", rnd.choice(BRANDS).replace("&", "&amp;"))]
+        + [
+            ("属性{}".format(i), "值{}".format(rnd.randint(0, 99)))
+            for i in range(15)
+        ]
+    )
+
+    html = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"/>
+<title>商品 {index} 春秋新款 &amp; 百搭-淘宝网</title>
+<!--HEAD-->
+</head><body>
+<div class="tb-wrap"><div class="tb-item-info">
+<div id="J_StrPrice" class="tb-price"><em class="tb-rmb">&yen;</em><em class="tb-rmb-num">{min_price:.2f} - {max_price:.2f}</em></div>
+<div class="tb-amount">库存<span id="J_SpanStock">{stock}</span>件</div>
+<div class="tb-counter">月销量<strong id="J_SellCounter">{sales}</strong></div>
+<div id="J_ServiceMarkInfo" class="tb-service"> <span>{delivery}小时内发货</span> </div>
+</div>
+<ul class="attributes-list">{attributes}</ul>
+</div>
+<!--TAIL-->
+<script>
+Hub.config.set('sku', {{
+  valCartInfo: {{ itemId: '{index}' }},
+  valItemInfo: {{
+    defSelected: [],
+    skuMap     : {sku_map}
+    ,propertyMemoMap: {memo_map}
+  }}
+}});
+</script>
+</body></html>
+""".format(
+        index=index,
+        min_price=min(prices),
+        max_price=max(prices),
+        stock=rnd.randint(0, 5000),
+        sales=index,
+        delivery=rnd.choice([24, 48, 72]),
+        attributes=attributes,
+        sku_map=json.dumps(sku_map),
+        memo_map=json.dumps(memo_map, ensure_ascii=False),
+    )
+    if skus <= 0:
+        html = html.replace("skuMap     : {}\n", "").replace(
+            "    ,propertyMemoMap: {}\n", ""
+        )
+    return _pad(html, page_size, rnd)
+
+
+def generate_tmall_page(
+    index: int, *, skus: int = 20, page_size: int = 0, seed: int = 0
+) -> str:
+    """
+    Generate a tmall item page.
+
+    :param index: index of the item, used as its sales and its title
+    :param skus: number of skus, 0 means no sku state
+    :param page_size: pad the page up to such number of bytes
+    :param seed: seed of the random contents
+    """
+    rnd = random.Random(seed * 1000003 + index)
+
+    sku_base = {"props": [], "skus": []}
+    sku2info = {}
+    if skus > 0:
+        props = _sku_props(skus)
+        sku_base["props"] = [
+            dict(
+                pid=pid,
+                name="属性{}".format(pid),
+                values=[
+                    dict(vid=str(vid), name=n) for vid, n in enumerate(names)
+                ],
+            )
+            for pid, names in props
+        ]
+        for k in range(skus):
+            tags, rest = [], k
+            for pid, names in props:
+                tags.append("{}:{}".format(pid, rest % len(names)))
+                rest //= len(names)
+            sku_id = str(5000000000000 + index * 1000 + k)
+            sku_base["skus"].append(dict(propPath=";".join(tags), skuId=sku_id))
+            sku2info[sku_id] = dict(
+                price=dict(priceText="{:.2f}".format(rnd.uniform(9.9, 999.0))),
+                quantity=str(rnd.randint(0, 2000)),
+            )
+
+    attrs = "".join(
+        '<span class="Attrs--attr--33ShB6X" title="{v}">{k}：{v}</span>'.format(
+            k=k, v=v
+        )
+        for k, v in [("品牌", rnd.choice(BRANDS).replace("&", "&amp;"))]
+        + [
+            ("参数{}".format(i), "值{}".format(rnd.randint(0, 99)))
+            for i in range(12)
+        ]
+    )
+
+    html = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"/>
+<title>商品 {index} 旗舰店正品-tmall.com天猫</title>
+<!--HEAD-->
+</head><body>
+<div class="ItemHeader--root--DXhqHxP">
+<h1 class="ItemHeader--mainTitle--3CIjqW5">商品 {index}</h1>
+<span class="ItemHeader--salesDesc--srlk2Hv">月销 {sales}+</span>
+</div>
+<div class="Price--root--1CrVGjc"><span class="Price--symbol--1Rm6Xe5">¥</span><span class="Price--priceText--2nLbVda">{price:.2f}</span></div>
+<div class="delivery-info"><span>{city}</span><span>快递: 免运费</span></div>
+<div class="ItemDetail--attrs--3t-mTb3">{attrs}</div>
+<!--TAIL-->
+<script>
+window.__ICE_APP_CONTEXT__ = {{"loaderData":{{"home":{{"data":{{"res":{{"skuBase":{sku_base},"skuCore":{sku_core}}}}}}}}}}};
+</script>
+</body></html>
+""".format(
+        index=index,
+        sales=index,
+        price=rnd.uniform(9.9, 999.0),
+        city=rnd.choice(["浙江杭州", "广东广州", "上海"]),
+        attrs=attrs,
+        sku_base=json.dumps(sku_base, ensure_ascii=False),
+        sku_core=json.dumps(dict(sku2info=sku2info), ensure_ascii=False),
+    )
+    return _pad(html, page_size, rnd)
+
+
+def generate_page(
+    index: int,
+    *,
+    tmall_ratio: float = 0.25,
+    skus: Union[int, Tuple[int, int]] = (1, 60),
+    page_size: int = 240_000,
+    seed: int = 0,
+) -> str:
+    """
+    Generate a taobao or tmall item page by chance.
+
+    :param skus: number of skus, or a range to pick from
+    """
+    rnd = random.Random(seed * 1000003 + index)
+    is_tmall = rnd.random() < tmall_ratio
+
+    if not isinstance(skus, int):
+        skus = rnd.randint(*skus)
+    if is_tmall:
+        return generate_tmall_page(
+            index, skus=skus, page_size=page_size, seed=seed
+        )
+    return generate_taobao_page(
+        index, skus=skus, page_size=page_size, seed=seed
+    )
+
+
+def generate_pages(
+    out_dir: str,
+    *,
+    n: int = 200,
+    tmall_ratio: float = 0.25,
+    skus: Union[int, Tuple[int, int]] = (1, 60),
+    page_size: int = 240_000,
+    seed: int = 0,
+):
+    """
+    Generate pages as '<out_dir>/id=<index>.html', see `generate_page`.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for index in range(1, n + 1):
+        page_source = generate_page(
+            index,
+            tmall_ratio=tmall_ratio,
+            skus=skus,
+            page_size=page_size,
+            seed=seed,
+        )
+        with open(os.path.join(out_dir, "id={}.html".format(index)), "w") as f:
+            f.write(page_source)
+
+
+if __name__ == "__main__":
+    fire.Fire(generate_pages)
@@ -6,11 +6,23 @@ import logging
 import fire
 from dotenv import load_dotenv
 
+from scrape_taobao.commands.export_items import export_items
 from scrape_taobao.commands.filtor import filtor
+from scrape_taobao.commands.history import (
+    compact_history,
+    growth,
+    show_history,
+)
+from scrape_taobao.commands.import_items import import_items
+from scrape_taobao.commands.migrate_pages import migrate_pages
 from scrape_taobao.commands.parse import parse
 from scrape_taobao.commands.parse_one import parse_one
+from scrape_taobao.commands.queue_status import queue_status
+from scrape_taobao.commands.retry_failed import retry_failed
 from scrape_taobao.commands.scrape import scrape
 from scrape_taobao.commands.scrape_one import scrape_one
+from scrape_taobao.commands.serve import serve
+from scrape_taobao.commands.serve_pages import serve_pages
 
 logging.basicConfig(level=logging.INFO)
 
@@ -24,5 +36,15 @@ if __name__ == "__main__":
             parse=parse,
             parse_one=parse_one,
             filter=filtor,
+            serve=serve,
+            serve_pages=serve_pages,
+            import_items=import_items,
+            export_items=export_items,
+            migrate_pages=migrate_pages,
+            retry_failed=retry_failed,
+            queue_status=queue_status,
+            history=show_history,
+            growth=growth,
+            compact_history=compact_history,
         )
     )
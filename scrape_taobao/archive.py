@@ -0,0 +1,342 @@
+"""
+Page archives, i.e. tarballs or WARC captures of the item pages, to move page
+corpora between machines without unpacking millions of small files.
+
+The archives are streamed: the members are read or written one by one in
+order and never seeked, so that going through a gzipped archive costs a
+single sequential read of it.
+
+The formats are told by the extensions:
+  - '.tar', '.tar.gz' or '.tgz': a member per page, named as the cached pages
+    are, e.g. 'id=123.html', so that a pages dir can be packed with such as
+    `tar -C cache/pages -czf pages.tar.gz .`;
+  - '.warc' or '.warc.gz': a 'response' or 'resource' record per page, whose
+    item id is taken from its 'WARC-Target-URI'. The records of a '.warc.gz'
+    are gzipped one by one, as usual.
+"""
+import gzip
+import io
+import logging
+import os
+import tarfile
+import threading
+import time
+import uuid
+import zlib
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+from scrape_taobao.item_list import canonical_item_id
+
+logger = logging.getLogger(__name__)
+
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz")
+WARC_EXTENSIONS = (".warc", ".warc.gz")
+
+
+def is_archive(path: str) -> bool:
+    """
+    Tell if the path is a page archive file, rather than a pages dir.
+    """
+    return os.path.isfile(path) and path.endswith(
+        TAR_EXTENSIONS + WARC_EXTENSIONS
+    )
+
+
+def iter_archive(path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Stream the pages of the archive as (item id, page source).
+
+    The members without an item id, e.g. the other files of a tarball or the
+    captured images of a WARC, are skipped, so are the captured responses
+    other than '200 OK', e.g. the redirects to the login page.
+    """
+    if path.endswith(WARC_EXTENSIONS):
+        return _iter_warc(path)
+    if path.endswith(TAR_EXTENSIONS):
+        return _iter_tar(path)
+    raise ValueError("unsupported archive: {}".format(path))
+
+
+def read_archive_page(
+    path: str, item_id: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Read the page of the item from the archive, or the first page if the item
+    is not given.
+
+    :return: (item id, page source)
+    """
+    for page_item_id, page_source in iter_archive(path):
+        if item_id is None or page_item_id == item_id:
+            return page_item_id, page_source
+
+    raise LookupError(
+        'no page of "{}" in "{}"'.format(item_id or "any item", path)
+    )
+
+
+def _iter_tar(path: str) -> Iterator[Tuple[str, str]]:
+    # in the stream mode, which reads the members in order without seeking
+    with tarfile.open(path, "r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+
+            name = os.path.basename(member.name)
+            item_id = canonical_item_id(os.path.splitext(name)[0])
+            if item_id is None:
+                logger.debug('skip member "{}"'.format(member.name))
+                continue
+
+            yield item_id, tar.extractfile(member).read().decode(
+                "utf-8", errors="replace"
+            )
+
+
+def _iter_warc(path: str) -> Iterator[Tuple[str, str]]:
+    # a '.warc.gz' is a series of gzip members, which are read through as one
+    with (gzip.open if path.endswith(".gz") else open)(path, "rb") as f:
+        while True:
+            record = _read_warc_record(f)
+            if record is None:
+                return
+
+            headers, block = record
+            if headers.get("warc-type") not in ("response", "resource"):
+                continue
+
+            uri = headers.get("warc-target-uri", "").strip("<>")
+            item_id = canonical_item_id(uri)
+            if item_id is None:
+                continue
+
+            if headers["warc-type"] == "response":
+                page = _http_body(block)
+                if page is None:
+                    logger.debug('skip response of "{}"'.format(uri))
+                    continue
+                body, content_type = page
+            else:
+                body, content_type = block, headers.get("content-type", "")
+
+            if content_type and "html" not in content_type:
+                continue
+
+            yield item_id, body.decode(_charset(content_type), errors="replace")
+
+
+def _read_warc_record(f: BinaryIO) -> Optional[Tuple[Dict[str, str], bytes]]:
+    """
+    Read the next record as (headers with lowercase names, content block), or
+    None at the end.
+    """
+    # skip the blank lines ending the previous record
+    line = f.readline()
+    while line in (b"\r\n", b"\n"):
+        line = f.readline()
+    if not line:
+        return None
+    if not line.startswith(b"WARC/"):
+        raise ValueError("not a warc record: {!r}".format(line[:32]))
+
+    headers = _read_headers(f)
+    block = f.read(int(headers.get("content-length", 0)))
+    return headers, block
+
+
+def _read_headers(f: BinaryIO) -> Dict[str, str]:
+    headers = {}
+    for line in iter(f.readline, b""):
+        line = line.rstrip(b"\r\n")
+        if not line:
+            break
+
+        name, _, value = line.decode("utf-8", errors="replace").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def _http_body(block: bytes) -> Optional[Tuple[bytes, str]]:
+    """
+    Get the body and its content type of the captured http response, or None
+    if it is not '200 OK'.
+    """
+    f = io.BytesIO(block)
+    status = f.readline().split()
+    if len(status) < 2 or status[1] != b"200":
+        return None
+
+    headers = _read_headers(f)
+    body = f.read()
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        body = _dechunk(body)
+
+    encoding = headers.get("content-encoding", "").lower()
+    if encoding in ("gzip", "x-gzip"):
+        body = gzip.decompress(body)
+    elif encoding == "deflate":
+        body = zlib.decompress(body)
+
+    return body, headers.get("content-type", "")
+
+
+def _dechunk(body: bytes) -> bytes:
+    f = io.BytesIO(body)
+    chunks = []
+    while True:
+        size = int(f.readline().split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            break
+        chunks.append(f.read(size))
+        f.readline()
+    return b"".join(chunks)
+
+
+def _charset(content_type: str) -> str:
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset":
+            return value.strip().strip('"') or "utf-8"
+    return "utf-8"
+
+
+class PageArchiveWriter:
+    """
+    Writer of the pages to an archive, which is thread-safe.
+
+    The archive file must not exist, as the streamed archives can not be
+    appended to.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "xb")
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def put(
+        self,
+        item_id: str,
+        page_source: str,
+        *,
+        url: Optional[str] = None,
+        fetched_at: Optional[float] = None,
+    ):
+        """
+        Write the page of the item.
+
+        :param url: the url the page is fetched from
+        :param fetched_at: when the page is fetched, default to now
+        """
+        raise NotImplementedError
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class TarPageArchiveWriter(PageArchiveWriter):
+    """
+    Write each page as a member '<item_id>.html' of a tarball, gzipped if the
+    path ends with '.gz' or '.tgz'.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        gzipped = path.endswith((".gz", ".tgz"))
+        self.tar = tarfile.open(
+            fileobj=self.file, mode="w|gz" if gzipped else "w|"
+        )
+
+    def put(
+        self,
+        item_id: str,
+        page_source: str,
+        *,
+        url: Optional[str] = None,
+        fetched_at: Optional[float] = None,
+    ):
+        data = page_source.encode("utf-8")
+        info = tarfile.TarInfo("{}.html".format(item_id))
+        info.size = len(data)
+        info.mtime = int(fetched_at or time.time())
+
+        with self.lock:
+            self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        with self.lock:
+            self.tar.close()
+        super().close()
+
+
+class WarcPageArchiveWriter(PageArchiveWriter):
+    """
+    Write each page as a 'resource' record of a WARC, as the page source is
+    taken from the browser rather than captured from the http response. The
+    records are gzipped one by one if the path ends with '.gz'.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.gzipped = path.endswith(".gz")
+
+    def put(
+        self,
+        item_id: str,
+        page_source: str,
+        *,
+        url: Optional[str] = None,
+        fetched_at: Optional[float] = None,
+    ):
+        block = page_source.encode("utf-8")
+        headers = [
+            ("WARC-Type", "resource"),
+            ("WARC-Record-ID", "<urn:uuid:{}>".format(uuid.uuid4())),
+            (
+                "WARC-Date",
+                time.strftime(
+                    "%Y-%m-%dT%H:%M:%SZ", time.gmtime(fetched_at or time.time())
+                ),
+            ),
+            (
+                "WARC-Target-URI",
+                url or "https://item.taobao.com/item.htm?{}".format(item_id),
+            ),
+            ("Content-Type", "text/html; charset=utf-8"),
+            ("Content-Length", str(len(block))),
+        ]
+        record = (
+            b"WARC/1.1\r\n"
+            + "".join(
+                "{}: {}\r\n".format(name, value) for name, value in headers
+            ).encode("utf-8")
+            + b"\r\n"
+            + block
+            + b"\r\n\r\n"
+        )
+        if self.gzipped:
+            record = gzip.compress(record)
+
+        with self.lock:
+            self.file.write(record)
+
+
+def open_archive_writer(path: Optional[str]) -> Optional[PageArchiveWriter]:
+    """
+    Open the writer of the archive at the path, of the format told by its
+    extension, or None if the path is empty.
+    """
+    if not path:
+        return None
+    if path.endswith(WARC_EXTENSIONS):
+        return WarcPageArchiveWriter(path)
+    if path.endswith(TAR_EXTENSIONS):
+        return TarPageArchiveWriter(path)
+    raise ValueError("unsupported archive: {}".format(path))
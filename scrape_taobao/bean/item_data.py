@@ -1,5 +1,8 @@
 import dataclasses
-from typing import List, Tuple
+import sys
+from array import array
+from collections.abc import Sequence
+from typing import List, Tuple, Union
 
 
 @dataclasses.dataclass
@@ -36,3 +39,242 @@ class ItemData:
     total_stock: int
     # 月度总销量
     sales: int
+
+
+class CompactChoices(Sequence):
+    """
+    Read-only choices of an item, stored as parallel arrays instead of a list
+    of `ItemChoiceData`, which takes several times the memory for the items
+    with thousands of skus.
+
+    The `ItemChoiceData` are materialized on access only, and not kept.
+    """
+
+    __slots__ = ("tags", "names", "sku_ids", "prices", "stocks", "oversold")
+
+    def __init__(
+        self,
+        tags: Tuple[Tuple[str, ...], ...],
+        names: Tuple[str, ...],
+        sku_ids: Tuple[str, ...],
+        prices: array,
+        stocks: array,
+        oversold: array,
+    ):
+        self.tags = tags
+        self.names = names
+        self.sku_ids = sku_ids
+        # typed arrays of 'd', 'q' and 'b'
+        self.prices = prices
+        self.stocks = stocks
+        self.oversold = oversold
+
+    @classmethod
+    def from_dicts(cls, choices: List[dict]) -> "CompactChoices":
+        """
+        Build from the choices as dicts, with the strings interned, so that
+        the tags and the names repeated across the skus and the items are
+        stored once.
+
+        :raise KeyError: if any field is missing
+        :raise TypeError: if any field is of a wrong type
+        """
+        tags, names, sku_ids = [], [], []
+        for choice in choices:
+            tags.append(tuple(map(_intern, choice["tags"])))
+            names.append(_intern(choice["name"]))
+            sku_ids.append(_intern(choice["sku_id"]))
+
+        oversold = [choice["oversold"] for choice in choices]
+        if not all(isinstance(value, bool) for value in oversold):
+            raise TypeError("oversold should be bool")
+        stocks = [choice["stock"] for choice in choices]
+        if any(isinstance(value, bool) for value in stocks):
+            raise TypeError("stock should be int")
+
+        return cls(
+            tuple(tags),
+            tuple(names),
+            tuple(sku_ids),
+            array("d", [choice["price"] for choice in choices]),
+            array("q", stocks),
+            array("b", oversold),
+        )
+
+    def to_dicts(self) -> List[dict]:
+        return [
+            dict(
+                tags=list(tags),
+                name=name,
+                sku_id=sku_id,
+                price=price,
+                stock=stock,
+                oversold=bool(oversold),
+            )
+            for tags, name, sku_id, price, stock, oversold in zip(
+                self.tags,
+                self.names,
+                self.sku_ids,
+                self.prices,
+                self.stocks,
+                self.oversold,
+            )
+        ]
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        return ItemChoiceData(
+            tags=list(self.tags[index]),
+            name=self.names[index],
+            sku_id=self.sku_ids[index],
+            price=self.prices[index],
+            stock=self.stocks[index],
+            oversold=bool(self.oversold[index]),
+        )
+
+    def __repr__(self):
+        return "CompactChoices({} skus)".format(len(self))
+
+
+class CompactItemData:
+    """
+    Slotted counterpart of `ItemData` with the choices in `CompactChoices`,
+    for holding or scanning many items, e.g. when filtering a large catalog.
+
+    It converts from and to the item dicts losslessly, and has the same
+    attributes as `ItemData`, so that it can be used in place of it where the
+    choices are only read.
+    """
+
+    __slots__ = (
+        "platform",
+        "title",
+        "details",
+        "delivery_info",
+        "choices",
+        "price_range",
+        "total_stock",
+        "sales",
+    )
+
+    def __init__(
+        self,
+        platform: str,
+        title: str,
+        details: dict,
+        delivery_info: str,
+        choices: CompactChoices,
+        price_range: Tuple[float, float],
+        total_stock: int,
+        sales: int,
+    ):
+        self.platform = platform
+        self.title = title
+        self.details = details
+        self.delivery_info = delivery_info
+        self.choices = choices
+        self.price_range = price_range
+        self.total_stock = total_stock
+        self.sales = sales
+
+    @classmethod
+    def from_dict(cls, item: dict) -> "CompactItemData":
+        """
+        Build from the item dict, checking the fields as `dacite.from_dict`
+        does, without building a dataclass for each choice. Unlike dacite,
+        a bool is not taken for an int.
+
+        :raise KeyError: if any field is missing
+        :raise TypeError: if any field is of a wrong type
+        """
+        for field, types in _FIELD_TYPES:
+            # a bool is an int to isinstance, but never a count
+            if not isinstance(item[field], types) or (
+                isinstance(item[field], bool) and types is not bool
+            ):
+                raise TypeError(
+                    'wrong value type for field "{}": {}'.format(
+                        field, type(item[field]).__name__
+                    )
+                )
+
+        return cls(
+            platform=_intern(item["platform"]),
+            title=item["title"],
+            details=item["details"],
+            delivery_info=item["delivery_info"],
+            choices=CompactChoices.from_dicts(item["choices"]),
+            price_range=item["price_range"],
+            total_stock=item["total_stock"],
+            sales=item["sales"],
+        )
+
+    @classmethod
+    def from_item(cls, item: ItemData) -> "CompactItemData":
+        return cls.from_dict(item_to_dict(item))
+
+    def to_dict(self) -> dict:
+        return dict(
+            platform=self.platform,
+            title=self.title,
+            details=self.details,
+            delivery_info=self.delivery_info,
+            choices=self.choices.to_dicts(),
+            price_range=self.price_range,
+            total_stock=self.total_stock,
+            sales=self.sales,
+        )
+
+    def to_item(self) -> ItemData:
+        return ItemData(
+            platform=self.platform,
+            title=self.title,
+            details=self.details,
+            delivery_info=self.delivery_info,
+            choices=list(self.choices),
+            price_range=self.price_range,
+            total_stock=self.total_stock,
+            sales=self.sales,
+        )
+
+    def __repr__(self):
+        return "CompactItemData(platform={!r}, title={!r}, {!r})".format(
+            self.platform, self.title, self.choices
+        )
+
+
+# the types of the fields checked when building `CompactItemData`
+_FIELD_TYPES = (
+    ("platform", str),
+    ("title", str),
+    ("details", dict),
+    ("delivery_info", str),
+    ("choices", list),
+    ("price_range", tuple),
+    ("total_stock", int),
+    ("sales", int),
+)
+
+
+def _intern(value: str) -> str:
+    if not isinstance(value, str):
+        raise TypeError("expected str, got {}".format(type(value).__name__))
+    return sys.intern(value)
+
+
+def item_to_dict(item: Union[ItemData, CompactItemData]) -> dict:
+    """
+    Convert the item data to a dict, which equals to `dataclasses.asdict` but
+    shares the values instead of deep copying them.
+    """
+    if isinstance(item, CompactItemData):
+        return item.to_dict()
+
+    item_dict = dict(vars(item))
+    item_dict["choices"] = [dict(vars(choice)) for choice in item.choices]
+    return item_dict
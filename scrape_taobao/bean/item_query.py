@@ -0,0 +1,97 @@
+import dataclasses
+from typing import Callable, Optional, Union
+
+from scrape_taobao.bean.item_data import CompactItemData, ItemData
+
+# sort keys of items, mapped to the sorted fields
+SORT_KEYS = {
+    "price": "min_price",
+    "min_price": "min_price",
+    "max_price": "max_price",
+    "total_stock": "total_stock",
+    "sales": "sales",
+}
+PRICE_KEYS = ("min_price", "max_price")
+
+
+@dataclasses.dataclass
+class ItemQuery:
+    """
+    Filter rules of items, a rule is disabled if it is None or 0.
+    """
+
+    # 目标平台，如 'taobao' 或 'tmall'，支持逗号分隔的多个平台
+    platform: Optional[str] = None
+    # 最低价格，价格未知（即为 0）的商品不受限制
+    min_price: Optional[float] = None
+    # 最高价格
+    max_price: Optional[float] = None
+    # 最低总库存
+    min_total_stock: Optional[int] = None
+    # 最高总库存
+    max_total_stock: Optional[int] = None
+    # 最低销量
+    min_sales: Optional[int] = None
+    # 最高销量
+    max_sales: Optional[int] = None
+
+    def match(self, item_data: Union[ItemData, CompactItemData]) -> bool:
+        if (
+            self.min_price
+            and item_data.price_range[0] != 0.0
+            and item_data.price_range[0] < self.min_price
+        ):
+            return False
+
+        if self.max_price and item_data.price_range[1] > self.max_price:
+            return False
+
+        if (
+            self.min_total_stock
+            and item_data.total_stock < self.min_total_stock
+        ):
+            return False
+
+        if (
+            self.max_total_stock
+            and item_data.total_stock > self.max_total_stock
+        ):
+            return False
+
+        if self.min_sales and item_data.sales < self.min_sales:
+            return False
+
+        if self.max_sales and item_data.sales > self.max_sales:
+            return False
+
+        if self.platform and item_data.platform not in self.platform:
+            return False
+
+        return True
+
+
+def item_sort_key(sort: str) -> Callable[[dict], tuple]:
+    """
+    Get the key function to sort the item dicts by `sort`.
+
+    :param sort: one of `SORT_KEYS`, prefix with '-' to sort in the descending
+      order. Items with unknown prices, i.e. 0, are always put at the end when
+      sorting by prices.
+    """
+    descending = sort.startswith("-")
+    name = sort.lstrip("-")
+    if name not in SORT_KEYS:
+        raise ValueError("unsupported sort key: {}".format(name))
+
+    field = SORT_KEYS[name]
+
+    def key(item: dict):
+        if field in PRICE_KEYS:
+            value = item["price_range"][PRICE_KEYS.index(field)]
+            if value == 0.0:
+                return 1, 0.0
+        else:
+            value = item[field]
+        return 0, -value if descending else value
+
+    return key
@@ -8,3 +8,15 @@ PAGES_DIR = os.path.abspath(
 ITEMS_DIR = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "../../cache/items")
 )
+SESSION_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../../cache/session.json")
+)
+JOURNAL_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../../cache/journal.sqlite")
+)
+METRICS_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../../cache/metrics.json")
+)
+HISTORY_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../../cache/history.sqlite")
+)
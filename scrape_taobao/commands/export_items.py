@@ -0,0 +1,34 @@
+import os
+
+import rich.progress
+
+from scrape_taobao.commands import ITEMS_DIR, logger
+from scrape_taobao.store import FileItemStore, open_item_store
+
+
+def export_items(
+    items_dir: str = ITEMS_DIR, *, fmt: str = "yaml", store: str = "sqlite"
+):
+    """
+    将其他存储中的商品信息导出为按文件存储的商品信息。
+
+    :param items_dir: 商品信息文件输出目录，默认为 '<project-root>/cache/items'
+    :param fmt: 商品信息文件格式，支持 'json' 和 'yaml'
+    :param store: 导出的源存储，支持 'sqlite'（即 '<items_dir>/items.sqlite'）、
+      'sqlite:<path>'、'jsonl'（即 '<items_dir>/items.jsonl'）和 'jsonl:<path>'
+    """
+    os.makedirs(items_dir, exist_ok=True)
+
+    src_store = open_item_store(store, items_dir, fmt=fmt)
+    dst_store = FileItemStore(items_dir, fmt=fmt)
+
+    with src_store, rich.progress.Progress(transient=True) as progress:
+        task_id = progress.add_task("exporting", total=None)
+
+        for item_id, item in src_store.items():
+            dst_store.put(item_id, item)
+            progress.update(task_id, advance=1)
+
+        logger.info(
+            "exported {} items".format(progress.tasks[task_id].completed)
+        )
@@ -1,11 +1,14 @@
-import glob
+import heapq
+import itertools
 import os
+import re
+import sys
+from typing import Sequence, Union
 
-import dacite
-
-from scrape_taobao.bean.item_data import ItemData
+from scrape_taobao.bean.item_query import ItemQuery, item_sort_key
 from scrape_taobao.commands import ITEMS_DIR, logger
-from scrape_taobao.io import dump, load
+from scrape_taobao.io import ItemWriter, dump
+from scrape_taobao.store import open_item_store
 
 
 def filtor(
@@ -19,6 +22,12 @@ def filtor(
     max_total_stock: int = None,
     min_sales: int = None,
     max_sales: int = None,
+    store: str = "file",
+    sort: str = None,
+    limit: int = None,
+    snapshot: bool = False,
+    output: str = None,
+    fields: Union[str, Sequence[str]] = None,
 ):
     """
     过滤商品信息。
@@ -34,48 +43,87 @@ def filtor(
     :param max_total_stock: 最高总库存
     :param min_sales: 最低销量
     :param max_sales: 最高销量
+    :param store: 商品信息存储方式，支持 'file'（每个商品一个文件）、'sqlite'（即
+      '<out_dir>/items.sqlite'）、'sqlite:<path>'、'jsonl'（即
+      '<out_dir>/items.jsonl'）和 'jsonl:<path>'
+    :param sort: 排序字段，支持 'price'、'max_price'、'total_stock' 和 'sales'，
+      加前缀 '-' 表示降序；按价格排序时，价格未知的商品总是排在最后
+    :param limit: 最多输出的商品数量
+    :param snapshot: 是否基于列式快照 '<out_dir>/.snapshot-<store>' 过滤，快照过期
+      时自动重建；快照过滤只需加载符合条件的商品，适用于商品数量较多的情况
+    :param output: 流式输出格式，支持 'jsonl'（每行一个 json 对象）、'csv' 和
+      'ids'（每行一个商品 ID），便于其他工具处理；默认按 `fmt` 逐个输出商品信息
+    :param fields: 流式输出的字段，以逗号分隔，支持 'item_id'、商品信息的各字段，以
+      及 'min_price' 和 'max_price'；默认 'jsonl' 输出所有字段，'csv' 输出主要字段
     """
 
-    def filter_item(item_data: ItemData):
-        if (
-            min_price
-            and item_data.price_range[0] != 0.0
-            and item_data.price_range[0] < min_price
-        ):
-            return False
-
-        if max_price and item_data.price_range[1] > max_price:
-            return False
-
-        if min_total_stock and item_data.total_stock < min_total_stock:
-            return False
-
-        if max_total_stock and item_data.total_stock > max_total_stock:
-            return False
-
-        if min_sales and item_data.sales < min_sales:
-            return False
-
-        if max_sales and item_data.sales > max_sales:
-            return False
-
-        if platform and item_data.platform not in platform:
-            return False
-
-        return True
-
-    glob_pat = os.path.join(out_dir, "*.{}".format(fmt))
-
-    for item_filepath in glob.glob(glob_pat):
-        try:
-            item_dict = load(item_filepath, fmt=fmt)
-            item = dacite.from_dict(ItemData, item_dict)
-        except Exception as e:
-            logger.error(
-                'failed to load item "{}": {}'.format(item_filepath, e)
+    def on_error(item_filepath, e):
+        logger.error('failed to load item "{}": {}'.format(item_filepath, e))
+
+    query = ItemQuery(
+        platform=platform,
+        min_price=min_price,
+        max_price=max_price,
+        min_total_stock=min_total_stock,
+        max_total_stock=max_total_stock,
+        min_sales=min_sales,
+        max_sales=max_sales,
+    )
+
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+    writer = ItemWriter(sys.stdout, output, fields=fields) if output else None
+
+    item_store = open_item_store(store, out_dir, fmt=fmt, on_error=on_error)
+    with item_store:
+        if snapshot:
+            # imported here as numpy is only needed by the snapshot
+            from scrape_taobao.snapshot import load_or_build_snapshot
+
+            snapshot_dir = os.path.join(
+                out_dir, ".snapshot-{}".format(re.sub(r"\W", "_", store))
+            )
+            item_ids = load_or_build_snapshot(item_store, snapshot_dir).select(
+                query, sort=sort, limit=limit
             )
-            continue
+            if output == "ids":
+                # no need to load the items
+                items = ((item_id, None) for item_id in item_ids)
+            else:
+                items = (
+                    (item_id, item_store.get(item_id)) for item_id in item_ids
+                )
+
+        else:
+            # stream the items, which stops early once the limit is reached
+            items = item_store.query(query)
+            if sort:
+                key = item_sort_key(sort)
+                if limit is not None:
+                    items = heapq.nsmallest(
+                        limit, items, key=lambda pair: key(pair[1])
+                    )
+                else:
+                    items = sorted(items, key=lambda pair: key(pair[1]))
+            elif limit is not None:
+                items = itertools.islice(items, limit)
 
-        if filter_item(item):
-            # print the item data the console
-            dump(item_dict, out_path=None, fmt=fmt)
+        try:
+            for item_id, item_dict in items:
+                if item_dict is None and output != "ids":
+                    # removed since the snapshot is built
+                    continue
+
+                if writer is not None:
+                    writer.write_item(item_id, item_dict)
+                else:
+                    # print the item data the console
+                    dump(item_dict, out_path=None, fmt=fmt)
+
+            if writer is not None:
+                writer.flush()
+
+        except BrokenPipeError:
+            # the downstream has stopped reading, e.g. `| head`
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
@@ -0,0 +1,110 @@
+import datetime
+
+from scrape_taobao import io
+from scrape_taobao.commands import HISTORY_PATH, logger
+from scrape_taobao.history import ItemHistory
+from scrape_taobao.item_list import canonical_item_id
+from scrape_taobao.utils import to_seconds, to_timestamp
+
+
+def show_history(
+    item: str,
+    *,
+    history: str = HISTORY_PATH,
+    since: str = None,
+    until: str = None,
+    skus: bool = False,
+    fmt: str = "yaml",
+):
+    """
+    输出商品的价格、库存和销量历史。
+
+    :param item: 商品链接或商品 ID
+    :param history: 商品历史数据库，默认为 '<project-root>/cache/history.sqlite'
+    :param since: 起始时间，可以是 ISO 格式的时间，如 '2023-05-01'，或当前时间
+      之前的时长，如 '7d' 或 '12h'，默认为最早的记录
+    :param until: 截止时间，格式同 `since`，默认为最新的记录
+    :param skus: 是否输出各 sku 的价格和库存
+    :param fmt: 输出格式，支持 'json' 和 'yaml'
+    """
+    item_id = canonical_item_id(str(item))
+    if item_id is None:
+        raise ValueError("no item id in {}".format(item))
+
+    with ItemHistory(history) as item_history:
+        snapshots = item_history.history(
+            item_id, to_timestamp(since), to_timestamp(until), skus=skus
+        )
+
+    for snapshot in snapshots:
+        snapshot["scraped_at"] = _format_time(snapshot["scraped_at"])
+    io.dump(snapshots, None, fmt)
+
+
+def growth(
+    field: str = "sales",
+    *,
+    history: str = HISTORY_PATH,
+    since: str = "7d",
+    until: str = None,
+    min_growth: float = 0.1,
+    limit: int = None,
+):
+    """
+    查找指定时间段内增长的商品，如销量增长最快的商品。
+
+    :param field: 比较的字段，支持 'min_price'、'max_price'、'total_stock' 和 'sales'
+    :param history: 商品历史数据库，默认为 '<project-root>/cache/history.sqlite'
+    :param since: 起始时间，可以是 ISO 格式的时间，如 '2023-05-01'，或当前时间
+      之前的时长，如 '7d' 或 '12h'，默认为 7 天前
+    :param until: 截止时间，格式同 `since`，默认为当前时间
+    :param min_growth: 最小增长比例，如 0.5 表示增长 50%，可以为负数以查找下降的商品
+    :param limit: 最多输出的商品数量，默认输出全部
+    """
+    with ItemHistory(history) as item_history:
+        results = item_history.growth(
+            field, to_timestamp(since), to_timestamp(until), min_growth
+        )
+        for i, (item_id, start, end, ratio) in enumerate(results):
+            if limit is not None and i >= limit:
+                break
+            print("{}\t{}\t{}\t{:+.1%}".format(item_id, start, end, ratio))
+
+
+def compact_history(
+    history: str = HISTORY_PATH,
+    *,
+    before: str = None,
+    resolution: str = None,
+    vacuum: bool = True,
+):
+    """
+    压缩商品历史数据库。
+
+    删除没有任何变化的快照，并可以将较早的快照按时间段合并，如只保留 30 天前的
+    快照中每个商品每天的最后一个状态。
+
+    :param history: 商品历史数据库，默认为 '<project-root>/cache/history.sqlite'
+    :param before: 只压缩该时间之前的快照，可以是 ISO 格式的时间，如
+      '2023-05-01'，或当前时间之前的时长，如 '30d'，默认为所有快照
+    :param resolution: 合并快照的时间段长度，如 '1d' 或 '12h'，默认不合并
+    :param vacuum: 是否在压缩后整理数据库文件，以释放磁盘空间
+    """
+    resolution = to_seconds(resolution) if resolution else 0
+
+    with ItemHistory(history) as item_history:
+        count_before, count_after = item_history.compact(
+            to_timestamp(before), resolution
+        )
+        if vacuum:
+            item_history.vacuum()
+
+    logger.info(
+        "compacted {} snapshots into {}".format(count_before, count_after)
+    )
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(
+        timespec="seconds"
+    )
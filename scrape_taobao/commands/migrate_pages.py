@@ -0,0 +1,68 @@
+import os
+import time
+
+from scrape_taobao.commands import PAGES_DIR, logger
+from scrape_taobao.metrics import make_progress
+from scrape_taobao.page_cache import DirPageCache, PackPageCache, copy_pages
+
+
+def migrate_pages(
+    pages_dir: str = PAGES_DIR, *, codec: str = "zdict", remove: bool = False
+):
+    """
+    将按文件缓存的页面源码迁移到压缩打包存储中。
+
+    迁移后的页面保存在 '<pages_dir>/pack-*.pack' 中，索引为
+    '<pages_dir>/index.sqlite'，之后的 `scrape` 和 `parse` 等命令需要指定
+    `--page-cache=pack` 来使用。迁移完成后会输出压缩率和读取吞吐量。
+
+    :param pages_dir: 页面源码目录，默认为 '<project-root>/cache/pages'
+    :param codec: 压缩方式，支持 'zlib'、'lzma' 和 'zdict'（带共享字典的 zlib，
+      适用于大量结构相似的页面）
+    :param remove: 是否在迁移完成后删除原页面文件
+    """
+    src_pages = DirPageCache(pages_dir)
+    item_ids = list(src_pages.ids())
+
+    with PackPageCache(
+        pages_dir, codec=codec, commit_every=500
+    ) as dst_pages, make_progress("pages") as progress:
+        task_id = progress.add_task("migrating", total=len(item_ids))
+        copy_pages(
+            src_pages,
+            dst_pages,
+            item_ids,
+            on_copied=lambda _: progress.update(task_id, advance=1),
+        )
+        dst_pages.commit()
+
+        stats = dst_pages.stats()
+        logger.info(
+            "migrated {} pages, {} in total: {:.1f}MB -> {:.1f}MB, "
+            "ratio {:.2f}".format(
+                len(item_ids),
+                stats["pages"],
+                stats["raw_size"] / 1e6,
+                stats["size"] / 1e6,
+                stats["raw_size"] / max(stats["size"], 1),
+            )
+        )
+
+        # measure the throughput of reading back all the pages
+        start = time.perf_counter()
+        for item_id in dst_pages.ids():
+            dst_pages.get(item_id)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        logger.info(
+            "read {} pages in {:.2f}s: {:.0f} pages/s, {:.1f}MB/s".format(
+                stats["pages"],
+                elapsed,
+                stats["pages"] / elapsed,
+                stats["raw_size"] / 1e6 / elapsed,
+            )
+        )
+
+    if remove:
+        for item_id in item_ids:
+            os.remove(src_pages.path_of(item_id))
+        logger.info("removed {} page files".format(len(item_ids)))
@@ -1,14 +1,45 @@
-import glob
+import collections
 import os
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
+from typing import List, Optional, Tuple, Union
 
 import rich.progress
 
-from scrape_taobao.commands import ITEMS_DIR, PAGES_DIR
-from scrape_taobao.commands.parse_one import parse_one_impl
+from scrape_taobao.archive import is_archive, iter_archive
+from scrape_taobao.commands import ITEMS_DIR, METRICS_PATH, PAGES_DIR, logger
+from scrape_taobao.commands.parse_one import parse_page_impl
+from scrape_taobao.manifest import ParseManifest, hash_page, open_manifest
+from scrape_taobao.metrics import Metrics, exporting_metrics, make_progress
+from scrape_taobao.page_cache import PageCache, open_page_cache
+from scrape_taobao.store import ItemStore, open_item_store
+from scrape_taobao.utils import to_timestamp
+
+# the reason to parse a page whose stamp has changed, which is then checked by
+# its hash once read, as it may be rewritten unchanged
+PAGE_RESTAMPED = "page restamped"
 
 
 def parse(
-    pages_dir: str = PAGES_DIR, out_dir: str = ITEMS_DIR, fmt: str = "yaml"
+    pages_dir: str = PAGES_DIR,
+    out_dir: str = ITEMS_DIR,
+    fmt: str = "yaml",
+    *,
+    workers: int = 1,
+    chunk_size: int = 64,
+    fast: bool = False,
+    store: str = "file",
+    page_cache: str = "dir",
+    force: bool = False,
+    since: Union[str, float] = None,
+    dry_run: bool = False,
+    metrics: str = METRICS_PATH,
+    prometheus: Optional[str] = None,
+    prometheus_interval: float = 15.0,
 ):
     """
     解析商品页面。
@@ -16,29 +47,647 @@ def parse(
     该命令会解析 '<pages_dir>/*.html' 中的页面源码，抽取其中的商品信息，并将商品信息
     保存到 '<out_dir>/*.json' 或 '<out_dir>/*.yaml' 中。
 
+    解析记录保存在 '<out_dir>/.manifest' 中，默认只解析新增或变化的页面、解析器已更新
+    的页面，以及商品信息缺失的页面。
+
+    也可以直接解析页面归档文件（tar 包或 WARC），此时按顺序流式读取归档中的页面，
+    而无需先解压。
+
     如果想要下载源页面并解析，可以使用 `scrape` 命令。
 
-    :param pages_dir: 页面源码目录，默认为 '<project-root>/cache/pages'
+    :param pages_dir: 页面源码目录，默认为 '<project-root>/cache/pages'；也可以是
+      页面归档文件，支持 '.tar'、'.tar.gz'、'.tgz'（其中的页面文件名同页面源码
+      目录，如 'id=123.html'）、'.warc' 和 '.warc.gz'（商品 ID 取自记录的
+      'WARC-Target-URI'），此时忽略 `page_cache`
     :param out_dir: 商品信息输出目录，默认为 '<project-root>/cache/items'
     :param fmt: 商品信息文件格式，支持 'json' 和 'yaml'
+    :param workers: 并行解析的进程数，默认为 1，即在当前进程中逐个解析
+    :param chunk_size: 并行解析时，每个进程每次领取的页面数量
+    :param fast: 是否优先直接从页面源码中抽取商品信息，而不构建完整的页面树
+    :param store: 商品信息存储方式，支持 'file'（每个商品一个文件）、'sqlite'（即
+      '<out_dir>/items.sqlite'）、'sqlite:<path>'、'jsonl'（即
+      '<out_dir>/items.jsonl'）和 'jsonl:<path>'
+    :param page_cache: 页面源码缓存方式，支持 'dir'（每个页面一个文件）、'pack'
+      （压缩打包存储）和 'pack:<codec>'，详见 `migrate-pages` 命令
+    :param force: 是否重新解析所有页面
+    :param since: 重新解析在该时间之前解析的页面，支持时间戳、ISO 格式的时间（如
+      '2023-05-01' 或 '2023-05-01T12:00:00'）和距今的时长（如 '7d' 或 '12h'）
+    :param dry_run: 只输出需要解析的页面及原因，而不实际解析
+    :param metrics: 解析指标文件，默认为 '<project-root>/cache/metrics.json'，解析
+      结束时写入各阶段（读取缓存、解析和保存）的耗时分布、缓存命中次数和失败原因；
+      设为空字符串则不写入
+    :param prometheus: Prometheus textfile 路径，若指定则在解析过程中定期重写，
+      以便 node exporter 采集
+    :param prometheus_interval: 重写 Prometheus textfile 的间隔秒数
     """
+    if is_archive(pages_dir):
+        _parse_archive(
+            pages_dir,
+            out_dir=out_dir,
+            fmt=fmt,
+            workers=workers,
+            chunk_size=chunk_size,
+            fast=fast,
+            store=store,
+            force=force,
+            since=to_timestamp(since),
+            dry_run=dry_run,
+            metrics=metrics,
+            prometheus=prometheus,
+            prometheus_interval=prometheus_interval,
+        )
+        return
+
     os.makedirs(pages_dir, exist_ok=True)
     os.makedirs(out_dir, exist_ok=True)
+    run_metrics = Metrics()
+
+    with open_page_cache(page_cache, pages_dir) as pages, open_manifest(
+        out_dir
+    ) as manifest:
+        since = to_timestamp(since)
+        with open_item_store(store, out_dir, fmt=fmt) as item_store:
+            item_ids = list(pages.ids())
+            if not force:
+                selected = _plan_parse(
+                    item_ids,
+                    pages,
+                    item_store,
+                    manifest,
+                    since=since,
+                    dry_run=dry_run,
+                )
+                # the pages to check are counted once read
+                run_metrics.inc(
+                    "cache_total",
+                    len(item_ids) - len(selected),
+                    cache="manifest",
+                    result="hit",
+                )
+                run_metrics.inc(
+                    "cache_total",
+                    sum(1 for _, check in selected if not check),
+                    cache="manifest",
+                    result="miss",
+                )
+            else:
+                selected = [(item_id, False) for item_id in item_ids]
+                if dry_run:
+                    for item_id in item_ids:
+                        logger.info('to parse "{}": forced'.format(item_id))
+                    logger.info("to parse {} pages".format(len(item_ids)))
+
+        if dry_run:
+            return
+
+        with exporting_metrics(
+            run_metrics, metrics or None, prometheus, prometheus_interval
+        ), make_progress("pages") as progress:
+            task_id = progress.add_task("parsing", total=len(selected))
+
+            if workers > 1:
+                _parse_in_pool(
+                    selected,
+                    since=since,
+                    pages_dir=pages_dir,
+                    out_dir=out_dir,
+                    fmt=fmt,
+                    workers=workers,
+                    chunk_size=chunk_size,
+                    fast=fast,
+                    store=store,
+                    page_cache=page_cache,
+                    progress=progress,
+                    task_id=task_id,
+                    metrics=run_metrics,
+                )
+
+            else:
+                with open_item_store(store, out_dir, fmt=fmt) as item_store:
+                    for item_id, check in selected:
+                        try:
+                            _parse_cached_page(
+                                item_id,
+                                pages,
+                                item_store,
+                                log=progress.log,
+                                fast=fast,
+                                manifest=manifest,
+                                metrics=run_metrics,
+                                check=check,
+                                since=since,
+                            )
+
+                        except Exception as e:
+                            progress.log(
+                                'failed to parse "{}": {}'.format(item_id, e)
+                            )
+                            continue
+
+                        finally:
+                            progress.update(task_id, advance=1)
+
+    logger.info("stages: {}".format(run_metrics.format_stages()))
+
+
+def _plan_parse(
+    item_ids: List[str],
+    pages: PageCache,
+    item_store: ItemStore,
+    manifest: ParseManifest,
+    *,
+    since: Optional[float],
+    dry_run: bool,
+) -> List[Tuple[str, bool]]:
+    """
+    Select the pages to parse according to the manifest.
+
+    The pages are told unchanged by their stamps, without being read. The
+    pages whose stamps have changed are selected to be checked by their
+    hashes once read for parsing, so that each page is read at most once;
+    they are read and checked here only if dry running.
+
+    :return: (item id, whether to check the page by its hash before parsing)
+      of the pages to parse
+    """
+    selected = []
+    reasons = collections.Counter()
+
+    with make_progress("pages") as progress:
+        task_id = progress.add_task("checking", total=len(item_ids))
 
-    page_paths = glob.glob(os.path.join(pages_dir, "id=*.html"))
+        for item_id in item_ids:
+            reason = _check_page(
+                item_id, pages, manifest, since=since, read=dry_run
+            )
+            if reason is None and not item_store.exists(item_id):
+                reason = "item missing"
 
-    with rich.progress.Progress(transient=True) as progress:
-        task_id = progress.add_task("parsing", total=len(page_paths))
+            if reason is not None:
+                selected.append((item_id, reason == PAGE_RESTAMPED))
+                reasons[reason] += 1
+                if dry_run:
+                    logger.info('to parse "{}": {}'.format(item_id, reason))
 
-        for page_path in page_paths:
+            progress.update(task_id, advance=1)
+
+    logger.info(
+        "to parse {} of {} pages{}".format(
+            len(selected),
+            len(item_ids),
+            "".join(
+                ", {} {}".format(count, reason)
+                for reason, count in reasons.most_common()
+            ),
+        )
+    )
+    return selected
+
+
+def _check_page(
+    item_id: str,
+    pages: PageCache,
+    manifest: ParseManifest,
+    *,
+    since: Optional[float],
+    read: bool,
+) -> Optional[str]:
+    """
+    Check the cached page against the manifest by its stamp, or by its hash
+    if its stamp has changed and it is to read.
+
+    :return: the reason to parse the page, `PAGE_RESTAMPED` if it is to be
+      checked by its hash, or None if it is up to date
+    """
+    page_stamp = pages.stamp(item_id)
+    if page_stamp is None:
+        return "page missing"
+
+    entry = manifest.get(item_id)
+    if entry is None or entry.page_stamp == page_stamp:
+        return manifest.check(item_id, since=since)
+    if not read:
+        return PAGE_RESTAMPED
+
+    page_source = pages.get(item_id)
+    if page_source is None:
+        return "page missing"
+    return manifest.check(item_id, hash_page(page_source), since=since)
+
+
+def _parse_in_pool(
+    selected: List[Tuple[str, bool]],
+    *,
+    since: Optional[float],
+    pages_dir: str,
+    out_dir: str,
+    fmt: str,
+    workers: int,
+    chunk_size: int,
+    fast: bool,
+    store: str,
+    page_cache: str,
+    progress: rich.progress.Progress,
+    task_id: rich.progress.TaskID,
+    metrics: Metrics,
+):
+    """
+    Parse pages chunk by chunk in a process pool.
+
+    Each chunk reports back the outcome of every page in it, so that the
+    progress bar and the per-page failure logs stay the same as the
+    sequential mode, and its metrics, which are merged into `metrics`.
+
+    :param selected: (item id, whether to check the page by its hash before
+      parsing) of the pages to parse, see `_plan_parse`
+    """
+    chunk_size = max(1, chunk_size)
+    chunks = [
+        selected[i : i + chunk_size]
+        for i in range(0, len(selected), chunk_size)
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                _parse_chunk,
+                chunk,
+                since,
+                pages_dir,
+                out_dir,
+                fmt,
+                fast,
+                store,
+                page_cache,
+            ): chunk
+            for chunk in chunks
+        }
+
+        for future in as_completed(futures):
             try:
-                parse_one_impl(
-                    page_path, out_dir=out_dir, fmt=fmt, log=progress.log
+                results, metrics_state = future.result()
+                metrics.merge(metrics_state)
+            except Exception as e:
+                # the worker died as a whole, e.g. killed by the os
+                chunk = futures[future]
+                results = [(item_id, True, str(e)) for item_id, _ in chunk]
+                metrics.inc("items_total", len(chunk), outcome="failed")
+                metrics.inc(
+                    "failures_total",
+                    len(chunk),
+                    stage="worker",
+                    reason=type(e).__name__,
                 )
 
+            for item_id, parsed, error in results:
+                if error is None and not parsed:
+                    progress.log('skip "{}" as unchanged'.format(item_id))
+                elif error is None:
+                    progress.log('parsed "{}"'.format(item_id))
+                else:
+                    progress.log(
+                        'failed to parse "{}": {}'.format(item_id, error)
+                    )
+
+            progress.update(task_id, advance=len(results))
+
+
+def _parse_chunk(
+    chunk: List[Tuple[str, bool]],
+    since: Optional[float],
+    pages_dir: str,
+    out_dir: str,
+    fmt: str,
+    fast: bool,
+    store: str,
+    page_cache: str,
+) -> Tuple[List[Tuple[str, bool, Optional[str]]], dict]:
+    """
+    Parse a chunk of pages in a worker process.
+
+    :return: a list of (item id, whether it is parsed rather than skipped as
+      unchanged, error message or None), and the state of the metrics of the
+      chunk
+    """
+    results = []
+    metrics = Metrics()
+    # committed at once, so that the workers never wait for the write lock
+    # held by each other
+    with open_page_cache(page_cache, pages_dir) as pages, open_item_store(
+        store, out_dir, fmt=fmt, commit_every=1
+    ) as item_store, open_manifest(out_dir, commit_every=1) as manifest:
+        for item_id, check in chunk:
+            try:
+                parsed = _parse_cached_page(
+                    item_id,
+                    pages,
+                    item_store,
+                    log=_no_log,
+                    fast=fast,
+                    manifest=manifest,
+                    metrics=metrics,
+                    check=check,
+                    since=since,
+                )
             except Exception as e:
-                progress.log('failed to parse "{}": {}'.format(page_path, e))
-                continue
+                results.append((item_id, True, str(e)))
+            else:
+                results.append((item_id, parsed, None))
+    return results, metrics.state()
+
+
+def _parse_cached_page(
+    item_id: str,
+    pages: PageCache,
+    item_store: ItemStore,
+    *,
+    log,
+    fast: bool,
+    manifest: ParseManifest,
+    metrics: Metrics,
+    check: bool = False,
+    since: Optional[float] = None,
+) -> bool:
+    """
+    Parse the cached page, whose stamp and hash are recorded to the manifest.
+
+    :param check: whether to check the page by its hash first, whose stamp
+      has changed, and only record its new stamp if it is up to date
+    :param since: see `ParseManifest.check`
+    :return: whether the page is parsed, rather than skipped as up to date
+    """
+    with metrics.timer("cache_read"):
+        # stamped before read, so that a page put meanwhile is checked again
+        page_stamp = pages.stamp(item_id)
+        page_source = pages.get(item_id)
+    if page_source is None:
+        metrics.inc("items_total", outcome="failed")
+        metrics.inc("failures_total", stage="cache_read", reason="page missing")
+        raise LookupError("page not cached")
+
+    page_hash = hash_page(page_source)
+    if check:
+        reason = manifest.check(item_id, page_hash, since=since)
+        up_to_date = reason is None and item_store.exists(item_id)
+        metrics.inc(
+            "cache_total",
+            cache="manifest",
+            result="hit" if up_to_date else "miss",
+        )
+        if up_to_date:
+            manifest.restamp(item_id, page_stamp)
+            metrics.inc("items_total", outcome="skipped")
+            log('skip "{}" as unchanged'.format(item_id))
+            return False
+
+    try:
+        parse_page_impl(
+            item_id,
+            page_source,
+            item_store,
+            log=log,
+            fast=fast,
+            manifest=manifest,
+            metrics=metrics,
+            page_hash=page_hash,
+            page_stamp=page_stamp,
+        )
+    except Exception:
+        metrics.inc("items_total", outcome="failed")
+        raise
+
+    metrics.inc("items_total", outcome="parsed")
+    return True
+
+
+def _no_log(_: str):
+    pass
+
+
+def _parse_archive(
+    archive: str,
+    *,
+    out_dir: str,
+    fmt: str,
+    workers: int,
+    chunk_size: int,
+    fast: bool,
+    store: str,
+    force: bool,
+    since: Optional[float],
+    dry_run: bool,
+    metrics: str,
+    prometheus: Optional[str],
+    prometheus_interval: float,
+):
+    """
+    Parse the pages streamed from an archive.
+
+    As the archive is read only once, the pages are checked against the
+    manifest while parsing rather than planned ahead. In the pool, at most
+    twice the number of the workers of chunks are pending, so that the pages
+    read ahead never pile up.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    run_metrics = Metrics()
+    reasons = collections.Counter()
+    options = dict(force=force, since=since, dry_run=dry_run, fast=fast)
+
+    with exporting_metrics(
+        run_metrics,
+        None if dry_run else metrics or None,
+        None if dry_run else prometheus,
+        prometheus_interval,
+    ), make_progress("pages") as progress:
+        task_id = progress.add_task("parsing", total=None)
+
+        def report(results):
+            for item_id, reason, error in results:
+                if error is not None:
+                    progress.log(
+                        'failed to parse "{}": {}'.format(item_id, error)
+                    )
+                    reasons["failed"] += 1
+                    continue
+
+                if reason is not None and workers > 1:
+                    progress.log('parsed "{}"'.format(item_id))
+                reasons[reason or "up to date"] += 1
+            progress.update(task_id, advance=len(results))
+
+        pages = iter_archive(archive)
+        if workers <= 1 or dry_run:
+            with open_item_store(
+                store, out_dir, fmt=fmt
+            ) as item_store, open_manifest(out_dir) as manifest:
+                for item_id, page_source in pages:
+                    report(
+                        [
+                            _parse_archived_page(
+                                item_id,
+                                page_source,
+                                item_store,
+                                log=progress.log,
+                                manifest=manifest,
+                                metrics=run_metrics,
+                                **options,
+                            )
+                        ]
+                    )
+
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # the ids of the items of the pending chunks
+                pending = {}
+                for chunk in _chunked(pages, max(1, chunk_size)):
+                    if len(pending) >= 2 * workers:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            report(
+                                _chunk_results(
+                                    future, pending.pop(future), run_metrics
+                                )
+                            )
+
+                    future = executor.submit(
+                        _parse_archived_chunk,
+                        chunk,
+                        out_dir,
+                        fmt,
+                        store,
+                        options,
+                    )
+                    pending[future] = [item_id for item_id, _ in chunk]
+
+                for future in as_completed(pending):
+                    report(_chunk_results(future, pending[future], run_metrics))
+
+    logger.info(
+        "{} pages in the archive{}".format(
+            sum(reasons.values()),
+            "".join(
+                ", {} {}".format(count, reason)
+                for reason, count in reasons.most_common()
+            ),
+        )
+    )
+    if not dry_run:
+        logger.info("stages: {}".format(run_metrics.format_stages()))
+
+
+def _chunked(pages, chunk_size: int):
+    chunk = []
+    for page in pages:
+        chunk.append(page)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _chunk_results(future, item_ids: List[str], metrics: Metrics):
+    try:
+        results, metrics_state = future.result()
+        metrics.merge(metrics_state)
+    except Exception as e:
+        # the worker died as a whole, e.g. killed by the os
+        results = [(item_id, "worker died", str(e)) for item_id in item_ids]
+        metrics.inc("items_total", len(results), outcome="failed")
+        metrics.inc(
+            "failures_total",
+            len(results),
+            stage="worker",
+            reason=type(e).__name__,
+        )
+    return results
+
+
+def _parse_archived_chunk(
+    pages: List[Tuple[str, str]],
+    out_dir: str,
+    fmt: str,
+    store: str,
+    options: dict,
+) -> Tuple[List[Tuple[str, Optional[str], Optional[str]]], dict]:
+    """
+    Parse a chunk of archived pages in a worker process.
+
+    :return: the results of `_parse_archived_page`, and the state of the
+      metrics of the chunk
+    """
+    metrics = Metrics()
+    with open_item_store(
+        store, out_dir, fmt=fmt, commit_every=1
+    ) as item_store, open_manifest(out_dir, commit_every=1) as manifest:
+        results = [
+            _parse_archived_page(
+                item_id,
+                page_source,
+                item_store,
+                log=_no_log,
+                manifest=manifest,
+                metrics=metrics,
+                **options,
+            )
+            for item_id, page_source in pages
+        ]
+    return results, metrics.state()
+
+
+def _parse_archived_page(
+    item_id: str,
+    page_source: str,
+    item_store: ItemStore,
+    *,
+    log,
+    force: bool,
+    since: Optional[float],
+    dry_run: bool,
+    fast: bool,
+    manifest: ParseManifest,
+    metrics: Metrics,
+) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Parse an archived page, unless it is up to date according to the manifest.
+
+    :return: (item id, the reason to parse or None if up to date, the error
+      message or None)
+    """
+    page_hash = hash_page(page_source)
+    if force:
+        reason = "forced"
+    else:
+        reason = manifest.check(item_id, page_hash, since=since)
+        if reason is None and not item_store.exists(item_id):
+            reason = "item missing"
+
+    metrics.inc(
+        "cache_total",
+        cache="manifest",
+        result="hit" if reason is None else "miss",
+    )
+    if reason is None:
+        return item_id, None, None
+
+    if dry_run:
+        log('to parse "{}": {}'.format(item_id, reason))
+        return item_id, reason, None
+
+    try:
+        parse_page_impl(
+            item_id,
+            page_source,
+            item_store,
+            log=log,
+            fast=fast,
+            manifest=manifest,
+            metrics=metrics,
+            page_hash=page_hash,
+        )
+    except Exception as e:
+        metrics.inc("items_total", outcome="failed")
+        return item_id, reason, str(e)
 
-            finally:
-                progress.update(task_id, advance=1)
+    metrics.inc("items_total", outcome="parsed")
+    return item_id, reason, None
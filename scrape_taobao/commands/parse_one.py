@@ -1,44 +1,176 @@
-import dataclasses
 import os
+from typing import Optional
 
+from scrape_taobao.archive import is_archive, read_archive_page
+from scrape_taobao.bean.item_data import item_to_dict
 from scrape_taobao.commands import ITEMS_DIR, logger
-from scrape_taobao.core.parse_item_page import parse_item_page
-from scrape_taobao.io import dump
+from scrape_taobao.core.parse_item_page import PageParseError, parse_item_page
+from scrape_taobao.item_list import canonical_item_id
+from scrape_taobao.manifest import (
+    ParseManifest,
+    hash_item,
+    hash_page,
+    open_manifest,
+)
+from scrape_taobao.metrics import Metrics
+from scrape_taobao.store import FileItemStore, ItemStore, open_item_store
 
 
-def parse_one(page_path: str, *, out_dir: str = ITEMS_DIR, fmt: str = "yaml"):
+def parse_one(
+    page_path: str,
+    *,
+    item: Optional[str] = None,
+    out_dir: str = ITEMS_DIR,
+    fmt: str = "yaml",
+    fast: bool = False,
+    store: str = "file",
+):
     """
     解析一个商品页面。
 
     如果想要下载源页面并解析，可以使用 `scrape-one` 命令。
 
-    :param page_path: 页面源码文件
+    :param page_path: 页面源码文件，或页面归档文件，详见 `parse` 命令
+    :param item: 要解析的归档中的商品链接或 ID，默认为归档中的第一个页面
     :param out_dir: 商品信息文件所在目录，默认为 '<project-root>/cache/items'
     :param fmt: 商品信息文件格式，支持 'json' 和 'yaml'
+    :param fast: 是否优先直接从页面源码中抽取商品信息，而不构建完整的页面树
+    :param store: 商品信息存储方式，支持 'file'（每个商品一个文件）、'sqlite'（即
+      '<out_dir>/items.sqlite'）、'sqlite:<path>'、'jsonl'（即
+      '<out_dir>/items.jsonl'）和 'jsonl:<path>'
     """
     os.makedirs(out_dir, exist_ok=True)
 
-    try:
-        parse_one_impl(page_path, out_dir=out_dir, fmt=fmt)
-    except Exception as e:
-        logger.exception('failed to parse "{}": {}'.format(page_path, e))
+    with open_item_store(store, out_dir, fmt=fmt) as item_store, open_manifest(
+        out_dir
+    ) as manifest:
+        try:
+            parse_one_impl(
+                page_path,
+                item_id=canonical_item_id(str(item)) if item else None,
+                out_dir=out_dir,
+                fmt=fmt,
+                fast=fast,
+                store=item_store,
+                manifest=manifest,
+            )
+        except Exception as e:
+            logger.exception('failed to parse "{}": {}'.format(page_path, e))
 
 
 def parse_one_impl(
-    page_path: str, out_dir: str = ITEMS_DIR, fmt: str = "yaml", log=logger.info
+    page_path: str,
+    out_dir: str = ITEMS_DIR,
+    fmt: str = "yaml",
+    log=logger.info,
+    fast: bool = False,
+    store: Optional[ItemStore] = None,
+    manifest: Optional[ParseManifest] = None,
+    metrics: Optional[Metrics] = None,
+    item_id: Optional[str] = None,
 ):
     """
     Parse one item page.
 
     See also the docstring of `parse_one`.
+
+    :param page_path: the page file, or a page archive, which is read up to
+      the page of the item
+    :param store: the store to save the item to, default to the file store
+      of `out_dir` and `fmt`
+    :param manifest: the manifest to record the parsing to
+    :param metrics: the metrics to record the stages to
+    :param item_id: id of the item to parse in the archive, default to the
+      first one
     """
-    with open(page_path, "r") as f:
-        item_data = parse_item_page(f)
+    metrics = metrics or Metrics()
+    if is_archive(page_path):
+        with metrics.timer("cache_read"):
+            item_id, page_source = read_archive_page(page_path, item_id)
 
-    log('parsed "{}"'.format(os.path.basename(page_path)))
+    else:
+        with metrics.timer("cache_read"), open(page_path, "r") as f:
+            page_source = f.read()
+        item_id = os.path.basename(page_path)[: -len(".html")]
 
-    out_filename = os.path.basename(page_path).replace(
-        ".html", ".{}".format(fmt)
+    store = store or FileItemStore(out_dir, fmt=fmt)
+    parse_page_impl(
+        item_id,
+        page_source,
+        store,
+        log=log,
+        fast=fast,
+        manifest=manifest,
+        metrics=metrics,
     )
-    out_path = os.path.join(out_dir, out_filename)
-    dump(dataclasses.asdict(item_data), out_path, fmt=fmt)
+
+
+def parse_page_impl(
+    item_id: str,
+    page_source: str,
+    store: ItemStore,
+    *,
+    log=logger.info,
+    fast: bool = False,
+    manifest: Optional[ParseManifest] = None,
+    metrics: Optional[Metrics] = None,
+    page_hash: Optional[str] = None,
+    page_stamp: Optional[str] = None,
+) -> dict:
+    """
+    Parse the page source of an item and save the item to the store.
+
+    If the manifest is given, the parsing is recorded to it, and the item is
+    not saved again if it is unchanged since the last parsing.
+
+    The parsing and the dumping are timed into the metrics, so are their
+    failures counted.
+
+    :param page_hash: hash of the page source if already hashed, to record to
+      the manifest
+    :param page_stamp: stamp of the cached page, see `PageCache.stamp`, to
+      record to the manifest
+    :return: the parsed item
+    :raise PageParseError: if failed to parse the page
+    """
+    metrics = metrics or Metrics()
+    try:
+        with metrics.timer("parse"):
+            item_data = parse_item_page(page_source, fast=fast)
+            item = item_to_dict(item_data)
+    except Exception as e:
+        metrics.fail("parse", e)
+        raise PageParseError(str(e)) from e
+
+    if manifest is None:
+        log('parsed "{}"'.format(item_id))
+        _dump_item(item_id, item, store, metrics)
+        return item
+
+    output_hash = hash_item(item)
+    entry = manifest.get(item_id)
+    if entry and entry.output_hash == output_hash and store.exists(item_id):
+        metrics.inc("cache_total", cache="output", result="hit")
+        log('parsed "{}", unchanged'.format(item_id))
+    else:
+        metrics.inc("cache_total", cache="output", result="miss")
+        log('parsed "{}"'.format(item_id))
+        _dump_item(item_id, item, store, metrics)
+
+    manifest.record(
+        item_id,
+        page_hash or hash_page(page_source),
+        item["platform"],
+        output_hash,
+        page_stamp=page_stamp,
+    )
+    return item
+
+
+def _dump_item(item_id: str, item: dict, store: ItemStore, metrics: Metrics):
+    try:
+        with metrics.timer("dump"):
+            store.put(item_id, item)
+    except Exception as e:
+        metrics.fail("dump", e)
+        raise
@@ -0,0 +1,54 @@
+import datetime
+
+from scrape_taobao.commands import logger
+from scrape_taobao.work_queue import WorkQueue
+
+
+def queue_status(work_queue: str, *, retry_failed: bool = False):
+    """
+    查看共享工作队列的状态。
+
+    输出队列中各状态（待抓取、已领取、租约已过期、已完成和失败）的商品数量，以及
+    正在抓取的进程。
+
+    :param work_queue: 共享工作队列文件，见 `scrape` 命令的 `--work-queue` 参数
+    :param retry_failed: 是否将失败的商品重新标记为待抓取，之后由抓取进程重新领取
+    """
+    with WorkQueue(work_queue) as shared_queue:
+        if retry_failed:
+            retried = shared_queue.retry_failed()
+            logger.info("retry {} failed items".format(retried))
+
+        summary = shared_queue.summary()
+        logger.info(
+            "items: {}".format(
+                ", ".join(
+                    "{} {}".format(n, state) for state, n in summary.items()
+                )
+                or "none"
+            )
+        )
+
+        for (
+            worker_id,
+            host,
+            pid,
+            started_at,
+            heartbeat_at,
+        ) in shared_queue.workers():
+            logger.info(
+                "worker {} on {} (pid {}), started at {}, "
+                "last heartbeat at {}".format(
+                    worker_id,
+                    host,
+                    pid,
+                    _format_time(started_at),
+                    _format_time(heartbeat_at),
+                )
+            )
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(
+        timespec="seconds"
+    )
@@ -0,0 +1,37 @@
+from scrape_taobao.commands import JOURNAL_PATH, logger
+from scrape_taobao.commands.scrape import scrape
+from scrape_taobao.journal import ScrapeJournal
+
+
+def retry_failed(
+    journal: str = JOURNAL_PATH,
+    *,
+    max_attempts: int = None,
+    dry_run: bool = False,
+    **scrape_kwargs,
+):
+    """
+    重新抓取上次抓取失败的商品。
+
+    该命令会将抓取记录中失败的商品链接重新标记为待抓取，然后继续上次的抓取。
+
+    :param journal: 抓取记录文件，默认为 '<project-root>/cache/journal.sqlite'
+    :param max_attempts: 最大尝试次数，已尝试该次数的商品链接不再重试
+    :param dry_run: 只输出失败的商品链接及其最近的错误，而不重新抓取
+    :param scrape_kwargs: 其余参数同 `scrape` 命令
+    """
+    with ScrapeJournal(journal) as url_journal:
+        if dry_run:
+            for url, attempts, error in url_journal.failed():
+                logger.info(
+                    'failed "{}" after {} attempts: {}'.format(
+                        url, attempts, error
+                    )
+                )
+            return
+
+        retried = url_journal.retry_failed(max_attempts=max_attempts)
+
+    logger.info("retry {} failed items".format(retried))
+    if retried:
+        scrape(journal=journal, resume=True, **scrape_kwargs)
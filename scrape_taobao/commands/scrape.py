@@ -1,17 +1,70 @@
+import collections
+import functools
 import os
+import queue
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import List, Optional
 
 import rich.progress
 from selenium import webdriver
 
-from scrape_taobao.commands import ITEMS_DIR, PAGES_DIR, logger
-from scrape_taobao.commands.scrape_one import scrape_one_impl
-from scrape_taobao.core.hack import hide_browser_features, prompt_and_login
-from scrape_taobao.io import load_item_list
+from scrape_taobao.archive import open_archive_writer
+from scrape_taobao.commands import (
+    HISTORY_PATH,
+    ITEMS_DIR,
+    JOURNAL_PATH,
+    METRICS_PATH,
+    PAGES_DIR,
+    SESSION_PATH,
+    logger,
+)
+from scrape_taobao.commands.scrape_one import make_fetcher, scrape_one_impl
+from scrape_taobao.core.fetch_item_page import (
+    ItemPageFetcher,
+    SeleniumItemPageFetcher,
+)
+from scrape_taobao.core.fetch_profile import (
+    FetchProfile,
+    block_resources,
+    get_fetch_profile,
+    open_chrome,
+)
+from scrape_taobao.core.hack import (
+    export_login_cookies,
+    hide_browser_features,
+    import_login_cookies,
+    prompt_credentials,
+)
+from scrape_taobao.core.session import login_with_session
+from scrape_taobao.history import open_history
+from scrape_taobao.item_list import (
+    canonical_item_id,
+    iter_item_list,
+    load_item_list,
+)
+from scrape_taobao.journal import FAILED, FETCHED, PARSED, ScrapeJournal
+from scrape_taobao.manifest import ParseManifest, open_manifest
+from scrape_taobao.metrics import Metrics, exporting_metrics, make_progress
+from scrape_taobao.pacing import (
+    AdaptivePacer,
+    PacedItemPageFetcher,
+    format_pacing_stats,
+)
+from scrape_taobao.page_cache import PageCache, open_page_cache
+from scrape_taobao.pipeline import ParseStage
+from scrape_taobao.recovery import (
+    RETRIABLE_FAILURES,
+    CircuitBreaker,
+    classify_failure,
+)
+from scrape_taobao.store import ItemStore, open_item_store
 from scrape_taobao.utils import fake_pause
+from scrape_taobao.work_queue import WorkQueue, make_worker_id
 
 
 def scrape(
-    item_list: str,
+    item_list: Optional[str] = None,
     *,
     out_dir: str = ITEMS_DIR,
     pages_dir: str = PAGES_DIR,
@@ -20,56 +73,734 @@ def scrape(
     shuffle: bool = True,
     download_only: bool = False,
     no_cache: bool = False,
+    fast: bool = False,
+    browsers: int = 1,
+    share_login: bool = False,
+    login: bool = True,
+    session: str = SESSION_PATH,
+    fetcher: str = "selenium",
+    concurrency: int = 8,
+    rate: float = 2.0,
+    store: str = "file",
+    page_cache: str = "dir",
+    journal: str = JOURNAL_PATH,
+    resume: bool = False,
+    fresh: bool = False,
+    work_queue: Optional[str] = None,
+    lease: float = 300.0,
+    pacing: str = "adaptive",
+    profile: str = "default",
+    pipeline: int = 0,
+    retries: int = 3,
+    history: str = HISTORY_PATH,
+    archive: Optional[str] = None,
+    metrics: str = METRICS_PATH,
+    prometheus: Optional[str] = None,
+    prometheus_interval: float = 15.0,
 ):
     """
     从商品链接列表中抓取商品页面，并解析商品信息。
 
-    :param item_list: 商品链接列表文件，每行一个链接
+    :param item_list: 商品链接列表文件，每行一个链接或商品 ID，支持 gzip 压缩；
+      继续上次抓取时可省略。链接按商品 ID 去重，已抓取的商品会被跳过
     :param out_dir: 输出目录，默认为 '<project-root>/cache/items'
     :param pages_dir: 页面源码目录，默认为 '<project-root>/cache/pages'
     :param fmt: 输出格式，支持 'json' 和 'yaml'
     :param n: 抓取商品数量，默认抓取全部商品
-    :param shuffle: 是否打乱商品链接列表
+    :param shuffle: 是否打乱商品链接列表；指定 `n` 时随机抽取 `n` 个商品
     :param download_only: 是否只下载页面源码，不解析
     :param no_cache: 是否跳过缓存，即不使用已缓存的页面源码或解析结果
+    :param fast: 是否优先直接从页面源码中抽取商品信息，而不构建完整的页面树
+    :param browsers: 并行抓取的浏览器数量，默认为 1
+    :param share_login: 是否只登录第一个浏览器，其余浏览器共享其登录状态
+    :param login: 是否登录，从本地页面服务（见 `serve-pages` 命令）抓取时可关闭
+    :param session: 登录会话文件，默认为 '<project-root>/cache/session.json'，
+      若其中保存的会话仍有效，则跳过登录；设为空字符串则不保存、不复用会话
+    :param fetcher: 页面抓取方式，支持 'selenium' 和 'http'，后者直接以 http 请求
+      抓取页面源码，遇到验证或登录页面时再回退到浏览器
+    :param concurrency: 以 http 方式抓取时的最大并发请求数
+    :param rate: 以 http 方式抓取时，每个域名每秒的最大请求数
+    :param store: 商品信息存储方式，支持 'file'（每个商品一个文件）、'sqlite'（即
+      '<out_dir>/items.sqlite'）、'sqlite:<path>'、'jsonl'（即
+      '<out_dir>/items.jsonl'）和 'jsonl:<path>'
+    :param page_cache: 页面源码缓存方式，支持 'dir'（每个页面一个文件）、'pack'
+      （压缩打包存储）和 'pack:<codec>'，详见 `migrate-pages` 命令
+    :param journal: 抓取记录文件，默认为 '<project-root>/cache/journal.sqlite'，记录
+      每个商品链接的抓取状态、尝试次数和最近的错误
+    :param resume: 是否继续上次中断的抓取，即只抓取抓取记录中未完成的商品链接，
+      此时忽略 `item_list`、`n` 和 `shuffle`
+    :param fresh: 是否清空抓取记录中以往抓取的全部链接。默认只重置本次列表中的链接，
+      而保留其余链接的记录（如以往失败的链接），以便之后通过 `retry-failed` 重试
+    :param work_queue: 共享工作队列文件，用于多个进程或多台机器（可以使用不同的账号）
+      共同抓取同一个商品链接列表。队列为 sqlite 数据库，多台机器共同抓取时需放在
+      支持文件锁的共享存储上。若指定 `item_list`，则先将其中的商品加入队列（已在队列
+      中的商品会被忽略，因此各进程可以指定同一个列表），然后从队列中逐个领取商品
+      抓取，直到队列为空；每个商品同一时间只会被一个进程领取，完成后不会再被领取。
+      此时忽略 `n`、`shuffle` 和 `resume`，抓取状态记录在队列中而非抓取记录中
+    :param lease: 使用共享工作队列时，领取商品的租约秒数。进程会定期续约，若进程
+      退出或失去响应，其领取的商品在租约过期后会被其他进程重新领取
+    :param pacing: 以浏览器抓取时的节奏控制方式，支持 'adaptive' 和 'fixed'。前者
+      根据页面情况自动调整请求速率：页面正常时逐渐加速，遇到验证码、登录跳转或空
+      skuMap 时指数退避；后者在每个商品后随机停顿固定范围的时间
+    :param profile: 浏览器抓取配置，支持 'default'（有界面浏览器，等待页面完全加载）
+      和 'lean'（无头浏览器，不加载图片、媒体、字体和样式，页面中出现解析所需的节点后
+      立即返回页面源码）；可以通过 'lean:none' 让 `driver.get` 不等待文档解析完成
+    :param pipeline: 后台解析线程数。大于 0 时，抓取线程抓取到页面后即交由后台线程
+      缓存页面、解析和保存商品信息，并继续抓取下一个页面；待处理的页面数量不超过
+      解析线程数的两倍，解析跟不上抓取时抓取线程会等待。默认为 0，即在抓取线程中
+      依次完成
+    :param retries: 因网络错误、登录失效或验证码（包括空 skuMap）失败的商品的最大
+      重试次数。登录失效，或连续遇到验证码或网络错误时，所有浏览器暂停抓取，遇到
+      失败的浏览器冷却（默认 60 秒，可以通过环境变量 `RECOVERY_COOLDOWN` 设置，
+      每次恢复翻倍）后原地重新登录，其余浏览器沿用其登录状态，然后重试失败的商品；
+      连续多次恢复后仍然失败时停止抓取，可以通过 `resume` 继续。无人值守时请通过
+      环境变量 `USERNAME` 和 `PASSWORD` 提供账号，以便重新登录
+    :param history: 商品历史数据库，默认为 '<project-root>/cache/history.sqlite'，
+      每次抓取到商品页面时记录商品价格、库存、销量及各 sku 价格和库存的快照，只保存
+      有变化的字段；设为空字符串则不记录。定期以 `--no-cache` 重新抓取即可积累历史，
+      详见 `history` 和 `growth` 命令
+    :param archive: 页面归档文件，若指定则将本次抓取到的页面（不包括已缓存的页面）
+      流式写入该文件，以便在机器间迁移页面；支持 '.tar'、'.tar.gz'、'.tgz'、
+      '.warc' 和 '.warc.gz'，文件不能已存在。归档可以直接由 `parse` 命令解析
+    :param metrics: 抓取指标文件，默认为 '<project-root>/cache/metrics.json'，抓取
+      结束时写入各阶段（登录、停顿、抓取、读写缓存、解析和保存）的耗时分布、缓存命中
+      次数和失败原因；设为空字符串则不写入
+    :param prometheus: Prometheus textfile 路径，若指定则在抓取过程中定期重写，
+      以便 node exporter 采集
+    :param prometheus_interval: 重写 Prometheus textfile 的间隔秒数
     """
 
     os.makedirs(pages_dir, exist_ok=True)
     os.makedirs(out_dir, exist_ok=True)
 
-    with webdriver.Chrome() as driver:
-        hide_browser_features(driver)
-        prompt_and_login(driver)
-
-        # load item urls from file
-        item_urls = load_item_list(item_list, n=n, shuffle=shuffle)
-        failed_item_urls = []
-
-        with rich.progress.Progress(transient=True) as progress:
-            task_id = progress.add_task("scraping", total=len(item_urls))
-
-            while item_urls:
-                url = item_urls.pop()
-
-                try:
-                    scrape_one_impl(
-                        url,
-                        driver,
-                        out_dir=out_dir,
-                        pages_dir=pages_dir,
-                        fmt=fmt,
-                        download_only=download_only,
-                        no_cache=no_cache,
-                        log=progress.log,
+    if login and not (session and os.path.exists(session)):
+        # prompt before showing the progress if there is surely no session
+        prompt_credentials()
+
+    if not resume and not work_queue and item_list is None:
+        raise ValueError("item_list is required unless resuming")
+
+    url_journal = ScrapeJournal(journal)
+    item_store = open_item_store(store, out_dir, fmt=fmt)
+    pages = open_page_cache(page_cache, pages_dir)
+    manifest = open_manifest(out_dir)
+    item_history = open_history(history)
+    page_archive = open_archive_writer(archive)
+    shared_queue = (
+        WorkQueue(work_queue, lease_seconds=lease) if work_queue else None
+    )
+
+    if shared_queue is not None:
+        item_urls = []
+        if item_list is not None:
+            added = shared_queue.add(iter_item_list(item_list))
+            logger.info("add {} items to the work queue".format(added))
+        logger.info(
+            "work queue: {}".format(_format_counts(shared_queue.summary()))
+        )
+
+    elif resume:
+        item_urls = url_journal.unfinished(download_only=download_only)
+        logger.info("resume {} unfinished items".format(len(item_urls)))
+
+    else:
+        # load item urls from file, without the scraped items, so that they
+        # never reach the queue
+        skipped = collections.Counter()
+        item_urls = load_item_list(
+            item_list,
+            n=n,
+            shuffle=shuffle,
+            skip=None
+            if no_cache
+            else functools.partial(
+                _is_scraped, item_store, pages, manifest, download_only
+            ),
+            on_skipped=lambda _, reason: skipped.update([reason]),
+        )
+        logger.info(
+            "load {} items{}".format(
+                len(item_urls),
+                "".join(
+                    ", {} {}".format(count, reason)
+                    for reason, count in skipped.most_common()
+                ),
+            )
+        )
+        url_journal.reset(item_urls, fresh=fresh)
+
+    if pacing not in ("adaptive", "fixed"):
+        raise ValueError("unsupported pacing: {}".format(pacing))
+    pacer = (
+        AdaptivePacer.from_env(max(1, browsers))
+        if pacing == "adaptive" and fetcher != "http"
+        else None
+    )
+
+    fetch_profile = get_fetch_profile(profile)
+    run_metrics = Metrics()
+    pool = _ScrapePool(
+        item_urls,
+        login=login,
+        session_path=session or None,
+        share_login=share_login,
+        journal=url_journal,
+        pacer=pacer,
+        fetch_profile=fetch_profile,
+        parse_workers=pipeline,
+        breaker=CircuitBreaker.from_env(),
+        max_retries=retries,
+        metrics=run_metrics,
+        work_queue=shared_queue,
+        scrape_kwargs=dict(
+            out_dir=out_dir,
+            pages_dir=pages_dir,
+            fmt=fmt,
+            download_only=download_only,
+            no_cache=no_cache,
+            fast=fast,
+            store=item_store,
+            page_cache=pages,
+            manifest=manifest,
+            metrics=run_metrics,
+            history=item_history,
+            archive=page_archive,
+        ),
+    )
+
+    with url_journal, item_store, pages, manifest, exporting_metrics(
+        run_metrics, metrics or None, prometheus, prometheus_interval
+    ), item_history or nullcontext(), page_archive or nullcontext(), (
+        shared_queue or nullcontext()
+    ), make_progress() as progress:
+        task_id = progress.add_task(
+            "scraping",
+            total=len(item_urls) if shared_queue is None else None,
+        )
+        if fetcher == "http":
+            pool.run_http(max(1, concurrency), rate, progress, task_id)
+        else:
+            pool.run(max(1, browsers), progress, task_id)
+
+        summary = (
+            url_journal.summary()
+            if shared_queue is None
+            else shared_queue.summary()
+        )
+
+    logger.info("stages: {}".format(run_metrics.format_stages()))
+    if pacer is not None:
+        logger.info("pacing: {}".format(format_pacing_stats(pacer.stats())))
+
+    logger.info(
+        "{}: {}".format(
+            "journal" if shared_queue is None else "work queue",
+            _format_counts(summary),
+        )
+    )
+    if pool.breaker.gave_up:
+        logger.error(
+            "stopped as the session can not be recovered, continue with "
+            "`--resume` later"
+        )
+    if pool.failed_item_urls:
+        logger.error(
+            "failed to scrape {} items, retry with `retry-failed`".format(
+                len(pool.failed_item_urls)
+            )
+        )
+
+
+def _format_counts(counts: dict) -> str:
+    return ", ".join("{} {}".format(n, state) for state, n in counts.items())
+
+
+def _is_scraped(
+    item_store: ItemStore,
+    pages: PageCache,
+    manifest: ParseManifest,
+    download_only: bool,
+    item_id: str,
+) -> bool:
+    """
+    Check if the item would be skipped by `scrape_one_impl` as it is scraped
+    and up to date, or its page is cached if only downloading.
+    """
+    if download_only:
+        return item_id in pages or item_store.exists(item_id)
+
+    return item_store.exists(item_id) and (
+        manifest.check(item_id) is None or item_id not in pages
+    )
+
+
+def _browser_lock(http_fetcher: Optional[ItemPageFetcher]):
+    """
+    The lock to drive the browser, which is the fallback lock of the http
+    fetcher sharing the browser with the workers, or none without it.
+    """
+    lock = getattr(http_fetcher, "fallback_lock", None)
+    return lock if lock is not None else nullcontext()
+
+
+class _ScrapePool:
+    """
+    A pool of workers scraping the items from a shared queue.
+
+    Each worker runs in its own thread. By default, each worker drives its own
+    browser, and the fetches of all the browsers are paced by the shared
+    pacer, or by a fixed pause of each worker after each item if there is no
+    pacer. With the http fetcher, the workers share one http fetcher, whose
+    requests are paced per host instead. The item ids being scraped are
+    claimed before scraping, so that duplicated urls never race on the same
+    cache files. The outcome of each url is recorded to the journal, and the
+    stages of it to the metrics.
+
+    If there are parse workers, the workers only fetch the pages, and hand the
+    rest over to a shared `ParseStage`, which records the outcomes instead.
+
+    If there is a shared work queue, the urls are claimed from it instead of
+    the given ones, and the outcomes are recorded to it instead of the
+    journal. The leases of the claimed urls are kept alive by the heartbeats
+    of the pool while running, and released if interrupted.
+
+    The urls failed by the failures not of the items themselves, e.g. a login
+    redirection or a network error, are queued again up to `max_retries`
+    times, and the failures of the session trip the shared circuit breaker,
+    which pauses the workers while the tripping one logs its browser in again,
+    see `CircuitBreaker`. The workers stop if the breaker gives up.
+    """
+
+    def __init__(
+        self,
+        item_urls: List[str],
+        *,
+        login: bool,
+        session_path: Optional[str],
+        share_login: bool,
+        journal: ScrapeJournal,
+        pacer: Optional[AdaptivePacer],
+        fetch_profile: FetchProfile,
+        parse_workers: int,
+        breaker: CircuitBreaker,
+        max_retries: int,
+        metrics: Metrics,
+        work_queue: Optional[WorkQueue] = None,
+        scrape_kwargs: dict,
+    ):
+        self.url_queue = queue.Queue()
+        for url in item_urls:
+            self.url_queue.put(url)
+        # the urls to retry, which go before the rest
+        self.retry_queue = queue.Queue()
+
+        self.login_enabled = login
+        self.session_path = session_path
+        self.share_login = share_login
+        self.journal = journal
+        self.pacer = pacer
+        self.fetch_profile = fetch_profile
+        self.parse_workers = parse_workers
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self.work_queue = work_queue
+        self.worker_id = make_worker_id()
+        self.scrape_kwargs = scrape_kwargs
+
+        self.failed_item_urls = []
+        self.claimed_item_ids = set()
+        self.retry_counts = collections.Counter()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.parse_stage = None
+
+        # the cookies of the first logged-in browser, shared to the others
+        self.login_cookies = None
+        self.login_shared = threading.Event()
+
+        # the browser the http fetcher falls back to
+        self.shared_browser: Optional[SeleniumItemPageFetcher] = None
+
+    def run(
+        self,
+        browsers: int,
+        progress: rich.progress.Progress,
+        task_id: rich.progress.TaskID,
+    ):
+        """
+        Scrape with a browser per worker.
+        """
+        self._run_workers(browsers, self.open_browser, progress, task_id)
+
+    def run_http(
+        self,
+        concurrency: int,
+        rate_per_host: float,
+        progress: rich.progress.Progress,
+        task_id: rich.progress.TaskID,
+    ):
+        """
+        Scrape with an http fetcher shared by the workers, which falls back to
+        a shared browser on validation pages.
+        """
+        with self.open_browser(0) as browser_fetcher:
+            self.shared_browser = browser_fetcher
+            driver = browser_fetcher.driver
+            with make_fetcher(
+                "http",
+                driver,
+                concurrency=concurrency,
+                rate_per_host=rate_per_host,
+                ready_timeout=self.fetch_profile.ready_timeout,
+            ) as http_fetcher:
+                self._run_workers(
+                    concurrency,
+                    lambda _: nullcontext(http_fetcher),
+                    progress,
+                    task_id,
+                    pause=False,
+                )
+
+    def _run_workers(
+        self,
+        workers: int,
+        open_fetcher,
+        progress: rich.progress.Progress,
+        task_id: rich.progress.TaskID,
+        pause: bool = True,
+    ):
+        if self.parse_workers > 0:
+            self.parse_stage = ParseStage(
+                self.parse_workers,
+                on_done=functools.partial(self.finish, progress, task_id),
+                metrics=self.metrics,
+            )
+
+        heartbeat_thread = None
+        if self.work_queue is not None:
+            self.work_queue.register(self.worker_id)
+            heartbeat_thread = threading.Thread(
+                target=self.heartbeat, name="heartbeat", daemon=True
+            )
+            heartbeat_thread.start()
+
+        threads = [
+            threading.Thread(
+                target=self.work,
+                args=(i, open_fetcher, progress, task_id, pause),
+                name="scrape-{}".format(i),
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            logger.warning("interrupted, waiting for browsers to stop...")
+            self.stopped.set()
+            for thread in threads:
+                thread.join()
+            raise
+        finally:
+            if self.parse_stage is not None:
+                self.parse_stage.close()
+            if self.work_queue is not None:
+                self.stopped.set()
+                heartbeat_thread.join()
+                released = self.work_queue.release(self.worker_id)
+                if released:
+                    logger.info(
+                        "released {} items to the work queue".format(released)
                     )
 
-                except Exception as e:
-                    logger.error(
-                        'failed to scrape item "{}": {}'.format(url, e)
+    def heartbeat(self):
+        """
+        Extend the leases periodically until stopped.
+        """
+        interval = self.work_queue.lease_seconds / 3
+        while not self.stopped.wait(interval):
+            try:
+                self.work_queue.heartbeat(self.worker_id)
+            except Exception as e:
+                # retried at the next beat, before the leases expire
+                logger.warning("failed to heartbeat: {}".format(e))
+
+    def next_url(self) -> Optional[str]:
+        """
+        Get the next url to scrape, None if there is none left.
+        """
+        try:
+            return self.retry_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        if self.work_queue is not None:
+            claimed = self.work_queue.claim(self.worker_id)
+            return claimed[1] if claimed is not None else None
+
+        try:
+            return self.url_queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def work(
+        self,
+        index: int,
+        open_fetcher,
+        progress: rich.progress.Progress,
+        task_id: rich.progress.TaskID,
+        pause: bool,
+    ):
+        try:
+            with open_fetcher(index) as fetcher:
+                if isinstance(fetcher, SeleniumItemPageFetcher):
+                    browser, http_fetcher = fetcher, None
+                else:
+                    browser, http_fetcher = self.shared_browser, fetcher
+                login_again = functools.partial(
+                    self.login_again, browser, http_fetcher
+                )
+                generation = self.breaker.generation
+
+                if pause and self.pacer is not None:
+                    fetcher = PacedItemPageFetcher(
+                        fetcher, self.pacer, self.stopped, self.metrics
                     )
-                    failed_item_urls.append(url)
+                    pause = False
+
+                while not self.stopped.is_set():
+                    if not self.breaker.wait(self.stopped):
+                        break
+                    if generation != self.breaker.generation:
+                        generation = self.breaker.generation
+                        self.take_login(browser, http_fetcher)
+
+                    url = self.next_url()
+                    if url is None:
+                        break
+
+                    if not self.scrape_one(url, fetcher, progress, login_again):
+                        progress.update(task_id, advance=1)
+                    if pause:
+                        with self.metrics.timer("pause"):
+                            fake_pause()
+
+        except Exception as e:
+            # the rest items are left to the other workers
+            logger.exception("worker {} stopped: {}".format(index, e))
+
+    @contextmanager
+    def open_browser(self, index: int):
+        with open_chrome(self.fetch_profile) as driver:
+            hide_browser_features(driver)
+            self.login(index, driver)
+            block_resources(driver, self.fetch_profile)
+            yield SeleniumItemPageFetcher(
+                driver, self.fetch_profile.ready_timeout
+            )
+
+    def login(self, index: int, driver: webdriver.Chrome):
+        if not self.login_enabled:
+            return
+
+        try:
+            with self.metrics.timer("login"):
+                self._login(index, driver)
+        except Exception as e:
+            self.metrics.fail("login", e)
+            raise
+
+    def _login(self, index: int, driver: webdriver.Chrome):
+        if not self.share_login:
+            login_with_session(driver, self.session_path)
+            return
+
+        if index == 0:
+            try:
+                login_with_session(driver, self.session_path)
+                self.login_cookies = export_login_cookies(driver)
+            finally:
+                self.login_shared.set()
+            return
+
+        self.login_shared.wait()
+        if self.login_cookies is None:
+            login_with_session(driver, self.session_path)
+        else:
+            import_login_cookies(driver, self.login_cookies)
+
+    def login_again(
+        self,
+        browser: Optional[SeleniumItemPageFetcher],
+        http_fetcher: Optional[ItemPageFetcher] = None,
+    ) -> Optional[List[dict]]:
+        """
+        Log the browser in again in place, e.g. once the login expires.
+
+        :param http_fetcher: the http fetcher falling back to the browser, if
+          any, see `_browser_lock`
+        :return: the cookies of the browser, for the other browsers to take
+        """
+        if not self.login_enabled or browser is None:
+            return None
+
+        # never by the shared cookies, which have expired
+        with _browser_lock(http_fetcher):
+            try:
+                with self.metrics.timer("login"):
+                    login_with_session(browser.driver, self.session_path)
+            except Exception as e:
+                self.metrics.fail("login", e)
+                raise
+
+            return export_login_cookies(browser.driver)
+
+    def take_login(
+        self,
+        browser: Optional[SeleniumItemPageFetcher],
+        http_fetcher: Optional[ItemPageFetcher],
+    ):
+        """
+        Take the cookies of the browser logged in again by the breaker.
+        """
+        cookies = self.breaker.cookies
+        if cookies is None:
+            return
+
+        if browser is not None:
+            with _browser_lock(http_fetcher):
+                import_login_cookies(browser.driver, cookies)
+        if http_fetcher is not None:
+            http_fetcher.update_cookies(cookies)
+
+    def scrape_one(
+        self,
+        url: str,
+        fetcher: ItemPageFetcher,
+        progress: rich.progress.Progress,
+        login_again,
+    ) -> bool:
+        """
+        Scrape the item, and record the outcome unless the rest is handed
+        over to the parse stage, or the item is to be retried.
+
+        :param login_again: log the browser of the fetcher in again, see
+          `login_again`
+        :return: whether the outcome is left to the parse stage or the retry
+        """
+        item_id = canonical_item_id(url) or url
+        with self.lock:
+            if item_id in self.claimed_item_ids:
+                self.metrics.inc("items_total", outcome="duplicated")
+                progress.log('skip scrape "{}" as duplicated'.format(item_id))
+                return False
+            self.claimed_item_ids.add(item_id)
+
+        try:
+            handed_over = scrape_one_impl(
+                url,
+                fetcher,
+                parse_stage=self.parse_stage,
+                log=progress.log,
+                **self.scrape_kwargs,
+            )
+        except Exception as e:
+            kind = classify_failure(e)
+            if self.breaker.record(kind):
+                self.metrics.inc("recoveries_total", kind=kind)
+                with self.metrics.timer("recover"):
+                    if not self.breaker.recover(
+                        kind, login_again, self.stopped
+                    ):
+                        self.stopped.set()
+
+            if self.retry(url, kind, progress):
+                return True
+
+            self.record(url, e, kind)
+            return False
+
+        self.breaker.record(None)
+        if not handed_over:
+            self.record(url, None)
+        return handed_over
+
+    def finish(
+        self,
+        progress: rich.progress.Progress,
+        task_id: rich.progress.TaskID,
+        url: str,
+        error: Optional[Exception],
+    ):
+        """
+        Record the outcome of the item handed over to the parse stage.
+        """
+        self.record(url, error)
+        progress.update(task_id, advance=1)
+
+    def retry(
+        self, url: str, kind: str, progress: rich.progress.Progress
+    ) -> bool:
+        """
+        Queue the url again if it is failed by a retriable failure, and has not
+        used up its retries.
+
+        :return: whether the url is queued again
+        """
+        if kind not in RETRIABLE_FAILURES:
+            return False
+
+        item_id = canonical_item_id(url) or url
+        with self.lock:
+            if self.retry_counts[item_id] >= self.max_retries:
+                return False
+            self.retry_counts[item_id] += 1
+            self.claimed_item_ids.discard(item_id)
+
+        self.retry_queue.put(url)
+        self.metrics.inc("retries_total", kind=kind)
+        progress.log('retry "{}" later after {} failure'.format(item_id, kind))
+        return True
+
+    def record(
+        self,
+        url: str,
+        error: Optional[Exception],
+        kind: Optional[str] = None,
+    ):
+        """
+        Record the final outcome of the url.
+
+        :param kind: the kind of the failure, classified from the error if None
+        """
+        if error is not None:
+            kind = kind or classify_failure(error)
+            logger.error(
+                'failed to scrape item "{}" by {} failure: {}'.format(
+                    url, kind, error
+                )
+            )
+            self.metrics.inc("failed_items_total", kind=kind)
+            with self.lock:
+                self.failed_item_urls.append(url)
+
+        if self.work_queue is not None:
+            item_id = canonical_item_id(url) or url
+            completed = self.work_queue.complete(
+                self.worker_id, item_id, None if error is None else str(error)
+            )
+            if not completed:
+                logger.warning('lost the lease of "{}"'.format(item_id))
 
-                finally:
-                    progress.update(task_id, advance=1)
+        elif error is not None:
+            self.journal.mark(url, FAILED, str(error))
 
-                fake_pause()
+        else:
+            download_only = self.scrape_kwargs.get("download_only")
+            self.journal.mark(url, FETCHED if download_only else PARSED)
@@ -1,14 +1,39 @@
-import dataclasses
+import functools
 import os
+import time
+from contextlib import nullcontext
+from typing import Optional
 
-from selenium import webdriver
 from selenium.webdriver.remote.webdriver import WebDriver
 
-from scrape_taobao.commands import ITEMS_DIR, PAGES_DIR, logger
-from scrape_taobao.core.fetch_item_page import fetch_item_page
-from scrape_taobao.core.hack import hide_browser_features, prompt_and_login
-from scrape_taobao.core.parse_item_page import parse_item_page
-from scrape_taobao.io import dump
+from scrape_taobao.archive import PageArchiveWriter
+from scrape_taobao.commands import (
+    HISTORY_PATH,
+    ITEMS_DIR,
+    PAGES_DIR,
+    SESSION_PATH,
+    logger,
+)
+from scrape_taobao.commands.parse_one import parse_page_impl
+from scrape_taobao.core.fetch_item_page import (
+    ItemPageFetcher,
+    SeleniumItemPageFetcher,
+    page_title,
+)
+from scrape_taobao.core.fetch_profile import (
+    block_resources,
+    get_fetch_profile,
+    open_chrome,
+)
+from scrape_taobao.core.hack import export_login_cookies, hide_browser_features
+from scrape_taobao.core.session import login_with_session
+from scrape_taobao.history import ItemHistory, open_history
+from scrape_taobao.item_list import canonical_item_id
+from scrape_taobao.manifest import ParseManifest, open_manifest
+from scrape_taobao.metrics import Metrics
+from scrape_taobao.page_cache import DirPageCache, PageCache, open_page_cache
+from scrape_taobao.pipeline import ParseStage
+from scrape_taobao.store import FileItemStore, ItemStore, open_item_store
 
 
 def scrape_one(
@@ -19,6 +44,13 @@ def scrape_one(
     fmt: str = "yaml",
     download_only: bool = False,
     no_cache: bool = False,
+    fast: bool = False,
+    session: str = SESSION_PATH,
+    fetcher: str = "selenium",
+    store: str = "file",
+    page_cache: str = "dir",
+    profile: str = "default",
+    history: str = HISTORY_PATH,
 ):
     """
     抓取商品页面，并解析商品信息。
@@ -29,82 +61,303 @@ def scrape_one(
     :param fmt: 输出格式，支持 'json' 和 'yaml'
     :param download_only: 是否只下载页面源码，不解析
     :param no_cache: 是否跳过缓存，即不使用已下载的页面源码
+    :param fast: 是否优先直接从页面源码中抽取商品信息，而不构建完整的页面树
+    :param session: 登录会话文件，默认为 '<project-root>/cache/session.json'，
+      若其中保存的会话仍有效，则跳过登录；设为空字符串则不保存、不复用会话
+    :param fetcher: 页面抓取方式，支持 'selenium' 和 'http'，后者直接以 http 请求
+      抓取页面源码，遇到验证或登录页面时再回退到浏览器
+    :param store: 商品信息存储方式，支持 'file'（每个商品一个文件）、'sqlite'（即
+      '<out_dir>/items.sqlite'）、'sqlite:<path>'、'jsonl'（即
+      '<out_dir>/items.jsonl'）和 'jsonl:<path>'
+    :param page_cache: 页面源码缓存方式，支持 'dir'（每个页面一个文件）、'pack'
+      （压缩打包存储）和 'pack:<codec>'，详见 `migrate-pages` 命令
+    :param profile: 浏览器抓取配置，支持 'default' 和 'lean'，详见 `scrape` 命令
+    :param history: 商品历史数据库，默认为 '<project-root>/cache/history.sqlite'，
+      详见 `scrape` 命令
     """
 
     os.makedirs(pages_dir, exist_ok=True)
     os.makedirs(out_dir, exist_ok=True)
 
-    with webdriver.Chrome() as driver:
+    item_store = open_item_store(store, out_dir, fmt=fmt)
+    pages = open_page_cache(page_cache, pages_dir)
+    manifest = open_manifest(out_dir)
+    item_history = open_history(history)
+    fetch_profile = get_fetch_profile(profile)
+
+    with open_chrome(fetch_profile) as driver, item_store, pages, manifest, (
+        item_history or nullcontext()
+    ):
         hide_browser_features(driver)
-        prompt_and_login(driver)
+        login_with_session(driver, session or None)
+        block_resources(driver, fetch_profile)
 
         try:
-            scrape_one_impl(
-                url,
-                driver,
-                out_dir=out_dir,
-                pages_dir=pages_dir,
-                fmt=fmt,
-                download_only=download_only,
-                no_cache=no_cache,
-            )
+            with make_fetcher(
+                fetcher, driver, ready_timeout=fetch_profile.ready_timeout
+            ) as item_page_fetcher:
+                scrape_one_impl(
+                    url,
+                    item_page_fetcher,
+                    out_dir=out_dir,
+                    pages_dir=pages_dir,
+                    fmt=fmt,
+                    download_only=download_only,
+                    no_cache=no_cache,
+                    fast=fast,
+                    store=item_store,
+                    page_cache=pages,
+                    manifest=manifest,
+                    history=item_history,
+                )
 
         except Exception as e:
             logger.exception('failed to scrape "{}": {}'.format(url, e))
 
 
+def make_fetcher(
+    kind: str,
+    driver: WebDriver,
+    *,
+    concurrency: int = 8,
+    rate_per_host: float = 2.0,
+    ready_timeout: Optional[float] = None,
+) -> ItemPageFetcher:
+    """
+    Make an item page fetcher working as a context manager.
+
+    :param kind: 'selenium' to fetch pages in the browser, or 'http' to fetch
+      pages over http with the cookies of the browser, which is used as the
+      fallback when a validation page is fetched
+    :param driver: the logged-in browser
+    :param concurrency: max number of concurrent requests of the http fetcher
+    :param rate_per_host: max requests per second to a host of the http fetcher
+    :param ready_timeout: see `fetch_item_page`
+    """
+    if kind == "selenium":
+        return SeleniumItemPageFetcher(driver, ready_timeout)
+
+    if kind == "http":
+        # imported here as aiohttp is only needed by the http fetcher
+        from scrape_taobao.core.http_fetch_item_page import HttpItemPageFetcher
+
+        return HttpItemPageFetcher(
+            export_login_cookies(driver),
+            concurrency=concurrency,
+            rate_per_host=rate_per_host,
+            fallback=SeleniumItemPageFetcher(driver, ready_timeout).fetch,
+        )
+
+    raise ValueError("unsupported fetcher: {}".format(kind))
+
+
 def scrape_one_impl(
     url: str,
-    driver: WebDriver,
+    fetcher: ItemPageFetcher,
     *,
     out_dir: str = ITEMS_DIR,
     pages_dir: str = PAGES_DIR,
     fmt: str = "yaml",
     download_only: bool = False,
     no_cache: bool = False,
+    fast: bool = False,
+    store: Optional[ItemStore] = None,
+    page_cache: Optional[PageCache] = None,
+    manifest: Optional[ParseManifest] = None,
+    metrics: Optional[Metrics] = None,
+    history: Optional[ItemHistory] = None,
+    archive: Optional[PageArchiveWriter] = None,
+    parse_stage: Optional[ParseStage] = None,
     log=logger.info,
-):
+) -> bool:
     """
     Scrape a single item page from the given url.
 
     See also the docstring of `scrape_one`.
+
+    :param store: the store to save the item to, default to the file store
+      of `out_dir` and `fmt`
+    :param page_cache: the cache of the page sources, default to the dir
+      cache of `pages_dir`
+    :param manifest: the manifest to record the parsing to. An existing item is
+      re-parsed from its cached page if the manifest tells it is outdated,
+      e.g. the parser has been updated
+    :param metrics: the metrics to record the stages, the cache hits and the
+      outcome to
+    :param history: the history to record a snapshot of the item to, each
+      time its page is fetched
+    :param archive: the archive to write the freshly fetched page to
+    :param parse_stage: the stage to hand the caching, the parsing and the
+      saving of the fetched page over to, instead of doing them in place. The
+      errors of them are then reported by the stage rather than raised
+    :return: whether the page is handed over to the parse stage
     """
-    item_id = url[url.index("id=") :]
-    page_filepath = os.path.join(pages_dir, "{}.html".format(item_id))
-    out_filepath = os.path.join(out_dir, "{}.{}".format(item_id, fmt))
+    item_id = canonical_item_id(url)
+    if item_id is None:
+        raise ValueError('no item id in "{}"'.format(url))
+    store = store or FileItemStore(out_dir, fmt=fmt)
+    page_cache = page_cache or DirPageCache(pages_dir)
+    metrics = metrics or Metrics()
 
-    # skip if item file exists
-    if not no_cache and os.path.exists(out_filepath):
-        log('skip scrape "{}" as existing'.format(item_id))
-        return
+    # skip if item exists and is up to date
+    if not no_cache and store.exists(item_id):
+        reason = (
+            manifest.check(item_id)
+            if manifest is not None and not download_only
+            else None
+        )
+        if reason is None or item_id not in page_cache:
+            metrics.inc("cache_total", cache="item", result="hit")
+            metrics.inc("items_total", outcome="skipped")
+            log('skip scrape "{}" as existing'.format(item_id))
+            return False
+
+        log('re-parse "{}" as {}'.format(item_id, reason))
 
-    # skip if page source file exists
-    if not no_cache and os.path.exists(page_filepath):
-        # load page source
-        page_source = open(page_filepath).read()
+    if not no_cache:
+        metrics.inc("cache_total", cache="item", result="miss")
 
+    # skip if page source is cached
+    page_source = None
+    if not no_cache:
+        with metrics.timer("cache_read"):
+            page_source = page_cache.get(item_id)
+        metrics.inc(
+            "cache_total",
+            cache="page",
+            result="miss" if page_source is None else "hit",
+        )
+
+    fetched_at = None
+    if page_source is not None:
         log('skip fetch "{}" as existing'.format(item_id))
 
     else:
+        fetched_at = time.time()
         try:
             # fetch page source
-            page_source = fetch_item_page(driver, url)
+            with metrics.timer("fetch"):
+                page_source = fetcher.fetch(url)
         except Exception as e:
+            metrics.fail("fetch", e)
+            metrics.inc("items_total", outcome="failed")
             log('failed to fetch "{}": {}'.format(url, e))
             raise
 
-        log('fetched "{}" - {}'.format(item_id, driver.title))
+        log('fetched "{}" - {}'.format(item_id, page_title(page_source)))
 
-        if not no_cache:
-            with open(page_filepath, "w+") as f:
-                f.write(page_source)
+    save_and_parse = functools.partial(
+        _save_and_parse,
+        url,
+        item_id,
+        page_source,
+        fetched_at,
+        download_only=download_only,
+        no_cache=no_cache,
+        fast=fast,
+        store=store,
+        page_cache=page_cache,
+        manifest=manifest,
+        metrics=metrics,
+        history=history,
+        archive=archive,
+        log=log,
+    )
+    if parse_stage is None or download_only:
+        save_and_parse()
+        return False
 
-    if not download_only:
-        try:
-            # parse page source
-            item = parse_item_page(page_source)
-        except Exception as e:
-            log('failed to parse "{}": {}'.format(url, e))
-            raise
+    parse_stage.submit(url, save_and_parse)
+    return True
+
+
+def _save_and_parse(
+    url: str,
+    item_id: str,
+    page_source: str,
+    fetched_at: Optional[float],
+    *,
+    download_only: bool,
+    no_cache: bool,
+    fast: bool,
+    store: ItemStore,
+    page_cache: PageCache,
+    manifest: Optional[ParseManifest],
+    metrics: Metrics,
+    history: Optional[ItemHistory],
+    archive: Optional[PageArchiveWriter],
+    log,
+):
+    """
+    Parse the page source and save the item, and cache and archive the page
+    source if freshly fetched, i.e. the part of `scrape_one_impl` after
+    fetching.
+
+    A freshly fetched page is only cached once it is parsed, so that a junk
+    page, e.g. a truncated one, never hides the item page from the later
+    scrapes. It is cached at once if only downloading, as the fetchers have
+    rejected the pages that are surely junk.
+    """
+    save_page = functools.partial(
+        _save_page,
+        url,
+        item_id,
+        page_source,
+        fetched_at,
+        no_cache=no_cache,
+        page_cache=page_cache,
+        archive=archive,
+        metrics=metrics,
+    )
+    if download_only:
+        save_page()
+        metrics.inc("items_total", outcome="fetched")
+        return
+
+    try:
+        # parse page source
+        item = parse_page_impl(
+            item_id,
+            page_source,
+            store,
+            log=log,
+            fast=fast,
+            manifest=manifest,
+            metrics=metrics,
+        )
+    except Exception as e:
+        metrics.inc("items_total", outcome="failed")
+        log('failed to parse "{}": {}'.format(url, e))
+        raise
+
+    save_page()
+    metrics.inc("items_total", outcome="parsed")
+
+    if history is not None and fetched_at is not None:
+        history.record(item_id, item, scraped_at=fetched_at)
+
+
+def _save_page(
+    url: str,
+    item_id: str,
+    page_source: str,
+    fetched_at: Optional[float],
+    *,
+    no_cache: bool,
+    page_cache: PageCache,
+    archive: Optional[PageArchiveWriter],
+    metrics: Metrics,
+):
+    """
+    Cache and archive the page source if freshly fetched.
+    """
+    if fetched_at is None:
+        return
+
+    if not no_cache:
+        with metrics.timer("cache_write"):
+            page_cache.put(item_id, page_source)
 
-        dump(dataclasses.asdict(item), out_filepath, fmt=fmt)
+    if archive is not None:
+        with metrics.timer("archive_write"):
+            archive.put(item_id, page_source, url=url, fetched_at=fetched_at)
@@ -0,0 +1,498 @@
+import functools
+import json
+import math
+import os
+import queue
+import socketserver
+import threading
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from scrape_taobao.bean.item_data import item_to_dict
+from scrape_taobao.commands import (
+    HISTORY_PATH,
+    ITEMS_DIR,
+    PAGES_DIR,
+    SESSION_PATH,
+    logger,
+)
+from scrape_taobao.commands.parse_one import parse_page_impl
+from scrape_taobao.commands.scrape_one import scrape_one_impl
+from scrape_taobao.core.fetch_item_page import SeleniumItemPageFetcher
+from scrape_taobao.core.fetch_profile import (
+    FetchProfile,
+    block_resources,
+    get_fetch_profile,
+    open_chrome,
+)
+from scrape_taobao.core.hack import hide_browser_features, prompt_credentials
+from scrape_taobao.core.parse_item_page import parse_item_page
+from scrape_taobao.core.session import login_with_session
+from scrape_taobao.history import ItemHistory, open_history
+from scrape_taobao.item_list import canonical_item_id, item_url
+from scrape_taobao.jobs import PARSE, SCRAPE, Job, JobBoard
+from scrape_taobao.manifest import ParseManifest, open_manifest
+from scrape_taobao.metrics import Metrics
+from scrape_taobao.pacing import AdaptivePacer, PacedItemPageFetcher
+from scrape_taobao.page_cache import PageCache, open_page_cache
+from scrape_taobao.pipeline import ParseStage
+from scrape_taobao.store import ItemStore, open_item_store
+
+
+def serve(
+    *,
+    host: str = "127.0.0.1",
+    port: int = 8800,
+    socket: Optional[str] = None,
+    out_dir: str = ITEMS_DIR,
+    pages_dir: str = PAGES_DIR,
+    fmt: str = "yaml",
+    fast: bool = False,
+    browsers: int = 1,
+    parse_workers: int = 1,
+    login: bool = True,
+    session: str = SESSION_PATH,
+    store: str = "file",
+    page_cache: str = "dir",
+    profile: str = "default",
+    history: str = HISTORY_PATH,
+):
+    """
+    启动常驻的抓取服务，通过本地 http 接口提交抓取和解析任务。
+
+    服务启动时打开并登录指定数量的浏览器，之后一直复用，因此每个抓取任务只需加载
+    一次页面，而无需重新启动浏览器和登录。接口如下，请求和响应均为 json：
+
+      - `POST /jobs`：提交任务，如 `{"kind": "scrape", "url": "<url>"}`，可选
+        `"no_cache": true` 以重新抓取；或 `{"kind": "parse", "item": "<id>"}`
+        解析已缓存的页面，可选 `"page_source"` 以解析给定的页面源码，此时可省略
+        `item`，解析结果不保存。返回任务信息；
+      - `GET /jobs/<id>`：查询任务状态和结果（即商品信息）；
+      - `GET /jobs`：列出任务，可以通过 `?state=` 按状态过滤；
+      - `GET /items/<id>`：查询已保存的商品信息；
+      - `GET /health`：查询可用的浏览器数量和各状态的任务数量；
+      - `GET /metrics`：Prometheus 格式的抓取指标。
+
+    提交和查询任务时，可以通过 `?wait=<seconds>` 等待任务完成后再返回。
+
+    :param host: 监听地址
+    :param port: 监听端口
+    :param socket: Unix socket 路径，若指定则监听该 socket 而不监听 `host` 和 `port`
+    :param out_dir: 输出目录，默认为 '<project-root>/cache/items'
+    :param pages_dir: 页面源码目录，默认为 '<project-root>/cache/pages'
+    :param fmt: 输出格式，支持 'json' 和 'yaml'
+    :param fast: 是否优先直接从页面源码中抽取商品信息，而不构建完整的页面树
+    :param browsers: 常驻的浏览器数量，默认为 1
+    :param parse_workers: 执行解析任务的线程数，默认为 1
+    :param login: 是否登录，从本地页面服务（见 `serve-pages` 命令）抓取时可关闭
+    :param session: 登录会话文件，默认为 '<project-root>/cache/session.json'，
+      若其中保存的会话仍有效，则跳过登录；设为空字符串则不保存、不复用会话
+    :param store: 商品信息存储方式，详见 `scrape` 命令
+    :param page_cache: 页面源码缓存方式，详见 `scrape` 命令
+    :param profile: 浏览器抓取配置，支持 'default' 和 'lean'，详见 `scrape` 命令
+    :param history: 商品历史数据库，默认为 '<project-root>/cache/history.sqlite'，
+      详见 `scrape` 命令
+    """
+    os.makedirs(pages_dir, exist_ok=True)
+    os.makedirs(out_dir, exist_ok=True)
+
+    if login and not (session and os.path.exists(session)):
+        # prompt before starting the browsers if there is surely no session
+        prompt_credentials()
+
+    item_store = open_item_store(store, out_dir, fmt=fmt)
+    pages = open_page_cache(page_cache, pages_dir)
+    manifest = open_manifest(out_dir)
+    item_history = open_history(history)
+
+    daemon = _ScrapeDaemon(
+        browsers=max(1, browsers),
+        parse_workers=max(1, parse_workers),
+        login=login,
+        session_path=session or None,
+        fetch_profile=get_fetch_profile(profile),
+        fast=fast,
+        store=item_store,
+        page_cache=pages,
+        manifest=manifest,
+        history=item_history,
+    )
+
+    with item_store, pages, manifest, item_history or nullcontext():
+        server = make_jobs_server(daemon, host=host, port=port, socket=socket)
+        daemon.start()
+        logger.info(
+            "serving jobs at {}".format(
+                socket or "http://{}:{}".format(*server.server_address)
+            )
+        )
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.warning("interrupted, waiting for the jobs to stop...")
+        finally:
+            server.server_close()
+            daemon.stop()
+            if socket and os.path.exists(socket):
+                os.remove(socket)
+
+
+def make_jobs_server(
+    daemon: "_ScrapeDaemon",
+    host: str = "127.0.0.1",
+    port: int = 8800,
+    socket: Optional[str] = None,
+) -> socketserver.BaseServer:
+    """
+    Create a threading http server of the job api of the daemon, listening on
+    the unix socket if given, or on the host and the port otherwise.
+    """
+    handler = functools.partial(_JobsRequestHandler, daemon=daemon)
+    if socket:
+        if os.path.exists(socket):
+            os.remove(socket)
+        return _ThreadingUnixHTTPServer(socket, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+class _ScrapeDaemon:
+    """
+    Runs the jobs with warm browsers.
+
+    Each browser is opened, patched and logged in once, by its own thread,
+    which then runs the scrape jobs from the shared queue one by one, paced by
+    a shared pacer. The parse jobs need no browser, and run in a parse stage
+    instead.
+    """
+
+    def __init__(
+        self,
+        *,
+        browsers: int,
+        parse_workers: int,
+        login: bool,
+        session_path: Optional[str],
+        fetch_profile: FetchProfile,
+        fast: bool,
+        store: ItemStore,
+        page_cache: PageCache,
+        manifest: ParseManifest,
+        history: Optional[ItemHistory],
+    ):
+        self.browsers = browsers
+        self.parse_workers = parse_workers
+        self.login_enabled = login
+        self.session_path = session_path
+        self.fetch_profile = fetch_profile
+        self.fast = fast
+        self.store = store
+        self.page_cache = page_cache
+        self.manifest = manifest
+        self.history = history
+
+        self.jobs = JobBoard()
+        self.metrics = Metrics()
+        self.pacer = AdaptivePacer.from_env(browsers)
+        self.scrape_queue = queue.Queue()
+        self.parse_stage = None
+
+        self.threads = []
+        self.ready_browsers = 0
+        self.lock = threading.Lock()
+        # the browsers log in one by one, so that the first one saves the
+        # session and the others restore it
+        self.login_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.parse_stage = ParseStage(
+            self.parse_workers,
+            max_pending=1024,
+            metrics=self.metrics,
+        )
+        self.threads = [
+            threading.Thread(
+                target=self.work,
+                args=(i,),
+                name="browser-{}".format(i),
+                daemon=True,
+            )
+            for i in range(self.browsers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stop the browsers once their current jobs are done, and wait for the
+        queued parse jobs.
+        """
+        self.stopped.set()
+        for _ in self.threads:
+            self.scrape_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.parse_stage is not None:
+            self.parse_stage.close()
+
+    def submit(self, request: dict) -> Job:
+        """
+        Submit a job as requested.
+
+        :raise ValueError: if the request is invalid
+        """
+        kind = request.get("kind")
+        if kind == SCRAPE:
+            url = str(request.get("url") or "")
+            if canonical_item_id(url) is None:
+                raise ValueError('no item id in "{}"'.format(url))
+
+            job = self.jobs.add(
+                SCRAPE,
+                item_url(url),
+                dict(no_cache=bool(request.get("no_cache"))),
+            )
+            self.scrape_queue.put(job)
+            return job
+
+        if kind == PARSE:
+            page_source = request.get("page_source")
+            item_id = canonical_item_id(str(request.get("item") or ""))
+            if item_id is None and page_source is None:
+                raise ValueError("either item or page_source is required")
+
+            job = self.jobs.add(
+                PARSE, item_id or "", dict(page_source=page_source)
+            )
+            self.parse_stage.submit(job.id, functools.partial(self.parse, job))
+            return job
+
+        raise ValueError("unsupported job kind: {}".format(kind))
+
+    def health(self) -> dict:
+        with self.lock:
+            ready_browsers = self.ready_browsers
+        return dict(
+            browsers=self.browsers,
+            ready_browsers=ready_browsers,
+            jobs=self.jobs.counts(),
+        )
+
+    def work(self, index: int):
+        try:
+            with self.open_browser(index) as fetcher:
+                with self.lock:
+                    self.ready_browsers += 1
+                logger.info("browser {} is ready".format(index))
+
+                try:
+                    while True:
+                        job = self.scrape_queue.get()
+                        if job is None:
+                            break
+                        self.scrape(job, fetcher)
+                finally:
+                    with self.lock:
+                        self.ready_browsers -= 1
+
+        except Exception as e:
+            # the queued jobs are left to the other browsers
+            logger.exception("browser {} stopped: {}".format(index, e))
+
+    @contextmanager
+    def open_browser(self, index: int):
+        with open_chrome(self.fetch_profile) as driver:
+            hide_browser_features(driver)
+            if self.login_enabled:
+                with self.login_lock, self.metrics.timer("login"):
+                    login_with_session(driver, self.session_path)
+            block_resources(driver, self.fetch_profile)
+
+            yield PacedItemPageFetcher(
+                SeleniumItemPageFetcher(
+                    driver, self.fetch_profile.ready_timeout
+                ),
+                self.pacer,
+                self.stopped,
+                self.metrics,
+            )
+
+    def scrape(self, job: Job, fetcher: PacedItemPageFetcher):
+        self.jobs.start(job)
+        try:
+            scrape_one_impl(
+                job.target,
+                fetcher,
+                no_cache=job.options["no_cache"],
+                fast=self.fast,
+                store=self.store,
+                page_cache=self.page_cache,
+                manifest=self.manifest,
+                metrics=self.metrics,
+                history=self.history,
+            )
+            item = self.store.get(canonical_item_id(job.target))
+        except Exception as e:
+            logger.error('failed to scrape "{}": {}'.format(job.target, e))
+            self.jobs.finish(job, error=e)
+        else:
+            self.jobs.finish(job, result=item)
+
+    def parse(self, job: Job):
+        self.jobs.start(job)
+        try:
+            page_source = job.options["page_source"]
+            if not job.target:
+                # a page source without an item id is parsed only
+                with self.metrics.timer("parse"):
+                    item = item_to_dict(
+                        parse_item_page(page_source, fast=self.fast)
+                    )
+            else:
+                if page_source is None:
+                    with self.metrics.timer("cache_read"):
+                        page_source = self.page_cache.get(job.target)
+                    if page_source is None:
+                        raise KeyError(
+                            'no cached page of "{}"'.format(job.target)
+                        )
+
+                item = parse_page_impl(
+                    job.target,
+                    page_source,
+                    self.store,
+                    fast=self.fast,
+                    manifest=self.manifest,
+                    metrics=self.metrics,
+                )
+        except Exception as e:
+            logger.error('failed to parse "{}": {}'.format(job.target, e))
+            self.jobs.finish(job, error=e)
+        else:
+            self.jobs.finish(job, result=item)
+
+
+class _ThreadingUnixHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+
+class _JobsRequestHandler(BaseHTTPRequestHandler):
+    def __init__(self, *args, daemon: _ScrapeDaemon, **kwargs):
+        self.daemon = daemon
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+
+        if parts == ["health"]:
+            self.send_json(200, self.daemon.health())
+
+        elif parts == ["metrics"]:
+            self.send_body(
+                200,
+                self.daemon.metrics.to_prometheus().encode(),
+                "text/plain; version=0.0.4",
+            )
+
+        elif parts == ["jobs"]:
+            state = query.get("state", [None])[0]
+            self.send_json(
+                200,
+                [
+                    job.to_dict(with_result=False)
+                    for job in self.daemon.jobs.list(state)
+                ],
+            )
+
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self.daemon.jobs.get(parts[1])
+            if job is None:
+                self.send_json(404, dict(error="no such job"))
+                return
+            try:
+                wait = self.wait_seconds(query)
+            except ValueError as e:
+                self.send_json(400, dict(error=str(e)))
+                return
+            self.wait(job, wait)
+            self.send_json(200, job.to_dict())
+
+        elif len(parts) == 2 and parts[0] == "items":
+            item_id = canonical_item_id(parts[1])
+            item = self.daemon.store.get(item_id) if item_id else None
+            if item is None:
+                self.send_json(404, dict(error="no such item"))
+                return
+            self.send_json(200, item)
+
+        else:
+            self.send_json(404, dict(error="not found"))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.strip("/") != "jobs":
+            self.send_json(404, dict(error="not found"))
+            return
+
+        try:
+            # checked before submitting, so that a bad request submits nothing
+            wait = self.wait_seconds(parse_qs(url.query))
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("the request should be a json object")
+            job = self.daemon.submit(request)
+        except ValueError as e:
+            self.send_json(400, dict(error=str(e)))
+            return
+
+        self.wait(job, wait)
+        self.send_json(202 if not job.finished.is_set() else 200, job.to_dict())
+
+    @staticmethod
+    def wait_seconds(query: dict) -> Optional[float]:
+        """
+        Get the seconds to wait for the job from the query, None if not given.
+
+        :raise ValueError: if it is not a non-negative finite number
+        """
+        wait = query.get("wait")
+        if not wait:
+            return None
+
+        try:
+            seconds = float(wait[0])
+        except ValueError:
+            seconds = math.nan
+        # false for nan too
+        if not 0 <= seconds < math.inf:
+            raise ValueError(
+                'wait should be a number of seconds, got "{}"'.format(wait[0])
+            )
+        return min(seconds, threading.TIMEOUT_MAX)
+
+    @staticmethod
+    def wait(job: Job, seconds: Optional[float]):
+        if seconds is not None:
+            job.finished.wait(seconds)
+
+    def send_json(self, status: int, data):
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self.send_body(status, body, "application/json; charset=utf-8")
+
+    def send_body(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt % args)
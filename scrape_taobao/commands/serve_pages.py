@@ -0,0 +1,71 @@
+import os
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from scrape_taobao.commands import PAGES_DIR, logger
+
+
+def serve_pages(pages_dir: str = PAGES_DIR, *, host="127.0.0.1", port=8000):
+    """
+    启动本地页面服务，用已缓存的页面源码模拟商品页面。
+
+    对于任意形如 'http://<host>:<port>/item.htm?id=<id>' 的请求，返回页面源码
+    '<pages_dir>/id=<id>.html'。配合 `scrape --no-login` 使用，可以在离线环境下
+    测试抓取流程。
+
+    :param pages_dir: 页面源码目录，默认为 '<project-root>/cache/pages'
+    :param host: 监听地址
+    :param port: 监听端口
+    """
+    server = make_pages_server(pages_dir, host=host, port=port)
+    logger.info(
+        'serving "{}" at http://{}:{}'.format(pages_dir, *server.server_address)
+    )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def make_pages_server(pages_dir: str, host="127.0.0.1", port=8000):
+    """
+    Create a threading http server serving the cached item pages.
+
+    Use port 0 to bind to a random free port.
+    """
+    handler = partial(_PagesRequestHandler, pages_dir=pages_dir)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+class _PagesRequestHandler(BaseHTTPRequestHandler):
+    def __init__(self, *args, pages_dir: str, **kwargs):
+        self.pages_dir = pages_dir
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        item_ids = parse_qs(urlparse(self.path).query).get("id")
+        page_path = (
+            os.path.join(self.pages_dir, "id={}.html".format(item_ids[0]))
+            if item_ids and item_ids[0].isdigit()
+            else None
+        )
+
+        if not page_path or not os.path.exists(page_path):
+            self.send_error(404)
+            return
+
+        with open(page_path, "rb") as f:
+            body = f.read()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt % args)
@@ -0,0 +1,349 @@
+"""
+Extract item data straight from the raw page source.
+
+Instead of building the whole html tree as `parse_item_page` does, the page is
+scanned once with a single regex to locate the few nodes and scripts the item
+data comes from. Only the fragments of those nodes are processed afterwards.
+
+The extracted data is the same as the one of the tree based parsers. Whenever
+a page is not understood, `extract_item_page` returns None so that the caller
+can fall back to the tree based parsers.
+"""
+import functools
+import html
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+from scrape_taobao.bean.item_data import ItemChoiceData, ItemData
+from scrape_taobao.core.parse_item_page import (
+    build_taobao_choices,
+    extract_tmall_sku_state,
+)
+
+logger = logging.getLogger(__name__)
+
+# the ids of the nodes to locate
+TARGET_IDS = ("J_StrPrice", "J_SpanStock", "J_SellCounter", "J_ServiceMarkInfo")
+
+# the classes of the nodes to locate, the value tells if the class should be
+# matched exactly or by prefix
+TARGET_CLASSES = {
+    "attributes-list": True,
+    "delivery-info": True,
+    "ItemDetail--attrs--": False,
+    "Price--priceText--": False,
+    "ItemHeader--salesDesc--": False,
+}
+
+# the scripts, styles and comments are matched as a whole, so that the ids and
+# classes in them, e.g. in the strings of a script, are never taken as nodes
+RX_SCAN = re.compile(
+    r"(?P<invisible><!--.*?-->|<script\b.*?</script\s*>|<style\b.*?</style\s*>)"
+    r"|<title\b[^>]*>(?P<title>.*?)</title>"
+    r"|skuMap\s*:(?P<sku>[^\n]*)$"
+    r"|propertyMemoMap\s*:(?P<mem>[^\n]*)$"
+    r"|\bid\s*=\s*[\"'](?P<id>{ids})[\"']"
+    r"|\bclass\s*=\s*[\"'](?P<cls>[^\"']*(?:{classes})[^\"']*)[\"']".format(
+        ids="|".join(TARGET_IDS),
+        classes="|".join(re.escape(c) for c in TARGET_CLASSES),
+    ),
+    re.MULTILINE | re.DOTALL | re.IGNORECASE,
+)
+# the embedded sku state, which is in the scripts
+RX_SCRIPT_SCAN = re.compile(
+    r"skuMap\s*:(?P<sku>[^\n]*)$|propertyMemoMap\s*:(?P<mem>[^\n]*)$",
+    re.MULTILINE,
+)
+RX_TAG_NAME = re.compile(r"<([a-zA-Z][\w-]*)")
+RX_CLASS_ATTR = re.compile(r"\bclass\s*=\s*[\"']([^\"']*)[\"']", re.IGNORECASE)
+RX_INVISIBLE = re.compile(
+    r"<!--.*?-->|<script\b.*?</script\s*>|<style\b.*?</style\s*>",
+    re.DOTALL | re.IGNORECASE,
+)
+RX_ANY_TAG = re.compile(r"<[^>]*>")
+RX_DIGITS = re.compile(r"\d+")
+
+
+class _Node:
+    """
+    A located node, holding the source of its start tag and its inner html.
+    """
+
+    def __init__(self, name: str, start_tag: str, inner: str):
+        self.name = name
+        self.start_tag = start_tag
+        self.inner = inner
+
+    @property
+    def text(self):
+        return _text(self.inner)
+
+    def find_all(self, name: str, class_: Optional[str] = None):
+        return list(_find_all(self.inner, name, class_))
+
+    def find(self, name: str, class_: Optional[str] = None):
+        return next(_find_all(self.inner, name, class_), None)
+
+
+def extract_item_page(page_source: str) -> Optional[ItemData]:
+    """
+    Extract the item data from the raw page source.
+
+    :param page_source: the page source
+    :return: the item data, or None if the page is not understood
+    """
+    try:
+        scanned = _scan(page_source)
+        if scanned is None:
+            return None
+
+        title, sku_str, mem_str, nodes = scanned
+        if "tmall.com" in title:
+            return _extract_tmall(title, nodes, page_source)
+        return _extract_taobao(title, sku_str, mem_str, nodes)
+
+    except Exception as e:
+        logger.debug("fast extraction failed: {}".format(e))
+        return None
+
+
+def _scan(
+    page_source: str,
+) -> Optional[Tuple[str, Optional[str], Optional[str], Dict[str, _Node]]]:
+    """
+    Scan the page once and collect the first occurrence of every target.
+    """
+    title = sku_str = mem_str = None
+    nodes = {}
+
+    for m in RX_SCAN.finditer(page_source):
+        if m.group("invisible") is not None:
+            for n in RX_SCRIPT_SCAN.finditer(page_source, *m.span()):
+                if n.group("sku") is not None and sku_str is None:
+                    sku_str = n.group("sku")
+                elif n.group("mem") is not None and mem_str is None:
+                    mem_str = n.group("mem")
+
+        elif m.group("title") is not None:
+            if title is None:
+                title = m.group("title")
+
+        elif m.group("sku") is not None:
+            if sku_str is None:
+                sku_str = m.group("sku")
+
+        elif m.group("mem") is not None:
+            if mem_str is None:
+                mem_str = m.group("mem")
+
+        elif m.group("id") is not None:
+            key = m.group("id")
+            if key not in nodes:
+                node = _node_around(page_source, m.start())
+                if node is not None:
+                    nodes[key] = node
+
+        else:
+            for token in m.group("cls").split():
+                key = _target_class(token)
+                if key is not None and key not in nodes:
+                    node = _node_around(page_source, m.start())
+                    if node is not None:
+                        nodes[key] = node
+
+    if title is None or RX_ANY_TAG.search(title):
+        return None
+
+    return html.unescape(title), sku_str, mem_str, nodes
+
+
+def _target_class(token: str) -> Optional[str]:
+    for cls, exact in TARGET_CLASSES.items():
+        if token == cls if exact else cls in token:
+            return cls
+    return None
+
+
+def _node_around(page_source: str, attr_pos: int) -> Optional[_Node]:
+    """
+    Locate the node whose start tag contains the attribute at the position.
+    """
+    tag_start = page_source.rfind("<", 0, attr_pos)
+    if tag_start < 0 or ">" in page_source[tag_start:attr_pos]:
+        # the attribute is not inside a tag, e.g. in a script
+        return None
+
+    m = RX_TAG_NAME.match(page_source, tag_start)
+    tag_end = page_source.find(">", attr_pos)
+    if not m or tag_end < 0:
+        return None
+
+    name = m.group(1).lower()
+    start_tag = page_source[tag_start : tag_end + 1]
+    inner = _inner_html(page_source, name, tag_end + 1)
+    return _Node(name, start_tag, inner)
+
+
+@functools.lru_cache(maxsize=None)
+def _rx_open_or_close(name: str):
+    return re.compile(
+        r"<(/?){}(?=[\s/>])[^>]*>".format(re.escape(name)), re.IGNORECASE
+    )
+
+
+def _inner_html(source: str, name: str, start: int, end: int = None) -> str:
+    """
+    Get the inner html of the node named `name` whose start tag ends right
+    before `start`, taking nested nodes of the same name into account.
+    """
+    end = len(source) if end is None else end
+    depth = 1
+    for m in _rx_open_or_close(name).finditer(source, start, end):
+        if m.group(1):
+            depth -= 1
+            if depth == 0:
+                return source[start : m.start()]
+        elif not m.group(0).endswith("/>"):
+            depth += 1
+    return source[start:end]
+
+
+def _find_all(source: str, name: str, class_: Optional[str] = None):
+    """
+    Find all the nodes named `name` in the html fragment, in document order.
+
+    :param class_: if given, only nodes having a class token containing it
+      will be yielded
+    """
+    for m in _rx_open_or_close(name).finditer(source):
+        if m.group(1):
+            continue
+
+        start_tag = m.group(0)
+        if class_ is not None:
+            classes = RX_CLASS_ATTR.search(start_tag)
+            if not classes or not any(
+                class_ in token for token in classes.group(1).split()
+            ):
+                continue
+
+        inner = _inner_html(source, name, m.end())
+        yield _Node(name, start_tag, inner)
+
+
+def _text(fragment: str) -> str:
+    return html.unescape(RX_ANY_TAG.sub("", RX_INVISIBLE.sub("", fragment)))
+
+
+def _extract_taobao(
+    title: str,
+    sku_str: Optional[str],
+    mem_str: Optional[str],
+    nodes: Dict[str, _Node],
+) -> ItemData:
+    details = {}
+    attrs = _node_named(nodes, "attributes-list", "ul")
+    if attrs is not None:
+        for attr in attrs.find_all("li"):
+            label, value = attr.text.split(":")
+            details[label.strip()] = value.strip()
+
+    delivery_days = nodes.get("J_ServiceMarkInfo")
+    delivery_info = delivery_days.text.strip() if delivery_days else "-"
+
+    choices: List[ItemChoiceData] = []
+    if sku_str is not None and mem_str is not None:
+        choices = build_taobao_choices(sku_str, mem_str)
+
+    if choices:
+        prices = [c.price for c in choices]
+        price_range = min(prices), max(prices)
+    elif "J_StrPrice" in nodes:
+        price_text = nodes["J_StrPrice"].find("em", class_="tb-rmb-num").text
+        prices = [float(p.strip()) for p in price_text.split("-")]
+        price_range = min(prices), max(prices)
+    else:
+        price_range = 0.0, 0.0
+
+    if choices:
+        total_stock = sum(c.stock for c in choices)
+    else:
+        stock = nodes.get("J_SpanStock")
+        total_stock = int(stock.text) if stock else 0
+
+    sell_counter = nodes.get("J_SellCounter")
+    sales = int(
+        sell_counter.text
+        if sell_counter and sell_counter.text not in ["-", ""]
+        else "0"
+    )
+
+    return ItemData(
+        platform="taobao",
+        title=title,
+        details=details,
+        delivery_info=delivery_info,
+        choices=choices,
+        price_range=price_range,
+        total_stock=total_stock,
+        sales=sales,
+    )
+
+
+def _extract_tmall(
+    title: str, nodes: Dict[str, _Node], page_source: str
+) -> ItemData:
+    choices, price_range, total_stock = extract_tmall_sku_state(page_source)
+
+    details = {}
+    attrs = _node_named(nodes, "ItemDetail--attrs--", "div")
+    if attrs is not None:
+        for attr in attrs.find_all("span", class_="Attrs--attr--"):
+            label, value = attr.text.split("：")
+            details[label.strip()] = value.strip()
+
+    delivery = _node_named(nodes, "delivery-info", "div")
+    if delivery is not None:
+        delivery_info = ";".join(
+            span.text for span in delivery.find_all("span")
+        )
+    else:
+        delivery_info = "-"
+
+    # fall back to the shown price, if there is no sku state
+    if price_range is None:
+        price = _node_named(nodes, "Price--priceText--", "span")
+        if price is not None:
+            price_range = float(price.text), float(price.text)
+        else:
+            price_range = 0.0, 0.0
+
+    sales = 0
+    sales_desc = _node_named(nodes, "ItemHeader--salesDesc--", "span")
+    if sales_desc is not None:
+        match = RX_DIGITS.search(sales_desc.text)
+        if match:
+            sales = int(match.group())
+
+    return ItemData(
+        platform="tmall",
+        title=title,
+        details=details,
+        delivery_info=delivery_info,
+        choices=choices,
+        price_range=price_range,
+        total_stock=total_stock or 0,
+        sales=sales,
+    )
+
+
+def _node_named(nodes: Dict[str, _Node], key: str, name: str):
+    node = nodes.get(key)
+    if node is None:
+        return None
+    if node.name != name:
+        # the first node with the class is not the expected one, which is
+        # beyond what the fast path handles
+        raise ValueError("unexpected <{}> for {}".format(node.name, key))
+    return node
@@ -1,16 +1,235 @@
+import html
+import json
 import logging
+import re
+from typing import Optional
 
+from selenium.common.exceptions import JavascriptException, TimeoutException
 from selenium.webdriver.remote.webdriver import WebDriver
+from selenium.webdriver.support.wait import WebDriverWait
 
 logger = logging.getLogger(__name__)
 
+RX_TITLE = re.compile(r"<title\b[^>]*>(?P<title>.*?)</title>", re.I | re.S)
+
+# markers of the pages asking for validation instead of the item page
+LOGIN_URL_MARKERS = ("login.jhtml", "login.taobao.com")
+CAPTCHA_URL_MARKERS = ("_____tmd_____",)
+VALIDATION_PAGE_MARKERS = ("nc_1_n1z", "x5secdata", "baxia-punish")
+
+# markers of the pages telling the item does not exist or is taken down,
+# which only count if there is none of the item page markers
+NOT_FOUND_URL_MARKERS = ("noitem.htm",)
+NOT_FOUND_PAGE_MARKERS = ("宝贝不存在", "宝贝已下架", "商品已下架")
+ITEM_PAGE_MARKERS = ("J_StrPrice", "Price--priceText")
+
+# an empty sku map is served instead of the real one when being throttled
+RX_EMPTY_SKU_MAP = re.compile(r"skuMap\s*:\s*\{\s*\}")
+
+# signals of the fetched pages, see `classify_page`
+PAGE_CLEAN = "clean"
+PAGE_LOGIN = "login"
+PAGE_CAPTCHA = "captcha"
+PAGE_EMPTY_SKU = "empty_sku"
+PAGE_NOT_FOUND = "not_found"
+PAGE_ERROR = "error"
+
+# marks the document of the previous page, which may still be there right
+# after `driver.get` with the 'none' page load strategy
+MARK_STALE_PAGE_JS = "window.__staleItemPage = true;"
+
+# whether the nodes needed by the parsers exist, i.e. the sku map script and
+# the price of taobao, or the rendered price of tmall; or the page is a login
+# or validation one, or is fully loaded, which will never get them
+ITEM_PAGE_READY_JS = """
+if (window.__staleItemPage) return false;
+var markers = %s;
+for (var i = 0; i < markers.length; i++) {
+  if (location.href.indexOf(markers[i]) >= 0) return true;
+}
+if (document.querySelector('[class*="Price--priceText"]')) return true;
+if (document.getElementById('J_StrPrice')) {
+  for (var j = 0; j < document.scripts.length; j++) {
+    if (document.scripts[j].text.indexOf('skuMap') >= 0) return true;
+  }
+}
+return document.readyState === 'complete';
+""" % json.dumps(
+    list(LOGIN_URL_MARKERS + CAPTCHA_URL_MARKERS)
+)
+
+
+class JunkPageError(Exception):
+    """
+    Raised when another page is fetched instead of the item page, so that it
+    is never cached as the item page.
+
+    :param signal: the signal of the page, see `classify_page`
+    """
+
+    def __init__(self, message: str, signal: str):
+        super().__init__(message)
+        self.signal = signal
+
+
+class ValidationPageError(JunkPageError):
+    """
+    Raised when a login or validation page is fetched instead of the item
+    page, or the sku map is emptied by the throttling.
+    """
+
+    def __init__(self, message: str, signal: str = PAGE_CAPTCHA):
+        super().__init__(message, signal)
+
+
+class ItemNotFoundError(JunkPageError):
+    """
+    Raised when the item does not exist or is taken down.
+    """
+
+    def __init__(self, message: str):
+        super().__init__(message, PAGE_NOT_FOUND)
+
+
+def fetch_item_page(
+    driver: WebDriver, url: str, ready_timeout: Optional[float] = None
+):
+    """
+    :param ready_timeout: max seconds to wait for the nodes needed by the
+      parsers, see `wait_for_item_page`; None to take the page source once
+      `driver.get` returns
+    """
+    if ready_timeout is not None:
+        driver.execute_script(MARK_STALE_PAGE_JS)
 
-def fetch_item_page(driver: WebDriver, url: str):
     driver.get(url)
-    _detect_validation_and_skip_it(driver)
-    return driver.page_source
+    if ready_timeout is not None:
+        wait_for_item_page(driver, ready_timeout)
+
+    # serialized by the browser on each access, so taken once
+    page_source = driver.page_source
+    _detect_junk_and_skip_it(driver, page_source)
+    return page_source
+
+
+def wait_for_item_page(driver: WebDriver, timeout: float):
+    """
+    Wait until the nodes needed by the parsers exist, without waiting for the
+    rest of the page, e.g. the images and the tracking scripts.
+
+    The page source is taken anyway on timeout, as the parsers may still make
+    something out of it.
+    """
+    try:
+        # the script may fail while the browser is navigating
+        WebDriverWait(
+            driver,
+            timeout,
+            poll_frequency=0.1,
+            ignored_exceptions=(JavascriptException,),
+        ).until(lambda d: d.execute_script(ITEM_PAGE_READY_JS))
+    except TimeoutException:
+        logger.warning(
+            'item page "{}" not ready in {}s'.format(
+                driver.current_url, timeout
+            )
+        )
+
+
+def _detect_junk_and_skip_it(driver: WebDriver, page_source: str):
+    """
+    Raise `JunkPageError` to skip the item if the browser is stuck at a login
+    or validation page, the sku map is emptied, or the item is not found, so
+    that the page is never cached as the item page.
+
+    :param page_source: the page source taken from the browser
+    """
+    raise_if_junk(driver.current_url, page_source)
+
+
+def raise_if_junk(url: str, page_source: str):
+    """
+    Raise `ItemNotFoundError` if the item is not found, or
+    `ValidationPageError` if the page is not clean otherwise.
+    """
+    signal = classify_page(url, page_source)
+    if signal == PAGE_NOT_FOUND:
+        raise ItemNotFoundError('item not found at "{}"'.format(url))
+    if signal != PAGE_CLEAN:
+        raise ValidationPageError(
+            '{} page fetched for "{}"'.format(
+                "empty sku" if signal == PAGE_EMPTY_SKU else "validation", url
+            ),
+            signal,
+        )
+
+
+class ItemPageFetcher:
+    """
+    Fetcher of item pages, see `SeleniumItemPageFetcher` and
+    `HttpItemPageFetcher` for the implementations.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def fetch(self, url: str) -> str:
+        """
+        Fetch the page source of the item page.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SeleniumItemPageFetcher(ItemPageFetcher):
+    """
+    Fetch item pages by loading them in the browser.
+
+    :param ready_timeout: see `fetch_item_page`
+    """
+
+    def __init__(
+        self, driver: WebDriver, ready_timeout: Optional[float] = None
+    ):
+        self.driver = driver
+        self.ready_timeout = ready_timeout
+
+    def fetch(self, url: str) -> str:
+        return fetch_item_page(self.driver, url, self.ready_timeout)
+
+
+def classify_page(url: str, page_source: str) -> str:
+    """
+    Tell how the server responds from the fetched page.
+
+    :param url: the final url of the page, after redirections
+    :param page_source: the page source
+    :return: one of the signals, i.e. `PAGE_LOGIN` if redirected to the login
+      page, `PAGE_CAPTCHA` for the slider captcha or the other validations,
+      `PAGE_NOT_FOUND` if the item does not exist or is taken down,
+      `PAGE_EMPTY_SKU` if the sku map is emptied, otherwise `PAGE_CLEAN`
+    """
+    if any(marker in url for marker in LOGIN_URL_MARKERS):
+        return PAGE_LOGIN
+    if any(marker in url for marker in CAPTCHA_URL_MARKERS):
+        return PAGE_CAPTCHA
+    if any(marker in page_source for marker in VALIDATION_PAGE_MARKERS):
+        return PAGE_CAPTCHA
+    if any(marker in url for marker in NOT_FOUND_URL_MARKERS) or (
+        any(marker in page_source for marker in NOT_FOUND_PAGE_MARKERS)
+        and not any(marker in page_source for marker in ITEM_PAGE_MARKERS)
+    ):
+        return PAGE_NOT_FOUND
+    if RX_EMPTY_SKU_MAP.search(page_source):
+        return PAGE_EMPTY_SKU
+    return PAGE_CLEAN
 
 
-def _detect_validation_and_skip_it(_: WebDriver):
-    # it seems no need to handle it as the page can still be fetched
-    pass
+def page_title(page_source: str) -> Optional[str]:
+    m = RX_TITLE.search(page_source)
+    return html.unescape(m.group("title")).strip() if m else None
@@ -0,0 +1,125 @@
+"""
+Profiles of the browsers fetching the item pages.
+
+The default profile loads the pages as a visible browser does, waiting for
+every image, font and tracking script. The lean profile runs headless, returns
+from `driver.get` once the document is parsed, blocks the images, media, fonts
+and styles, and takes the page source as soon as the nodes needed by the
+parsers exist, which cuts much of the latency and the bandwidth of each page.
+"""
+import dataclasses
+from typing import Optional, Tuple
+
+from selenium import webdriver
+
+# resources never needed by the parsers, in the wildcard patterns of
+# `Network.setBlockedURLs`
+BLOCKED_IMAGE_URLS = (
+    "*.jpg*",
+    "*.jpeg*",
+    "*.png*",
+    "*.gif*",
+    "*.webp*",
+    "*.avif*",
+    "*.svg*",
+    "*.ico*",
+)
+BLOCKED_MEDIA_URLS = ("*.mp4*", "*.webm*", "*.m3u8*", "*.flv*", "*.mp3*")
+BLOCKED_FONT_URLS = ("*.woff*", "*.woff2*", "*.ttf*", "*.otf*", "*.eot*")
+BLOCKED_STYLE_URLS = ("*.css*",)
+BLOCKED_URLS = (
+    BLOCKED_IMAGE_URLS
+    + BLOCKED_MEDIA_URLS
+    + BLOCKED_FONT_URLS
+    + BLOCKED_STYLE_URLS
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class FetchProfile:
+    """
+    How the browser is set up to fetch the item pages.
+
+    :param headless: whether to run the browser headless
+    :param page_load_strategy: 'normal' to wait for all the resources, 'eager'
+      to wait for the document to be parsed only, or 'none' to not wait
+    :param blocked_urls: patterns of the urls never to load
+    :param ready_timeout: max seconds to wait for the nodes needed by the
+      parsers after `driver.get`, None to take the page source right away
+    """
+
+    headless: bool = False
+    page_load_strategy: str = "normal"
+    blocked_urls: Tuple[str, ...] = ()
+    ready_timeout: Optional[float] = None
+
+
+FETCH_PROFILES = {
+    "default": FetchProfile(),
+    "lean": FetchProfile(
+        headless=True,
+        page_load_strategy="eager",
+        blocked_urls=BLOCKED_URLS,
+        ready_timeout=15.0,
+    ),
+}
+
+
+def get_fetch_profile(profile: str) -> FetchProfile:
+    """
+    Get the fetch profile by name.
+
+    :param profile: 'default', 'lean', or 'lean:<page-load-strategy>' such as
+      'lean:none' to not wait for the document either
+    """
+    name, _, strategy = profile.partition(":")
+    if name not in FETCH_PROFILES:
+        raise ValueError("unsupported fetch profile: {}".format(profile))
+
+    fetch_profile = FETCH_PROFILES[name]
+    if strategy:
+        if strategy not in ("normal", "eager", "none"):
+            raise ValueError(
+                "unsupported page load strategy: {}".format(strategy)
+            )
+        fetch_profile = dataclasses.replace(
+            fetch_profile, page_load_strategy=strategy
+        )
+    return fetch_profile
+
+
+def open_chrome(profile: FetchProfile) -> webdriver.Chrome:
+    """
+    Start a browser with the options of the profile.
+    """
+    options = webdriver.ChromeOptions()
+    options.page_load_strategy = profile.page_load_strategy
+    if profile.headless:
+        options.add_argument("--headless=new")
+        # the default headless window is too small to look like a desktop
+        options.add_argument("--window-size=1920,1080")
+
+    driver = webdriver.Chrome(options=options)
+    if profile.headless:
+        # the headless browser tells itself in the user agent, which is not
+        # covered by the stealth script
+        user_agent = driver.execute_script("return navigator.userAgent")
+        driver.execute_cdp_cmd(
+            "Network.setUserAgentOverride",
+            dict(userAgent=user_agent.replace("HeadlessChrome", "Chrome")),
+        )
+    return driver
+
+
+def block_resources(driver: webdriver.Chrome, profile: FetchProfile):
+    """
+    Block the resources of the profile from loading.
+
+    Should be done after login, as the login page may not work without the
+    blocked resources, e.g. the styles.
+    """
+    if profile.blocked_urls:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd(
+            "Network.setBlockedURLs", dict(urls=list(profile.blocked_urls))
+        )
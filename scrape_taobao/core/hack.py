@@ -1,5 +1,7 @@
 import logging
 import os
+import threading
+from typing import List, Optional, Tuple
 
 import rich.prompt
 from selenium import webdriver
@@ -24,23 +26,76 @@ def hide_browser_features(driver: webdriver.Chrome):
     )
 
 
-def prompt_and_login(driver):
-    username = os.environ.get("USERNAME") or rich.prompt.Prompt.ask("username")
-    password = os.environ.get("PASSWORD") or rich.prompt.Prompt.ask(
-        "password", password=True
-    )
+_credentials = None
+_credentials_lock = threading.Lock()
+
+
+def prompt_credentials() -> Tuple[str, str]:
+    """
+    Get the username and password from the env, or prompt for them.
+
+    The credentials are only prompted once per process, even if several
+    browsers login at the same time.
+    """
+    global _credentials
+
+    with _credentials_lock:
+        if _credentials is None:
+            username = os.environ.get("USERNAME") or rich.prompt.Prompt.ask(
+                "username"
+            )
+            password = os.environ.get("PASSWORD") or rich.prompt.Prompt.ask(
+                "password", password=True
+            )
+            _credentials = username, password
+
+        return _credentials
+
+
+class LoginError(Exception):
+    """
+    Raised when the login form is submitted but still not logged in.
+    """
+
+
+def prompt_and_login(driver, credentials: Optional[Tuple[str, str]] = None):
+    username, password = credentials or prompt_credentials()
 
     login(driver, username, password)
     fake_pause()
 
     if "login.jhtml" in driver.current_url:
-        # still on the login page
-        logger.exception('failed to login as "{}"'.format(username))
-        exit(-1)
+        # still on the login page, which is left to the caller to handle, as
+        # it may be a re-login in the middle of a run
+        raise LoginError('failed to login as "{}"'.format(username))
 
     logger.info('logged in as "{}"'.format(username))
 
 
+def export_login_cookies(driver: webdriver.Chrome) -> List[dict]:
+    """
+    Export the cookies of all the domains from a logged-in browser.
+    """
+    return driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+
+
+def import_login_cookies(driver: webdriver.Chrome, cookies: List[dict]):
+    """
+    Import the cookies exported by `export_login_cookies` to another browser,
+    so that it shares the login of the exporter.
+    """
+    keys = ["name", "value", "domain", "path", "secure", "httpOnly", "sameSite"]
+    params = []
+    for cookie in cookies:
+        param = {k: cookie[k] for k in keys if k in cookie}
+        # session cookies are exported with a negative expiry
+        if cookie.get("expires", -1) > 0:
+            param["expires"] = cookie["expires"]
+        params.append(param)
+
+    driver.execute_cdp_cmd("Network.setCookies", dict(cookies=params))
+
+
 def login(driver: WebDriver, username: str, password: str):
     driver.get("https://login.taobao.com/member/login.jhtml")
 
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import threading
+from http.cookies import Morsel
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+from yarl import URL
+
+from scrape_taobao.core.fetch_item_page import (
+    PAGE_CLEAN,
+    PAGE_NOT_FOUND,
+    ItemNotFoundError,
+    ItemPageFetcher,
+    ValidationPageError,
+    classify_page,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+}
+
+
+class HttpItemPageFetcher(ItemPageFetcher):
+    """
+    Fetch item pages over plain http, without rendering them in a browser.
+
+    The requests are sent by a pooled aiohttp session carrying the cookies of
+    a logged-in browser. The session runs in an event loop on a background
+    thread, so that `fetch` can be called from any number of threads, while
+    `fetch_async` can be awaited on the loop directly.
+
+    If a login or validation page, or an emptied sku map, is fetched instead
+    of the item page, the url will be fetched again by the fallback, e.g. a
+    `SeleniumItemPageFetcher`.
+    """
+
+    def __init__(
+        self,
+        cookies: List[dict],
+        *,
+        concurrency: int = 8,
+        rate_per_host: float = 2.0,
+        timeout: float = 30.0,
+        fallback: Optional[Callable[[str], str]] = None,
+    ):
+        """
+        :param cookies: cookies exported by `export_login_cookies`
+        :param concurrency: max number of concurrent requests
+        :param rate_per_host: max number of requests per second to a host
+        :param timeout: timeout of a request in seconds
+        :param fallback: fetch the url in another way if a validation page is
+          fetched, the fetcher raises `ValidationPageError` if None
+        """
+        self.concurrency = max(1, concurrency)
+        self.rate_per_host = rate_per_host
+        self.timeout = timeout
+        self.fallback = fallback
+
+        # the fallback is usually a browser, which is not thread-safe
+        self.fallback_lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="http-fetcher", daemon=True
+        )
+        self.thread.start()
+
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.host_locks: Dict[str, asyncio.Lock] = {}
+        self.host_next_times: Dict[str, float] = {}
+
+        self._run(self._open(cookies))
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+
+        self._run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def update_cookies(self, cookies: List[dict]):
+        """
+        Update the cookies of the session, e.g. once the browser has logged in
+        again.
+        """
+        self._run(self._update_cookies(cookies))
+
+    def fetch(self, url: str) -> str:
+        page_source = self._run(self.fetch_async(url))
+        if page_source is not None:
+            return page_source
+
+        if self.fallback is None:
+            raise ValidationPageError(
+                'validation page fetched for "{}"'.format(url)
+            )
+
+        logger.info('fallback to fetch "{}"'.format(url))
+        with self.fallback_lock:
+            return self.fallback(url)
+
+    async def fetch_async(self, url: str) -> Optional[str]:
+        """
+        Fetch the item page on the loop of the fetcher.
+
+        :return: the page source, or None if a validation page is fetched
+        :raise ItemNotFoundError: if the item is not found
+        """
+        async with self.semaphore:
+            await self._wait_turn(urlparse(url).hostname or "")
+
+            async with self.session.get(url) as resp:
+                resp.raise_for_status()
+                page_source = await resp.text(errors="replace")
+                final_url = str(resp.url)
+
+        signal = classify_page(final_url, page_source)
+        if signal == PAGE_NOT_FOUND:
+            raise ItemNotFoundError('item not found at "{}"'.format(final_url))
+        if signal != PAGE_CLEAN:
+            return None
+        return page_source
+
+    async def _open(self, cookies: List[dict]):
+        jar = aiohttp.CookieJar()
+        _fill_cookie_jar(jar, cookies)
+
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.session = aiohttp.ClientSession(
+            cookie_jar=jar,
+            headers=DEFAULT_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+        )
+
+    async def _wait_turn(self, host: str):
+        """
+        Wait until it is the turn of the next request to the host.
+        """
+        if self.rate_per_host <= 0:
+            return
+
+        lock = self.host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = self.loop.time()
+            next_time = self.host_next_times.get(host, now)
+            if next_time > now:
+                await asyncio.sleep(next_time - now)
+            self.host_next_times[host] = (
+                max(now, next_time) + 1.0 / self.rate_per_host
+            )
+
+    async def _update_cookies(self, cookies: List[dict]):
+        _fill_cookie_jar(self.session.cookie_jar, cookies)
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+def _fill_cookie_jar(jar: aiohttp.abc.AbstractCookieJar, cookies: List[dict]):
+    for cookie in cookies:
+        morsel = Morsel()
+        morsel.set(cookie["name"], cookie["value"], cookie["value"])
+        morsel["domain"] = cookie.get("domain", "")
+        morsel["path"] = cookie.get("path", "/")
+        domain = cookie.get("domain", "").lstrip(".")
+        jar.update_cookies(
+            {cookie["name"]: morsel},
+            response_url=URL("https://{}/".format(domain)),
+        )
@@ -1,18 +1,44 @@
 import json
 import re
 from json import JSONDecodeError
-from typing import List, TextIO, Union
+from typing import Dict, List, Optional, TextIO, Tuple, Union
 
 import bs4
 
 from scrape_taobao.bean.item_data import ItemChoiceData, ItemData
 
 
-def parse_item_page(page_source: Union[str, TextIO]) -> ItemData:
+class PageParseError(Exception):
+    """
+    Raised when the item data can not be parsed from the page, e.g. as the
+    page is truncated or of an unknown layout.
+    """
+
+
+def parse_item_page(page_source: Union[str, TextIO], fast=False) -> ItemData:
+    """
+    Parse the item data from the page source.
+
+    :param page_source: page source or a stream of it
+    :param fast: whether to try extracting the data directly from the raw page
+      source first, without building the whole html tree. The full parsers
+      will be used if the fast path cannot handle the page.
+    """
+    if not isinstance(page_source, str):
+        page_source = page_source.read()
+
+    if fast:
+        # imported here as the fast extractor depends on this module
+        from scrape_taobao.core.extract_item_page import extract_item_page
+
+        data = extract_item_page(page_source)
+        if data is not None:
+            return data
+
     page = bs4.BeautifulSoup(page_source, "html.parser")
 
     if "tmall.com" in page.title.string:
-        data = TMallItemPageParser(page).parse()
+        data = TMallItemPageParser(page, page_source).parse()
     else:
         data = TaobaoItemPageParser(page).parse()
 
@@ -24,18 +50,41 @@ RX_SKU = re.compile(r"skuMap\s*:(?P<map>[^\n]*)$", re.MULTILINE)
 RX_MEM = re.compile(r"propertyMemoMap\s*:(?P<map>[^\n]*)$", re.MULTILINE)
 
 # regex templates for tmall
-RX_ITEM_HEADER_SALES_DESC = re.compile(r"ItemHeader--salesDesc--.*")
-RX_ITEM_DETAIL_ATTRS = re.compile(r"ItemDetail--attrs--.*")
 RX_ATTRS_ATTR = re.compile(r"Attrs--attr--.*")
-RX_PRICE_PRICE_TEXT = re.compile(r"Price--priceText--.*")
+# the sku state embedded as json in the scripts of tmall pages, e.g. in
+# `window.__ICE_APP_CONTEXT__`
+RX_TMALL_SKU_BASE = re.compile(r'"skuBase"\s*:\s*(?=\{)')
+RX_TMALL_SKU_CORE = re.compile(r'"skuCore"\s*:\s*(?=\{)')
+
+JSON_DECODER = json.JSONDecoder()
 
 
 class TMallItemPageParser:
-    def __init__(self, page: bs4.BeautifulSoup):
+    VERSION = 3
+
+    # the nodes to find, as (tag name, class, whether to match the class
+    # exactly or as a part of a class token)
+    TARGETS = {
+        "attrs": ("div", "ItemDetail--attrs--", False),
+        "delivery_info": ("div", "delivery-info", True),
+        "price": ("span", "Price--priceText--", False),
+        "sales_desc": ("span", "ItemHeader--salesDesc--", False),
+    }
+
+    def __init__(self, page: bs4.BeautifulSoup, page_source: str = None):
+        """
+        :param page: the html tree of the page
+        :param page_source: the page source, which is serialized from the tree
+          if not given
+        """
         self.page = page
+        self.page_source = str(page) if page_source is None else page_source
+        self.nodes = find_nodes(page, self.TARGETS)
 
     def parse(self):
-        choices = self.extract_choices()
+        choices, price_range, total_stock = extract_tmall_sku_state(
+            self.page_source
+        )
 
         return ItemData(
             platform="tmall",
@@ -43,15 +92,15 @@ class TMallItemPageParser:
             details=self.extract_details(),
             delivery_info=self.extract_delivery_info(),
             choices=choices,
-            price_range=self.extract_price_range(choices),
-            total_stock=self.extract_total_stock(choices),
+            price_range=price_range or self.extract_price_range(),
+            total_stock=total_stock or 0,
             sales=self.extract_sales(),
         )
 
     def extract_details(self):
         details = {}
 
-        attrs = self.page.find("div", class_=RX_ITEM_DETAIL_ATTRS)
+        attrs = self.nodes.get("attrs")
         if attrs is None:
             return details
 
@@ -61,33 +110,25 @@ class TMallItemPageParser:
         return details
 
     def extract_delivery_info(self):
-        delivery_info = self.page.find("div", class_="delivery-info")
+        delivery_info = self.nodes.get("delivery_info")
         if delivery_info:
             return ";".join(
                 span.text for span in delivery_info.find_all("span")
             )
         return "-"
 
-    @staticmethod
-    def extract_choices():
-        # TODO
-        return []
-
-    def extract_price_range(self, _: List[ItemChoiceData]):
-        price = self.page.find("span", class_=RX_PRICE_PRICE_TEXT)
+    def extract_price_range(self):
+        """
+        Fall back to the shown price, if there is no sku state.
+        """
+        price = self.nodes.get("price")
         if price:
-            # TODO: the max price is not shown in tmall
             return float(price.text), float(price.text)
 
         return 0.0, 0.0
 
-    @staticmethod
-    def extract_total_stock(_: List[ItemChoiceData]):
-        # TODO: the total stock is not shown in tmall
-        return 0
-
     def extract_sales(self):
-        sales_desc = self.page.find("span", class_=RX_ITEM_HEADER_SALES_DESC)
+        sales_desc = self.nodes.get("sales_desc")
         if sales_desc:
             match = re.search(r"\d+", sales_desc.text)
             if match:
@@ -97,7 +138,198 @@ class TMallItemPageParser:
         return 0
 
 
+def find_nodes(
+    page: bs4.BeautifulSoup, targets: Dict[str, Tuple[str, str, bool]]
+) -> Dict[str, bs4.Tag]:
+    """
+    Find the first node of each target in a single traversal of the tree,
+    instead of a traversal per target as `find` does.
+
+    :param targets: the targets by keys, as (tag name, class, whether to
+      match the class exactly or as a part of a class token)
+    :return: the found nodes by the keys of the targets
+    """
+    nodes = {}
+    for node in page.descendants:
+        if not isinstance(node, bs4.Tag):
+            continue
+
+        classes = node.get("class")
+        if not classes:
+            continue
+
+        for key, (name, cls, exact) in targets.items():
+            if (
+                key not in nodes
+                and node.name == name
+                and any(
+                    token == cls if exact else cls in token for token in classes
+                )
+            ):
+                nodes[key] = node
+
+        if len(nodes) == len(targets):
+            break
+    return nodes
+
+
+def extract_tmall_sku_state(
+    page_source: str,
+) -> Tuple[List[ItemChoiceData], Optional[Tuple[float, float]], Optional[int]]:
+    """
+    Extract the sku choices, the price range and the total stock from the
+    `skuBase` and the `skuCore` embedded in the scripts of a tmall item page.
+
+    The `skuBase` holds the properties and the property paths of the skus,
+    and the `sku2info` of the `skuCore` holds the price and the quantity of
+    each sku, and of the whole item keyed by '0'.
+
+    :return: (choices, price range, total stock), the latter two are None if
+      there is no sku state in the page
+    """
+    sku_base = _decode_json_at(page_source, RX_TMALL_SKU_BASE) or {}
+    sku_core = _decode_json_at(page_source, RX_TMALL_SKU_CORE)
+    sku2info = (sku_core or {}).get("sku2info") or {}
+
+    choices = build_tmall_choices(sku_base, sku2info)
+    if choices:
+        prices = [c.price for c in choices]
+        return (
+            choices,
+            (min(prices), max(prices)),
+            sum(c.stock for c in choices),
+        )
+
+    item_info = sku2info.get("0")
+    if item_info is None:
+        return [], None, None
+
+    prices = _tmall_prices(item_info)
+    return [], (min(prices), max(prices)), _tmall_quantity(item_info)
+
+
+def build_tmall_choices(sku_base: dict, sku2info: dict) -> List[ItemChoiceData]:
+    value_names = {
+        "{}:{}".format(prop["pid"], value["vid"]): value["name"]
+        for prop in sku_base.get("props") or []
+        for value in prop.get("values") or []
+    }
+
+    choices = []
+    for sku in sku_base.get("skus") or []:
+        sku_id = str(sku.get("skuId") or "-")
+        info = sku2info.get(sku_id)
+        if info is None:
+            continue
+
+        tags = list(filter(None, (sku.get("propPath") or "").split(";")))
+        stock = _tmall_quantity(info)
+        choices.append(
+            ItemChoiceData(
+                tags=tags,
+                name=";".join(
+                    value_names[tag] for tag in tags if tag in value_names
+                )
+                or "-",
+                sku_id=sku_id,
+                price=min(_tmall_prices(info)),
+                stock=stock,
+                oversold=stock == 0,
+            )
+        )
+
+    return choices
+
+
+def _decode_json_at(page_source: str, rx: re.Pattern) -> Optional[dict]:
+    """
+    Decode the json object right after the match of the regex.
+    """
+    m = rx.search(page_source)
+    if not m:
+        return None
+
+    try:
+        value, _ = JSON_DECODER.raw_decode(page_source, m.end())
+    except JSONDecodeError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def _tmall_prices(info: dict) -> List[float]:
+    """
+    The prices of a sku, or of the item which may be a range as '9.9-19.9'.
+    """
+    price = info.get("price") or {}
+    if price.get("priceText"):
+        return [float(p.strip()) for p in price["priceText"].split("-")]
+    if price.get("priceMoney"):
+        # in cents
+        return [int(price["priceMoney"]) / 100]
+    return [-1.0]
+
+
+def _tmall_quantity(info: dict) -> int:
+    """
+    The stock of a sku or of the item, -1 if unknown, but 0 if sold out.
+    """
+    quantity = info.get("quantity")
+    return -1 if quantity is None or quantity == "" else int(quantity)
+
+
+def extract_taobao_choices(page_source: str) -> List[ItemChoiceData]:
+    """
+    Extract the sku choices from the `skuMap` and `propertyMemoMap` embedded in
+    the scripts of a taobao item page.
+    """
+    sku_m = RX_SKU.search(page_source)
+    mem_m = RX_MEM.search(page_source)
+
+    if not sku_m or not mem_m:
+        return []
+
+    (sku_str,) = sku_m.groups()
+    (mem_str,) = mem_m.groups()
+
+    return build_taobao_choices(sku_str, mem_str)
+
+
+def build_taobao_choices(sku_str: str, mem_str: str) -> List[ItemChoiceData]:
+    choices = []
+
+    try:
+        sku: dict = json.loads(sku_str)
+        mem: dict = json.loads(mem_str)
+    except JSONDecodeError:
+        return choices
+
+    for seq, attrs in sku.items():
+        tags = list(filter(None, seq.split(";")))
+        for tag in tags:
+            if tag in mem:
+                name = mem.get(tag)
+                break
+
+        else:
+            name = "-"
+
+        choices.append(
+            ItemChoiceData(
+                tags=tags,
+                name=name,
+                sku_id=attrs.get("skuId") or "-",
+                price=float(attrs.get("price") or "-1."),
+                stock=int(attrs.get("stock") or "-1"),
+                oversold=attrs.get("oversold") or False,
+            )
+        )
+
+    return choices
+
+
 class TaobaoItemPageParser:
+    VERSION = 1
+
     def __init__(self, page: bs4.BeautifulSoup):
         self.page = page
 
@@ -132,45 +364,7 @@ class TaobaoItemPageParser:
         return delivery_days.text.strip() if delivery_days else "-"
 
     def extract_choices(self):
-        choices = []
-        page_source = str(self.page)
-        sku_m = RX_SKU.search(page_source)
-        mem_m = RX_MEM.search(page_source)
-
-        if not sku_m or not mem_m:
-            return choices
-
-        (sku_str,) = sku_m.groups()
-        (mem_str,) = mem_m.groups()
-
-        try:
-            sku: dict = json.loads(sku_str)
-            mem: dict = json.loads(mem_str)
-        except JSONDecodeError:
-            return choices
-
-        for seq, attrs in sku.items():
-            tags = list(filter(None, seq.split(";")))
-            for tag in tags:
-                if tag in mem:
-                    name = mem.get(tag)
-                    break
-
-            else:
-                name = "-"
-
-            choices.append(
-                ItemChoiceData(
-                    tags=tags,
-                    name=name,
-                    sku_id=attrs.get("skuId") or "-",
-                    price=float(attrs.get("price") or "-1."),
-                    stock=int(attrs.get("stock") or "-1"),
-                    oversold=attrs.get("oversold") or False,
-                )
-            )
-
-        return choices
+        return extract_taobao_choices(str(self.page))
 
     def extract_price_range(self, sub_items: List[ItemChoiceData]):
         if sub_items:
@@ -199,3 +393,20 @@ class TaobaoItemPageParser:
             if sell_counter and sell_counter.text not in ["-", ""]
             else "0"
         )
+
+
+# parsers of the platforms, whose `VERSION` should be bumped whenever the
+# parsed item data changes, so that the pages parsed by the older versions
+# will be re-parsed
+PARSERS = {
+    "taobao": TaobaoItemPageParser,
+    "tmall": TMallItemPageParser,
+}
+
+
+def parser_version(platform: str) -> int:
+    """
+    Get the version of the parser of the platform, -1 if unknown.
+    """
+    parser = PARSERS.get(platform)
+    return parser.VERSION if parser else -1
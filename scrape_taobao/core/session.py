@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Optional, Tuple
+
+from selenium import webdriver
+
+from scrape_taobao.core.hack import (
+    export_login_cookies,
+    import_login_cookies,
+    prompt_and_login,
+)
+
+logger = logging.getLogger(__name__)
+
+# serializes the saves of the browsers of a process, each of which merges the
+# local storage of its page into the saved one
+_save_lock = threading.Lock()
+
+# a page only available to logged-in users, which redirects to the login page
+# otherwise
+SESSION_CHECK_URL = "https://i.taobao.com/my_taobao.htm"
+
+RESTORE_LOCAL_STORAGE_JS = """
+(function (storages) {
+  var items = storages[location.origin];
+  if (!items) return;
+  for (var key in items) {
+    if (localStorage.getItem(key) === null) localStorage.setItem(key, items[key]);
+  }
+})(%s);
+"""
+
+
+def login_with_session(
+    driver: webdriver.Chrome,
+    session_path: Optional[str],
+    credentials: Optional[Tuple[str, str]] = None,
+):
+    """
+    Login by restoring the saved session, or by the login form if the saved
+    session is missing or invalid.
+
+    The session will be saved after a successful form login.
+
+    :param driver: the browser
+    :param session_path: path to the session file, None to disable the session
+    :param credentials: username and password used by the form login, will be
+      prompted if not given
+    """
+    if session_path and restore_session(driver, session_path):
+        if is_logged_in(driver):
+            logger.info('restored session from "{}"'.format(session_path))
+            return
+
+        logger.info('saved session "{}" expired'.format(session_path))
+
+    prompt_and_login(driver, credentials)
+
+    if session_path:
+        save_session(driver, session_path)
+
+
+def is_logged_in(driver: webdriver.Chrome) -> bool:
+    """
+    Check if the browser is logged in, by visiting a page only available to
+    logged-in users.
+    """
+    driver.get(SESSION_CHECK_URL)
+    return "login.jhtml" not in driver.current_url
+
+
+def save_session(driver: webdriver.Chrome, session_path: str):
+    """
+    Save the cookies and the local storage of the current page to file.
+    """
+    origin = driver.execute_script("return location.origin")
+    if origin and origin.startswith("http"):
+        origin_storage = driver.execute_script(
+            "return Object.assign({}, window.localStorage)"
+        )
+    else:
+        origin_storage = None
+    cookies = export_login_cookies(driver)
+
+    os.makedirs(os.path.dirname(os.path.abspath(session_path)), exist_ok=True)
+
+    with _save_lock:
+        session = _load_session_file(session_path) or {}
+        local_storage = session.get("local_storage", {})
+        if origin_storage is not None:
+            local_storage[origin] = origin_storage
+
+        session = dict(
+            saved_at=time.time(),
+            cookies=cookies,
+            local_storage=local_storage,
+        )
+
+        # write to a temp file of its own first, as the browsers of the other
+        # processes may save at the same time
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(session_path)),
+            prefix=os.path.basename(session_path) + ".",
+            suffix=".tmp",
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(session, f)
+            os.replace(tmp_path, session_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    logger.info('saved session to "{}"'.format(session_path))
+
+
+def restore_session(driver: webdriver.Chrome, session_path: str) -> bool:
+    """
+    Restore the cookies and the local storage saved by `save_session`.
+
+    :return: False if there is no unexpired session to restore
+    """
+    session = _load_session_file(session_path)
+    if not session:
+        return False
+
+    now = time.time()
+    cookies = [
+        cookie
+        for cookie in session.get("cookies", [])
+        if cookie.get("expires", -1) <= 0 or cookie["expires"] > now
+    ]
+    if not cookies:
+        return False
+
+    import_login_cookies(driver, cookies)
+
+    local_storage = session.get("local_storage")
+    if local_storage:
+        # restore the local storage once any page of the origins is loaded,
+        # which saves visiting every origin here
+        driver.execute_cdp_cmd(
+            "Page.addScriptToEvaluateOnNewDocument",
+            dict(source=RESTORE_LOCAL_STORAGE_JS % json.dumps(local_storage)),
+        )
+
+    return True
+
+
+def _load_session_file(session_path: str) -> Optional[dict]:
+    if not os.path.exists(session_path):
+        return None
+
+    try:
+        with open(session_path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(
+            'failed to load session "{}": {}'.format(session_path, e)
+        )
+        return None
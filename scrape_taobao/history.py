@@ -0,0 +1,418 @@
+"""
+History of the scraped items, as timestamped snapshots of their prices, stocks
+and sales.
+
+Each snapshot only stores the fields changed since the previous snapshot of
+the item, the unchanged ones being NULL, so that re-scraping an item at a
+regular interval costs a few bytes unless it changes. The state at any time is
+recovered as the last non-NULL value of each field up to that time, which is
+an index lookup on (item_id, scraped_at).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# the tracked scalar fields of the items
+FIELDS = ("min_price", "max_price", "total_stock", "sales")
+
+# the state of a sku, i.e. (price, stock)
+SkuState = Tuple[float, int]
+
+
+class ItemHistory:
+    """
+    Delta-encoded snapshots of the items, stored in a sqlite database.
+
+    The latest full state of each item is kept aside, so that recording a
+    snapshot never replays the history. The skus are keyed by their sku ids,
+    each delta of them being a json object mapping the changed skus to their
+    [price, stock], or to null if removed.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS snapshots (
+        item_id TEXT NOT NULL,
+        scraped_at REAL NOT NULL,
+        min_price REAL,
+        max_price REAL,
+        total_stock INTEGER,
+        sales INTEGER,
+        skus TEXT,
+        PRIMARY KEY (item_id, scraped_at)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS snapshots_scraped_at ON snapshots (scraped_at);
+    CREATE TABLE IF NOT EXISTS latest (
+        item_id TEXT PRIMARY KEY,
+        scraped_at REAL NOT NULL,
+        min_price REAL,
+        max_price REAL,
+        total_stock INTEGER,
+        sales INTEGER,
+        skus TEXT
+    );
+    """
+
+    def __init__(self, db_path: str, commit_every: int = 100):
+        """
+        :param db_path: path to the database file
+        :param commit_every: commit after every such number of snapshots
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self.commit_every = commit_every
+        self.pending = 0
+
+        # shared by the threads of a scrape pool, guarded by the lock
+        self.conn = sqlite3.connect(
+            db_path, timeout=60, check_same_thread=False
+        )
+        self.lock = threading.RLock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def record(
+        self, item_id: str, item: dict, scraped_at: Optional[float] = None
+    ) -> bool:
+        """
+        Record a snapshot of the item, with the fields changed only.
+
+        :param item: the item data as a dict
+        :param scraped_at: timestamp of the scrape, default to now
+        :return: whether anything changed since the previous snapshot
+        """
+        scraped_at = time.time() if scraped_at is None else scraped_at
+        min_price, max_price = item["price_range"]
+        values = (min_price, max_price, item["total_stock"], item["sales"])
+        skus = _sku_states(item["choices"])
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT scraped_at, {}, skus FROM latest "
+                "WHERE item_id = ?".format(", ".join(FIELDS)),
+                (item_id,),
+            ).fetchone()
+
+            if row is None:
+                delta = values
+                skus_delta = skus
+            elif scraped_at <= row[0]:
+                # never rewrite the history with an older scrape
+                return False
+            else:
+                delta = tuple(
+                    None if value == last else value
+                    for value, last in zip(values, row[1:-1])
+                )
+                skus_delta = _diff_skus(_load_skus(row[-1]), skus)
+
+            self.conn.execute(
+                "INSERT OR REPLACE INTO snapshots "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (item_id, scraped_at)
+                + delta
+                + (json.dumps(skus_delta) if skus_delta else None,),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO latest VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (item_id, scraped_at) + values + (json.dumps(skus),),
+            )
+
+            self.pending += 1
+            if self.pending >= self.commit_every:
+                self.commit()
+
+        return (
+            row is None
+            or bool(skus_delta)
+            or any(value is not None for value in delta)
+        )
+
+    def history(
+        self,
+        item_id: str,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        skus: bool = False,
+    ) -> List[dict]:
+        """
+        Get the full states of the item at its snapshots in the time range.
+
+        :param since: start of the range, inclusive, default to the first
+        :param until: end of the range, inclusive, default to the last
+        :param skus: whether to include the states of the skus, which are
+          replayed from the first snapshot
+        :return: a list of dict of `scraped_at`, the fields, and `skus` if
+          asked, i.e. a dict of sku id to [price, stock]
+        """
+        since = float("-inf") if since is None else since
+        until = float("inf") if until is None else until
+
+        with self.lock:
+            self.commit()
+            # the states right before the range
+            state = {
+                field: self._value_at(item_id, field, since, inclusive=False)
+                for field in FIELDS
+            }
+            rows = self.conn.execute(
+                "SELECT scraped_at, {}, skus FROM snapshots "
+                "WHERE item_id = ? AND scraped_at <= ? "
+                "AND (scraped_at >= ? OR ?) "
+                "ORDER BY scraped_at".format(", ".join(FIELDS)),
+                (item_id, until, since, skus),
+            ).fetchall()
+
+        sku_states: Dict[str, SkuState] = {}
+        history = []
+        for row in rows:
+            if skus:
+                for sku_id, sku_state in _load_skus(row[-1]).items():
+                    if sku_state is None:
+                        sku_states.pop(sku_id, None)
+                    else:
+                        sku_states[sku_id] = sku_state
+            if row[0] < since:
+                continue
+
+            for field, value in zip(FIELDS, row[1:-1]):
+                if value is not None:
+                    state[field] = value
+
+            snapshot = dict(scraped_at=row[0], **state)
+            if skus:
+                snapshot["skus"] = dict(sku_states)
+            history.append(snapshot)
+        return history
+
+    def growth(
+        self,
+        field: str = "sales",
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        min_growth: float = 0.0,
+    ) -> Iterator[Tuple[str, float, float, float]]:
+        """
+        Find the items whose field grew by more than the ratio in the range.
+
+        The value at the start is the last one before the range, or the first
+        one in the range if the item is first scraped in it.
+
+        :param field: one of `FIELDS`
+        :param min_growth: min ratio of the growth, e.g. 0.5 for 50%
+        :return: an iterator of (item id, value at start, value at end, growth
+          ratio), sorted by the ratio descending
+        """
+        if field not in FIELDS:
+            raise ValueError("unsupported field: {}".format(field))
+
+        since = float("-inf") if since is None else since
+        until = float("inf") if until is None else until
+
+        # the correlated subqueries are lookups on the primary key
+        sql = """
+        SELECT item_id, coalesce(
+            (SELECT {field} FROM snapshots s
+             WHERE s.item_id = i.item_id AND s.scraped_at < :since
+             AND s.{field} IS NOT NULL
+             ORDER BY s.scraped_at DESC LIMIT 1),
+            (SELECT {field} FROM snapshots s
+             WHERE s.item_id = i.item_id AND s.scraped_at >= :since
+             AND s.scraped_at <= :until AND s.{field} IS NOT NULL
+             ORDER BY s.scraped_at LIMIT 1)
+        ) AS start_value, (
+            SELECT {field} FROM snapshots s
+            WHERE s.item_id = i.item_id AND s.scraped_at <= :until
+            AND s.{field} IS NOT NULL
+            ORDER BY s.scraped_at DESC LIMIT 1
+        ) AS end_value
+        FROM latest i
+        WHERE i.item_id IN (
+            SELECT DISTINCT item_id FROM snapshots
+            WHERE scraped_at >= :since AND scraped_at <= :until
+        )
+        """.format(
+            field=field
+        )
+
+        with self.lock:
+            self.commit()
+            rows = self.conn.execute(
+                sql, dict(since=since, until=until)
+            ).fetchall()
+
+        results = []
+        for item_id, start_value, end_value in rows:
+            if not start_value or end_value is None:
+                continue
+            ratio = end_value / start_value - 1
+            if ratio > min_growth:
+                results.append((item_id, start_value, end_value, ratio))
+        results.sort(key=lambda result: -result[-1])
+        return iter(results)
+
+    def compact(
+        self, before: Optional[float] = None, resolution: float = 0
+    ) -> Tuple[int, int]:
+        """
+        Compact the snapshots before the time.
+
+        The snapshots changing nothing are dropped, and if the resolution is
+        given, the snapshots of each item in each period of such seconds are
+        merged into the last one of the period.
+
+        :param before: compact the snapshots before it, default to all
+        :param resolution: length in seconds of the periods, 0 to not merge
+        :return: numbers of the snapshots before and after the compaction
+        """
+        before = float("inf") if before is None else before
+
+        with self.lock:
+            self.commit()
+            (count_before,) = self.conn.execute(
+                "SELECT count(*) FROM snapshots"
+            ).fetchone()
+
+            if resolution > 0:
+                self._merge_periods(before, resolution)
+
+            # the first snapshot of each item marks when it is first scraped,
+            # and is never empty
+            self.conn.execute(
+                "DELETE FROM snapshots WHERE scraped_at < ? "
+                "AND {} AND skus IS NULL".format(
+                    " AND ".join("{} IS NULL".format(f) for f in FIELDS)
+                ),
+                (before,),
+            )
+            self.commit()
+
+            (count_after,) = self.conn.execute(
+                "SELECT count(*) FROM snapshots"
+            ).fetchone()
+        return count_before, count_after
+
+    def vacuum(self):
+        with self.lock:
+            self.commit()
+            self.conn.execute("VACUUM")
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.conn.close()
+
+    def _value_at(
+        self, item_id: str, field: str, at: float, inclusive: bool = True
+    ):
+        row = self.conn.execute(
+            "SELECT {field} FROM snapshots WHERE item_id = ? "
+            "AND scraped_at {op} ? AND {field} IS NOT NULL "
+            "ORDER BY scraped_at DESC LIMIT 1".format(
+                field=field, op="<=" if inclusive else "<"
+            ),
+            (item_id, at),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _merge_periods(self, before: float, resolution: float):
+        rows = self.conn.execute(
+            "SELECT item_id, scraped_at, {}, skus FROM snapshots "
+            "WHERE scraped_at < ? ORDER BY item_id, scraped_at".format(
+                ", ".join(FIELDS)
+            ),
+            (before,),
+        )
+
+        merged, removed = [], []
+        group_key, group = None, []
+        for row in rows:
+            key = row[0], row[1] // resolution
+            if key != group_key and len(group) > 1:
+                merged.append(_merge_snapshots(group))
+                removed += [(r[0], r[1]) for r in group[:-1]]
+            if key != group_key:
+                group_key, group = key, []
+            group.append(row)
+        if len(group) > 1:
+            merged.append(_merge_snapshots(group))
+            removed += [(r[0], r[1]) for r in group[:-1]]
+
+        self.conn.executemany(
+            "DELETE FROM snapshots WHERE item_id = ? AND scraped_at = ?",
+            removed,
+        )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?)",
+            merged,
+        )
+
+
+def open_history(history: str) -> Optional[ItemHistory]:
+    """
+    Open the history at the path, or None if the path is empty.
+    """
+    return ItemHistory(history) if history else None
+
+
+def _sku_states(choices: List[dict]) -> Dict[str, SkuState]:
+    return {
+        choice["sku_id"] or choice["name"]: (choice["price"], choice["stock"])
+        for choice in choices
+    }
+
+
+def _load_skus(skus: Optional[str]) -> Dict[str, Optional[SkuState]]:
+    if not skus:
+        return {}
+    return {
+        sku_id: tuple(state) if state is not None else None
+        for sku_id, state in json.loads(skus).items()
+    }
+
+
+def _diff_skus(
+    old: Dict[str, SkuState], new: Dict[str, SkuState]
+) -> Dict[str, Optional[SkuState]]:
+    delta = {
+        sku_id: state
+        for sku_id, state in new.items()
+        if old.get(sku_id) != state
+    }
+    delta.update({sku_id: None for sku_id in old if sku_id not in new})
+    return delta
+
+
+def _merge_snapshots(rows: List[tuple]) -> tuple:
+    """
+    Merge the consecutive snapshots of an item into the last one.
+    """
+    values = [None] * len(FIELDS)
+    skus = {}
+    for row in rows:
+        for i, value in enumerate(row[2:-1]):
+            if value is not None:
+                values[i] = value
+        skus.update(_load_skus(row[-1]))
+
+    item_id, scraped_at = rows[-1][:2]
+    return (
+        (item_id, scraped_at)
+        + tuple(values)
+        + (json.dumps(skus) if skus else None,)
+    )
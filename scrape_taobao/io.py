@@ -1,11 +1,18 @@
+import csv
+import dataclasses
 import json
-import random
 import sys
 from contextlib import nullcontext
-from typing import Optional
+from typing import Iterator, Optional, Sequence, TextIO, Tuple
 
 import yaml
 
+from scrape_taobao.bean.item_data import ItemData
+
+# the libyaml based loader and dumper are much faster, if available
+YamlLoader = getattr(yaml, "CFullLoader", yaml.FullLoader)
+YamlDumper = getattr(yaml, "CDumper", yaml.Dumper)
+
 
 def dump(data: dict, out_path: Optional[str], fmt: str):
     """
@@ -13,9 +20,11 @@ def dump(data: dict, out_path: Optional[str], fmt: str):
 
     :param data: data to dump
     :param out_path: output file path, if None, dump to stdout
-    :param fmt: output format, support 'json' and 'yaml'
+    :param fmt: output format, support 'json', 'yaml' and 'jsonl'. The data is
+      appended to the file as a line in 'jsonl' format.
     """
-    stream_guard = open(out_path, "w+") if out_path else nullcontext(sys.stdout)
+    mode = "a" if fmt == "jsonl" else "w+"
+    stream_guard = open(out_path, mode) if out_path else nullcontext(sys.stdout)
     with stream_guard as stream:
         if fmt == "json":
             json.dump(
@@ -23,8 +32,15 @@ def dump(data: dict, out_path: Optional[str], fmt: str):
             )
         elif fmt in ["yaml", "yml"]:
             yaml.dump(
-                data, stream, allow_unicode=True, indent=2, sort_keys=False
+                data,
+                stream,
+                Dumper=YamlDumper,
+                allow_unicode=True,
+                indent=2,
+                sort_keys=False,
             )
+        elif fmt == "jsonl":
+            stream.write(dump_jsonl_line(data))
         else:
             raise ValueError("unsupported format: {}".format(fmt))
 
@@ -34,27 +50,155 @@ def load(out_path: str, fmt: str):
     Load data from file.
 
     :param out_path: output file path
-    :param fmt: output format, support 'json' and 'yaml'
+    :param fmt: output format, support 'json', 'yaml' and 'jsonl'. A list of
+      all the lines is loaded in 'jsonl' format, see also `iter_jsonl`.
     """
+    if fmt == "jsonl":
+        return list(iter_jsonl(out_path))
+
     with open(out_path) as f:
         if fmt == "json":
             return json.load(f)
         elif fmt in ["yaml", "yml"]:
-            return yaml.load(f, Loader=yaml.FullLoader)
+            return yaml.load(f, Loader=YamlLoader)
         else:
             raise ValueError("unsupported format: {}".format(fmt))
 
 
-def load_item_list(item_list: str, n=-1, shuffle=False):
+def dump_jsonl_line(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def iter_jsonl(path: str) -> Iterator[dict]:
+    """
+    Stream the lines of a JSON Lines file, skipping the blank ones.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+# fields of the items to output, i.e. the item id, the fields of `ItemData`,
+# and the min and max of the price range
+OUTPUT_FIELDS = (
+    ("item_id",)
+    + tuple(field.name for field in dataclasses.fields(ItemData))
+    + ("min_price", "max_price")
+)
+# default fields of the items to output as csv
+DEFAULT_CSV_FIELDS = (
+    "item_id",
+    "platform",
+    "title",
+    "min_price",
+    "max_price",
+    "total_stock",
+    "sales",
+    "delivery_info",
+)
+
+
+class ItemWriter:
     """
-    Load item urls from file.
+    Write items to a stream in a machine-readable format, one item per line,
+    through a buffer.
 
-    :param item_list: item list file path
-    :param n: number of items to load, -1 means load all items
-    :param shuffle: whether to shuffle the item urls
+    Supported formats:
+      - 'jsonl': a json object of the fields per line;
+      - 'csv': a header line of the fields, then the values per line, where
+        the nested values, e.g. `details`, are encoded as json;
+      - 'ids': the item id per line.
     """
-    with open(item_list) as f:
-        item_urls = list(url.strip() for url in f.readlines())
-    random.shuffle(item_urls) if shuffle else None
-    item_urls = item_urls[:n]
-    return item_urls
+
+    FORMATS = ("jsonl", "csv", "ids")
+
+    def __init__(
+        self,
+        stream: TextIO,
+        fmt: str,
+        fields: Optional[Sequence[str]] = None,
+        buffer_size: int = 1 << 16,
+    ):
+        """
+        :param stream: the stream to write to
+        :param fmt: output format, see the class docstring
+        :param fields: fields to output, default to all the fields for 'jsonl'
+          and `DEFAULT_CSV_FIELDS` for 'csv', see `OUTPUT_FIELDS` for all the
+          supported fields
+        :param buffer_size: flush after the buffered output exceeds such
+          number of characters
+        """
+        if fmt not in self.FORMATS:
+            raise ValueError("unsupported output format: {}".format(fmt))
+
+        if fields is not None:
+            unknown = set(fields) - set(OUTPUT_FIELDS)
+            if unknown:
+                raise ValueError(
+                    "unsupported fields: {}".format(", ".join(sorted(unknown)))
+                )
+        elif fmt == "csv":
+            fields = DEFAULT_CSV_FIELDS
+
+        self.stream = stream
+        self.fmt = fmt
+        self.fields = tuple(fields) if fields is not None else None
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+
+        self.csv_writer = csv.writer(self, lineterminator="\n")
+        if fmt == "csv":
+            self.csv_writer.writerow(self.fields)
+
+    def write_item(self, item_id: str, item: Optional[dict] = None):
+        """
+        Write the item, which can be omitted for the 'ids' format.
+        """
+        if self.fmt == "ids":
+            self.write(item_id + "\n")
+            return
+
+        values = self.project(item_id, item)
+        if self.fmt == "jsonl":
+            self.write(dump_jsonl_line(values))
+        else:
+            self.csv_writer.writerow(
+                value
+                if isinstance(value, (str, int, float))
+                else json.dumps(value, ensure_ascii=False)
+                for value in values.values()
+            )
+
+    def project(self, item_id: str, item: dict) -> dict:
+        """
+        Project the item to the output fields.
+        """
+        if self.fields is None:
+            return dict(item_id=item_id, **item)
+
+        values = {}
+        for field in self.fields:
+            if field == "item_id":
+                values[field] = item_id
+            elif field == "min_price":
+                values[field] = item["price_range"][0]
+            elif field == "max_price":
+                values[field] = item["price_range"][1]
+            else:
+                values[field] = item[field]
+        return values
+
+    def write(self, text: str):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write("".join(self.buffer))
+            self.buffer.clear()
+            self.buffered = 0
+        self.stream.flush()
@@ -0,0 +1,148 @@
+"""
+Loading of the item lists, i.e. files of item urls, one per line.
+
+The lists are streamed, so that very large or gzipped lists never have to be
+held in memory, and the urls are deduplicated by their canonical item ids,
+e.g. 'id=123' for both 'https://item.taobao.com/item.htm?id=123&spm=a.b' and
+'https://detail.tmall.com/item.htm?spm=c.d&id=123', which are also the keys of
+the cached pages and the items.
+"""
+import gzip
+import itertools
+import random
+import re
+from typing import Callable, Iterator, List, Optional, TextIO, Tuple
+
+# the `id` query parameter, not to be confused with such as `skuId`
+RX_ID_PARAM = re.compile(r"(?:^|[?&#;])id=(\d+)")
+# the item id in the path of the mobile pages, e.g. 'a.m.taobao.com/i123.htm'
+RX_ID_PATH = re.compile(r"/i(\d+)\.htm")
+# a bare numeric item id
+RX_BARE_ID = re.compile(r"^\d+$")
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def canonical_item_id(url: str) -> Optional[str]:
+    """
+    Get the canonical id of the item, i.e. 'id=<digits>', from its url or its
+    bare numeric id.
+
+    :return: None if there is no item id in the url
+    """
+    m = RX_ID_PARAM.search(url) or RX_ID_PATH.search(url)
+    if m:
+        return "id={}".format(int(m.group(1)))
+    if RX_BARE_ID.match(url):
+        return "id={}".format(int(url))
+    return None
+
+
+def item_url(url: str) -> str:
+    """
+    Make the url fetchable, i.e. a bare numeric id is turned into the url of
+    its taobao item page, which redirects to tmall if it is a tmall item.
+    """
+    if RX_BARE_ID.match(url):
+        return "https://item.taobao.com/item.htm?id={}".format(int(url))
+    return url
+
+
+def open_item_list(item_list: str) -> TextIO:
+    """
+    Open the item list as text, gunzipped if it is gzipped.
+    """
+    with open(item_list, "rb") as f:
+        gzipped = f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+    if gzipped:
+        return gzip.open(item_list, "rt")
+    return open(item_list)
+
+
+def iter_item_list(
+    item_list: str,
+    *,
+    skip: Optional[Callable[[str], bool]] = None,
+    on_skipped: Optional[Callable[[str, str], None]] = None,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Stream the items of the list as (item id, url), deduplicated by the item
+    ids, with the blank lines and the comments starting with '#' ignored.
+
+    :param skip: tells if the item of the id should be skipped, e.g. as it has
+      been scraped
+    :param on_skipped: called with the url and the reason, i.e. 'invalid',
+      'duplicated' or 'skipped', of each skipped url
+    """
+    # the numeric ids are kept as ints, which take less than half the memory
+    # of the strings
+    seen = set()
+
+    with open_item_list(item_list) as f:
+        for line in f:
+            url = line.strip()
+            if not url or url.startswith("#"):
+                continue
+
+            item_id = canonical_item_id(url)
+            if item_id is None:
+                reason = "invalid"
+            elif int(item_id[len("id=") :]) in seen:
+                reason = "duplicated"
+            else:
+                seen.add(int(item_id[len("id=") :]))
+                reason = (
+                    "skipped" if skip is not None and skip(item_id) else None
+                )
+
+            if reason is None:
+                yield item_id, item_url(url)
+            elif on_skipped is not None:
+                on_skipped(url, reason)
+
+
+def load_item_list(
+    item_list: str,
+    n: int = -1,
+    shuffle: bool = False,
+    *,
+    skip: Optional[Callable[[str], bool]] = None,
+    on_skipped: Optional[Callable[[str, str], None]] = None,
+) -> List[str]:
+    """
+    Load item urls from file.
+
+    The file is streamed, and only the sampled urls are kept in memory.
+
+    :param item_list: item list file path, can be gzipped
+    :param n: number of items to load, -1 means load all items
+    :param shuffle: whether to shuffle the item urls. If `n` is given, a
+      random sample of `n` items is taken by reservoir sampling
+    :param skip: see `iter_item_list`
+    :param on_skipped: see `iter_item_list`
+    """
+    items = iter_item_list(item_list, skip=skip, on_skipped=on_skipped)
+    urls = (url for _, url in items)
+
+    if n < 0:
+        item_urls = list(urls)
+    elif not shuffle:
+        item_urls = list(itertools.islice(urls, n))
+    else:
+        item_urls = _reservoir_sample(urls, n)
+
+    if shuffle:
+        random.shuffle(item_urls)
+    return item_urls
+
+
+def _reservoir_sample(urls: Iterator[str], n: int) -> List[str]:
+    """
+    Take a uniform random sample of `n` urls in one pass, see Algorithm R.
+    """
+    sample = list(itertools.islice(urls, n))
+    for i, url in enumerate(urls, start=n):
+        j = random.randint(0, i)
+        if j < n:
+            sample[j] = url
+    return sample
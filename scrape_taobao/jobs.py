@@ -0,0 +1,128 @@
+"""
+Jobs of the scraper daemon, see the `serve` command.
+
+The jobs are kept in memory only, as the daemon is for on-demand lookups. The
+items scraped or parsed by them are saved to the item store as usual, so that
+nothing is lost with the jobs when the daemon exits.
+"""
+import collections
+import dataclasses
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional
+
+# kinds of the jobs
+SCRAPE = "scrape"
+PARSE = "parse"
+JOB_KINDS = (SCRAPE, PARSE)
+
+# states of the jobs
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclasses.dataclass
+class Job:
+    id: str
+    kind: str
+    # the url to scrape, or the item id to parse
+    target: str
+    # the options of the kind, e.g. `no_cache` of the scrape jobs
+    options: dict
+    state: str = QUEUED
+    submitted_at: float = dataclasses.field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # the item data if done
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    finished: threading.Event = dataclasses.field(
+        default_factory=threading.Event, repr=False, compare=False
+    )
+
+    def to_dict(self, with_result: bool = True) -> dict:
+        job_dict = dict(
+            id=self.id,
+            kind=self.kind,
+            target=self.target,
+            state=self.state,
+            submitted_at=self.submitted_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            error=self.error,
+        )
+        if with_result:
+            job_dict["result"] = self.result
+        return job_dict
+
+
+class JobBoard:
+    """
+    Thread-safe registry of the jobs, which tracks their states.
+
+    Only the latest finished jobs are kept, so that a long-running daemon
+    never grows without limit.
+    """
+
+    def __init__(self, max_finished: int = 1000):
+        """
+        :param max_finished: max number of the finished jobs to keep
+        """
+        self.max_finished = max_finished
+        self.jobs: Dict[str, Job] = {}
+        self.finished_ids = collections.deque()
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def add(self, kind: str, target: str, options: dict) -> Job:
+        if kind not in JOB_KINDS:
+            raise ValueError("unsupported job kind: {}".format(kind))
+
+        with self.lock:
+            job = Job(str(next(self.counter)), kind, target, options)
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self, state: Optional[str] = None) -> List[Job]:
+        with self.lock:
+            return [
+                job
+                for job in self.jobs.values()
+                if state is None or job.state == state
+            ]
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(
+                collections.Counter(job.state for job in self.jobs.values())
+            )
+
+    def start(self, job: Job):
+        with self.lock:
+            job.state = RUNNING
+            job.started_at = time.time()
+
+    def finish(
+        self,
+        job: Job,
+        result: Optional[dict] = None,
+        error: Optional[Exception] = None,
+    ):
+        with self.lock:
+            job.state = DONE if error is None else FAILED
+            job.finished_at = time.time()
+            job.result = result
+            job.error = None if error is None else str(error)
+
+            self.finished_ids.append(job.id)
+            while len(self.finished_ids) > self.max_finished:
+                self.jobs.pop(self.finished_ids.popleft(), None)
+
+        job.finished.set()
@@ -0,0 +1,181 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# states of the urls in the journal
+PENDING = "pending"
+FETCHED = "fetched"
+PARSED = "parsed"
+FAILED = "failed"
+
+
+class ScrapeJournal:
+    """
+    Durable journal of a scrape run, recording the state of each url, i.e.
+    'pending', 'fetched' (only downloaded), 'parsed' or 'failed', together
+    with the number of attempts and the last error.
+
+    The urls keep the order in which they are added, so that a resumed run
+    continues in the same order. Updates are committed in batches, by count or
+    by time, and on close, so a crash loses at most the last batch, which is
+    simply scraped again.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS urls (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        url TEXT UNIQUE,
+        state TEXT,
+        attempts INTEGER DEFAULT 0,
+        last_error TEXT,
+        updated_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS urls_state ON urls (state);
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        commit_every: int = 100,
+        commit_interval: float = 5.0,
+    ):
+        """
+        :param db_path: path to the database file
+        :param commit_every: commit after every such number of updates
+        :param commit_interval: commit if the last commit is older than such
+          number of seconds
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.pending = 0
+        self.last_commit = time.monotonic()
+
+        self.conn = sqlite3.connect(
+            db_path, timeout=60, check_same_thread=False
+        )
+        self.lock = threading.RLock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def reset(self, urls: Iterable[str], fresh: bool = False):
+        """
+        Start a new run of the urls, whose records are reset to pending with
+        their attempts kept. The records of the other urls, e.g. the failures
+        of the runs of other lists, are kept for `retry_failed`.
+
+        :param fresh: drop the records of all the urls of the previous runs
+        """
+        with self.lock:
+            if fresh:
+                self.conn.execute("DELETE FROM urls")
+            self.conn.executemany(
+                "INSERT INTO urls (url, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET state = excluded.state, "
+                "updated_at = excluded.updated_at",
+                ((url, PENDING, time.time()) for url in urls),
+            )
+            self.commit()
+
+    def unfinished(self, download_only: bool = False) -> List[str]:
+        """
+        Get the urls to scrape when resuming, in the original order.
+
+        :param download_only: whether the run only downloads the pages, in
+          which case the fetched urls are finished as well
+        """
+        states = (PENDING,) if download_only else (PENDING, FETCHED)
+        return self._urls_in(states)
+
+    def failed(self) -> List[Tuple[str, int, Optional[str]]]:
+        """
+        Get the failed urls as (url, attempts, last error), in the original
+        order.
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT url, attempts, last_error FROM urls WHERE state = ? "
+                "ORDER BY seq",
+                (FAILED,),
+            ).fetchall()
+
+    def retry_failed(self, max_attempts: Optional[int] = None) -> int:
+        """
+        Mark the failed urls as pending again.
+
+        :param max_attempts: skip the urls which have been attempted such
+          number of times
+        :return: number of urls to retry
+        """
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE urls SET state = ?, updated_at = ? "
+                "WHERE state = ? AND (? IS NULL OR attempts < ?)",
+                (PENDING, time.time(), FAILED, max_attempts, max_attempts),
+            )
+            self.commit()
+        return cursor.rowcount
+
+    def mark(self, url: str, state: str, error: Optional[str] = None):
+        """
+        Record the outcome of an attempt of the url.
+        """
+        with self.lock:
+            self.conn.execute(
+                "UPDATE urls SET state = ?, attempts = attempts + 1, "
+                "last_error = ?, updated_at = ? WHERE url = ?",
+                (state, error, time.time(), url),
+            )
+            self.pending += 1
+            if (
+                self.pending >= self.commit_every
+                or time.monotonic() - self.last_commit >= self.commit_interval
+            ):
+                self.commit()
+
+    def summary(self) -> Dict[str, int]:
+        """
+        Get the number of urls in each state.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT state, count(*) FROM urls GROUP BY state"
+            ).fetchall()
+        counts = dict(rows)
+        return {
+            state: counts[state]
+            for state in (PENDING, FETCHED, PARSED, FAILED)
+            if state in counts
+        }
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+            self.pending = 0
+            self.last_commit = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.conn.close()
+
+    def _urls_in(self, states: tuple) -> List[str]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT url FROM urls WHERE state IN ({}) ORDER BY seq".format(
+                    ", ".join("?" * len(states))
+                ),
+                states,
+            ).fetchall()
+        return [url for (url,) in rows]
@@ -0,0 +1,208 @@
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from scrape_taobao.core.parse_item_page import parser_version
+
+
+@dataclasses.dataclass
+class ManifestEntry:
+    # hash of the parsed page source
+    page_hash: str
+    # platform of the item, which decides the parser
+    platform: str
+    # version of the parser
+    parser_version: int
+    # hash of the parsed item data
+    output_hash: str
+    # timestamp of the parsing
+    parsed_at: float
+    # stamp of the cached page, see `PageCache.stamp`, None if unknown
+    page_stamp: Optional[str] = None
+
+
+class ParseManifest:
+    """
+    Manifest of the parsed items, recording for each item the hash of its page,
+    the version of the parser and the hash of the parsed item data.
+
+    It tells whether an item has to be re-parsed, i.e. its page is new or
+    changed, or its parser has been updated since.
+
+    The stamp of the cached page is recorded as well, so that a page whose
+    stamp is unchanged can be told unchanged without reading and hashing it.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS manifest (
+        item_id TEXT PRIMARY KEY,
+        page_hash TEXT,
+        platform TEXT,
+        parser_version INTEGER,
+        output_hash TEXT,
+        parsed_at REAL,
+        page_stamp TEXT
+    );
+    """
+
+    COLUMNS = (
+        "page_hash, platform, parser_version, output_hash, parsed_at, "
+        "page_stamp"
+    )
+
+    def __init__(self, db_path: str, commit_every: int = 100):
+        """
+        :param db_path: path to the database file
+        :param commit_every: commit after every such number of records, use a
+          small number when there are writers in the other processes
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self.commit_every = commit_every
+        self.pending = 0
+
+        self.conn = sqlite3.connect(
+            db_path, timeout=60, check_same_thread=False
+        )
+        self.lock = threading.RLock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(self.SCHEMA)
+            self._migrate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def get(self, item_id: str) -> Optional[ManifestEntry]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT {} FROM manifest WHERE item_id = ?".format(
+                    self.COLUMNS
+                ),
+                (item_id,),
+            ).fetchone()
+        return ManifestEntry(*row) if row else None
+
+    def check(
+        self,
+        item_id: str,
+        page_hash: Optional[str] = None,
+        since: Optional[float] = None,
+    ) -> Optional[str]:
+        """
+        Check whether the item has to be re-parsed.
+
+        :param item_id: id of the item
+        :param page_hash: hash of the current page, the page is assumed to be
+          unchanged if None
+        :param since: a timestamp, the item has to be re-parsed if it is
+          parsed before that
+        :return: the reason to re-parse the item, or None if it is up to date
+        """
+        entry = self.get(item_id)
+        if entry is None:
+            return "new"
+        if page_hash is not None and entry.page_hash != page_hash:
+            return "page changed"
+        if entry.parser_version != parser_version(entry.platform):
+            return "parser updated"
+        if since is not None and entry.parsed_at < since:
+            return "parsed before {}".format(time.ctime(since))
+        return None
+
+    def record(
+        self,
+        item_id: str,
+        page_hash: str,
+        platform: str,
+        output_hash: str,
+        page_stamp: Optional[str] = None,
+    ):
+        """
+        :param page_stamp: stamp of the cached page, None if not cached yet
+        """
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO manifest (item_id, {}) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)".format(self.COLUMNS),
+                (
+                    item_id,
+                    page_hash,
+                    platform,
+                    parser_version(platform),
+                    output_hash,
+                    time.time(),
+                    page_stamp,
+                ),
+            )
+            self._written()
+
+    def restamp(self, item_id: str, page_stamp: str):
+        """
+        Record the new stamp of the page, which is rewritten but unchanged.
+        """
+        with self.lock:
+            self.conn.execute(
+                "UPDATE manifest SET page_stamp = ? WHERE item_id = ?",
+                (page_stamp, item_id),
+            )
+            self._written()
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.conn.close()
+
+    def _written(self):
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def _migrate(self):
+        # the manifests written before the page stamps
+        columns = {
+            row[1] for row in self.conn.execute("PRAGMA table_info(manifest)")
+        }
+        if "page_stamp" not in columns:
+            try:
+                self.conn.execute(
+                    "ALTER TABLE manifest ADD COLUMN page_stamp TEXT"
+                )
+            except sqlite3.OperationalError as e:
+                # added by another process meanwhile
+                if "duplicate column" not in str(e):
+                    raise
+
+
+def open_manifest(out_dir: str, **kwargs) -> ParseManifest:
+    """
+    Open the manifest of the items in `out_dir`, i.e. '<out_dir>/.manifest'.
+    """
+    return ParseManifest(os.path.join(out_dir, ".manifest"), **kwargs)
+
+
+def hash_page(page_source: str) -> str:
+    return hashlib.blake2b(
+        page_source.encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def hash_item(item: dict) -> str:
+    return hashlib.blake2b(
+        json.dumps(item, sort_keys=True, ensure_ascii=False).encode("utf-8"),
+        digest_size=16,
+    ).hexdigest()
@@ -0,0 +1,413 @@
+"""
+Metrics of the scrape and parse runs.
+
+The stages of each item, e.g. fetching, parsing and dumping, are timed into
+latency histograms, and the outcomes, the cache hits and misses and the
+failure reasons are counted. The metrics can be summarized as json at the end
+of a run, and exported periodically as a Prometheus textfile, e.g. for the
+textfile collector of the node exporter.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Tuple
+
+import rich.progress
+from rich.text import Text
+
+# upper bounds in seconds of the latency buckets, from reading a cached page
+# to logging in
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+METRIC_PREFIX = "scrape_taobao_"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, as the Prometheus histogram.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # the last count is of the values above all the buckets
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, state: dict):
+        """
+        Merge the state of another histogram with the same buckets.
+        """
+        for i, count in enumerate(state["counts"]):
+            self.counts[i] += count
+        self.count += state["count"]
+        self.sum += state["sum"]
+        for value in (state["min"], state["max"]):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def state(self) -> dict:
+        return dict(
+            counts=list(self.counts),
+            count=self.count,
+            sum=self.sum,
+            min=self.min,
+            max=self.max,
+        )
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate the quantile by interpolating in its bucket.
+        """
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def summary(self) -> dict:
+        return dict(
+            count=self.count,
+            sum=round(self.sum, 6),
+            mean=round(self.sum / self.count, 6) if self.count else None,
+            min=self.min,
+            p50=self.quantile(0.5),
+            p90=self.quantile(0.9),
+            p99=self.quantile(0.99),
+            max=self.max,
+        )
+
+
+class Metrics:
+    """
+    Thread-safe collection of labelled counters and histograms.
+
+    The metrics used by the commands:
+      - `items_total{outcome}`: items scraped or parsed, skipped or failed;
+      - `stage_seconds{stage}`: latency of the stages, i.e. 'login', 'pause',
+        'fetch' (including the pacing pause), 'cache_read', 'cache_write',
+        'parse', 'dump' and 'parse_wait' (the blocking of the fetching on the
+        parse stage of the pipelined scrape);
+      - `cache_total{cache, result}`: hits and misses of the caches which let
+        the stages be skipped, i.e. the existing items ('item'), the cached
+        pages ('page'), the up-to-date pages in the manifest ('manifest') and
+        the unchanged items ('output');
+      - `failures_total{stage, reason}`: failures by stage and reason.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        key = name, _labels(labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = name, _labels(labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Time the stage into `stage_seconds`, even if it fails.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(
+                "stage_seconds", time.perf_counter() - start, stage=stage
+            )
+
+    def fail(self, stage: str, e: BaseException):
+        self.inc("failures_total", stage=stage, reason=failure_reason(e))
+
+    def state(self) -> dict:
+        """
+        Dump the raw state, which can be merged into another instance, e.g.
+        from a worker process to the main process.
+        """
+        with self.lock:
+            return dict(
+                counters=[
+                    (name, labels, value)
+                    for (name, labels), value in self.counters.items()
+                ],
+                histograms=[
+                    (name, labels, histogram.state())
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+            )
+
+    def merge(self, state: dict):
+        with self.lock:
+            for name, labels, value in state["counters"]:
+                key = name, tuple(map(tuple, labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+
+            for name, labels, histogram_state in state["histograms"]:
+                key = name, tuple(map(tuple, labels))
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram()
+                self.histograms[key].merge(histogram_state)
+
+    def summary(self) -> dict:
+        """
+        Summarize the metrics as a json-serializable dict, whose labels are
+        joined as 'key=value,...'.
+        """
+        with self.lock:
+            summary = dict(
+                started_at=self.started_at,
+                elapsed=round(time.time() - self.started_at, 3),
+                counters={},
+                histograms={},
+            )
+            for (name, labels), value in sorted(self.counters.items()):
+                summary["counters"].setdefault(name, {})[
+                    _join_labels(labels)
+                ] = value
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                summary["histograms"].setdefault(name, {})[
+                    _join_labels(labels)
+                ] = histogram.summary()
+            return summary
+
+    def to_prometheus(self) -> str:
+        """
+        Format the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                name = METRIC_PREFIX + name
+                if name not in typed:
+                    typed.add(name)
+                    lines.append("# TYPE {} counter".format(name))
+                lines.append(
+                    "{}{} {}".format(name, _format_labels(labels), value)
+                )
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                name = METRIC_PREFIX + name
+                if name not in typed:
+                    typed.add(name)
+                    lines.append("# TYPE {} histogram".format(name))
+
+                cumulative = 0
+                bounds = [repr(b) for b in histogram.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        "{}_bucket{} {}".format(
+                            name,
+                            _format_labels(labels + (("le", bound),)),
+                            cumulative,
+                        )
+                    )
+                lines.append(
+                    "{}_sum{} {}".format(
+                        name, _format_labels(labels), histogram.sum
+                    )
+                )
+                lines.append(
+                    "{}_count{} {}".format(
+                        name, _format_labels(labels), histogram.count
+                    )
+                )
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: str):
+        _write_atomically(path, json.dumps(self.summary(), indent=2) + "\n")
+
+    def write_prometheus(self, path: str):
+        _write_atomically(path, self.to_prometheus())
+
+    def format_stages(self) -> str:
+        """
+        Format the stage latencies in a line, for logging.
+        """
+        with self.lock:
+            stages = sorted(
+                (dict(labels)["stage"], histogram)
+                for (name, labels), histogram in self.histograms.items()
+                if name == "stage_seconds"
+            )
+            return ", ".join(
+                "{} {} x {:.1f}ms".format(
+                    stage,
+                    histogram.count,
+                    histogram.sum / histogram.count * 1000,
+                )
+                for stage, histogram in stages
+            )
+
+
+@contextmanager
+def exporting_metrics(
+    metrics: Metrics,
+    json_path: Optional[str] = None,
+    prometheus_path: Optional[str] = None,
+    interval: float = 15.0,
+):
+    """
+    Rewrite the Prometheus textfile periodically in the background while
+    running, and write the json summary and the textfile at last.
+
+    :param json_path: path of the json summary, None to skip it
+    :param prometheus_path: path of the Prometheus textfile, None to skip it
+    :param interval: seconds between the rewrites of the textfile
+    """
+    stopped = threading.Event()
+
+    def export_periodically():
+        while not stopped.wait(interval):
+            metrics.write_prometheus(prometheus_path)
+
+    thread = None
+    if prometheus_path:
+        thread = threading.Thread(
+            target=export_periodically, name="metrics-exporter", daemon=True
+        )
+        thread.start()
+
+    try:
+        yield metrics
+    finally:
+        stopped.set()
+        if thread is not None:
+            thread.join()
+            metrics.write_prometheus(prometheus_path)
+        if json_path:
+            metrics.write_json(json_path)
+
+
+def failure_reason(e: BaseException) -> str:
+    """
+    The reason of a failure, i.e. the signal of a validation page, or the
+    class name of the error.
+    """
+    return getattr(e, "signal", None) or type(e).__name__
+
+
+class ThroughputColumn(rich.progress.ProgressColumn):
+    """
+    Renders the live number of units done per second, or per minute if slow.
+    """
+
+    def __init__(self, unit: str = "items"):
+        super().__init__()
+        self.unit = unit
+
+    def render(self, task: rich.progress.Task) -> Text:
+        speed = task.finished_speed or task.speed
+        if speed is None:
+            return Text(
+                "-- {}/s".format(self.unit), style="progress.data.speed"
+            )
+        if speed < 1:
+            return Text(
+                "{:.1f} {}/min".format(speed * 60, self.unit),
+                style="progress.data.speed",
+            )
+        return Text(
+            "{:.1f} {}/s".format(speed, self.unit), style="progress.data.speed"
+        )
+
+
+def make_progress(unit: str = "items") -> rich.progress.Progress:
+    """
+    Make a transient progress bar with the throughput and the ETA.
+    """
+    return rich.progress.Progress(
+        rich.progress.TextColumn("[progress.description]{task.description}"),
+        rich.progress.BarColumn(),
+        rich.progress.MofNCompleteColumn(),
+        ThroughputColumn(unit),
+        rich.progress.TextColumn("eta"),
+        rich.progress.TimeRemainingColumn(),
+        transient=True,
+    )
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _join_labels(labels: Labels) -> str:
+    return ",".join("{}={}".format(k, v) for k, v in labels)
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(
+                k,
+                v.replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for k, v in labels
+        )
+    )
+
+
+def _write_atomically(path: str, content: str):
+    """
+    Write to a temporary file and rename it, so that readers, e.g. the node
+    exporter, never see a partial file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
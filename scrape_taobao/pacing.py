@@ -0,0 +1,227 @@
+"""
+Adaptive pacing of the requests to the item pages.
+
+Instead of pausing for a fixed random time after every item, the pacer hands
+out the request slots from a token bucket with jittered gaps, and adapts the
+rate to the responses: it speeds up additively while the pages come back
+clean, and backs off exponentially, with a cooling-down pause, once any sign
+of blocking shows up, i.e. a captcha, a login redirection or an emptied sku
+map.
+"""
+import collections
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+from scrape_taobao.core.fetch_item_page import (
+    PAGE_CLEAN,
+    PAGE_ERROR,
+    PAGE_NOT_FOUND,
+    ItemPageFetcher,
+    JunkPageError,
+)
+from scrape_taobao.metrics import Metrics
+from scrape_taobao.utils import env_or
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptivePacer:
+    """
+    Token bucket whose rate adapts to the signals of the fetched pages.
+
+    Thread-safe, so that it can be shared by the workers of a scrape pool.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        *,
+        min_rate: float,
+        max_rate: float,
+        burst: int = 1,
+        jitter: float = 0.5,
+        increase: Optional[float] = None,
+        backoff: float = 2.0,
+        cooldown: float = 30.0,
+        max_cooldown: float = 900.0,
+    ):
+        """
+        :param rate: initial number of requests per second
+        :param min_rate: the rate never goes below it when backing off
+        :param max_rate: the rate never goes above it when speeding up
+        :param burst: max number of requests allowed at once after idling
+        :param jitter: the gaps between requests are randomized by the ratio
+        :param increase: rate increase per clean page, default to a twentieth
+          of the initial rate
+        :param backoff: the rate is divided by it on each blocked page
+        :param cooldown: pause in seconds after a blocked page, doubled for
+          each consecutive blocked page
+        :param max_cooldown: max pause in seconds after a blocked page
+        """
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = max(1, burst)
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.increase = rate / 20 if increase is None else increase
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+        self.blocked_until = 0.0
+        self.blocked_streak = 0
+
+        self.started_at = time.monotonic()
+        self.signals = collections.Counter()
+        self.backoffs = 0
+        self.waited = 0.0
+
+    @classmethod
+    def from_env(cls, workers: int = 1) -> "AdaptivePacer":
+        """
+        Create a pacer for the workers, configured by the environment.
+
+        The initial gap of each worker is the mean of `FAKE_PAUSE_MIN_GAP` and
+        `FAKE_PAUSE_MAX_GAP`, and the gap never goes below the former.
+        """
+        min_gap = float(env_or(None, "FAKE_PAUSE_MIN_GAP", 0.5))
+        max_gap = float(env_or(None, "FAKE_PAUSE_MAX_GAP", 3.0))
+        mean_gap = (min_gap + max_gap) / 2
+
+        return cls(
+            workers / max(mean_gap, 1e-3),
+            min_rate=workers / max(max_gap * 20, 1e-3),
+            max_rate=workers / max(min_gap, 1e-3),
+            burst=workers,
+            cooldown=float(env_or(None, "PACING_COOLDOWN", 30.0)),
+        )
+
+    def wait(self, stopped: Optional[threading.Event] = None) -> float:
+        """
+        Wait for the slot of the next request.
+
+        :param stopped: stop waiting early once it is set
+        :return: seconds waited
+        """
+        with self.lock:
+            now = time.monotonic()
+            # unused tokens are kept up to the burst
+            earliest = now - (self.burst - 1) / self.rate
+            start = max(self.next_time, earliest, self.blocked_until)
+            gap = random.uniform(1 - self.jitter, 1 + self.jitter) / self.rate
+            self.next_time = start + gap
+
+        delay = max(0.0, start - now)
+        if delay > 0:
+            if stopped is not None:
+                stopped.wait(delay)
+            else:
+                time.sleep(delay)
+
+        with self.lock:
+            self.waited += delay
+        return delay
+
+    def report(self, signal: str):
+        """
+        Adapt the rate to the signal of a fetched page, see `classify_page`.
+        """
+        with self.lock:
+            self.signals[signal] += 1
+
+            if signal == PAGE_ERROR:
+                # network errors tell nothing about blocking
+                return
+
+            # the not found pages are served as usual
+            if signal in (PAGE_CLEAN, PAGE_NOT_FOUND):
+                self.blocked_streak = 0
+                self.rate = min(self.max_rate, self.rate + self.increase)
+                return
+
+            self.blocked_streak += 1
+            self.backoffs += 1
+            self.rate = max(self.min_rate, self.rate / self.backoff)
+            cooldown = min(
+                self.max_cooldown,
+                self.cooldown * 2 ** (self.blocked_streak - 1),
+            )
+            self.blocked_until = max(
+                self.blocked_until, time.monotonic() + cooldown
+            )
+
+        logger.warning(
+            "{} page fetched, slow down to {:.2f} requests/s after {:.1f}s "
+            "cooling down".format(signal, self.rate, cooldown)
+        )
+
+    def stats(self) -> dict:
+        """
+        Get the statistics of the pacing since the pacer is created.
+        """
+        with self.lock:
+            elapsed = max(time.monotonic() - self.started_at, 1e-9)
+            pages = sum(self.signals.values())
+            return dict(
+                pages=pages,
+                signals=dict(self.signals),
+                backoffs=self.backoffs,
+                rate=self.rate,
+                waited=self.waited,
+                elapsed=elapsed,
+                pages_per_hour=pages / elapsed * 3600,
+            )
+
+
+class PacedItemPageFetcher(ItemPageFetcher):
+    """
+    Fetch item pages with the fetcher, paced by the pacer.
+
+    Only the actual fetches are paced, the items whose pages are cached go
+    without waiting. The waits are timed into the metrics as the 'pause'
+    stage if the metrics are given.
+    """
+
+    def __init__(
+        self,
+        fetcher: ItemPageFetcher,
+        pacer: AdaptivePacer,
+        stopped: Optional[threading.Event] = None,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.fetcher = fetcher
+        self.pacer = pacer
+        self.stopped = stopped
+        self.metrics = metrics
+
+    def fetch(self, url: str) -> str:
+        waited = self.pacer.wait(self.stopped)
+        if self.metrics is not None:
+            self.metrics.observe("stage_seconds", waited, stage="pause")
+
+        try:
+            page_source = self.fetcher.fetch(url)
+        except JunkPageError as e:
+            self.pacer.report(e.signal)
+            raise
+        except Exception:
+            self.pacer.report(PAGE_ERROR)
+            raise
+
+        # the fetchers raise on the junk pages, with their signals told from
+        # the final urls, so the returned pages are clean
+        self.pacer.report(PAGE_CLEAN)
+        return page_source
+
+
+def format_pacing_stats(stats: dict) -> str:
+    return (
+        "{pages} pages in {elapsed:.0f}s, {pages_per_hour:.0f} pages/h, "
+        "waited {waited:.0f}s, backed off {backoffs} times, "
+        "final rate {rate:.2f} requests/s, signals: {signals}".format(**stats)
+    )
@@ -0,0 +1,398 @@
+import glob
+import logging
+import lzma
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PageCache:
+    """
+    Cache of the fetched page sources, keyed by item id such as 'id=123'.
+
+    See `open_page_cache` for the available backends.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __contains__(self, item_id: str) -> bool:
+        raise NotImplementedError
+
+    def get(self, item_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def put(self, item_id: str, page_source: str):
+        raise NotImplementedError
+
+    def stamp(self, item_id: str) -> Optional[str]:
+        """
+        Get a stamp of the cached page without reading it, which changes
+        whenever the page is put again.
+
+        :return: None if the page is not cached
+        """
+        raise NotImplementedError
+
+    def ids(self) -> Iterator[str]:
+        """
+        Iterate over the ids of all the cached pages, in the order of the
+        cheapest sequential reading.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class DirPageCache(PageCache):
+    """
+    Cache each page in a file '<pages_dir>/<item_id>.html'.
+    """
+
+    def __init__(self, pages_dir: str):
+        self.pages_dir = pages_dir
+
+    def path_of(self, item_id: str) -> str:
+        return os.path.join(self.pages_dir, "{}.html".format(item_id))
+
+    def __contains__(self, item_id: str) -> bool:
+        return os.path.exists(self.path_of(item_id))
+
+    def get(self, item_id: str) -> Optional[str]:
+        page_path = self.path_of(item_id)
+        if not os.path.exists(page_path):
+            return None
+
+        with open(page_path) as f:
+            return f.read()
+
+    def put(self, item_id: str, page_source: str):
+        with open(self.path_of(item_id), "w+") as f:
+            f.write(page_source)
+
+    def stamp(self, item_id: str) -> Optional[str]:
+        try:
+            stat = os.stat(self.path_of(item_id))
+        except FileNotFoundError:
+            return None
+        return "{}:{}".format(stat.st_size, stat.st_mtime_ns)
+
+    def ids(self) -> Iterator[str]:
+        for page_path in glob.glob(os.path.join(self.pages_dir, "id=*.html")):
+            yield os.path.basename(page_path)[: -len(".html")]
+
+
+class PackPageCache(PageCache):
+    """
+    Cache the pages compressed, in append-only pack files with an index.
+
+    The pages are appended to '<pages_dir>/pack-<n>.pack', and a new pack is
+    started once the current one exceeds `max_pack_size`. The index
+    '<pages_dir>/index.sqlite' maps each item id to the pack, offset, length
+    and codec of its latest page, so that lookups never touch the file system
+    besides the index. Appending and indexing are done in a write transaction
+    of the index, which serializes the writers across processes.
+
+    Supported codecs:
+      - 'zlib': plain zlib;
+      - 'lzma': slower but smaller than zlib;
+      - 'zdict': zlib with a dictionary shared by all the pages, which is built
+        from the first cached page and saved as '<pages_dir>/zdict.bin'. The
+        boilerplate of the pages is thus compressed away.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS pages (
+        item_id TEXT PRIMARY KEY,
+        pack INTEGER,
+        offset INTEGER,
+        length INTEGER,
+        raw_length INTEGER,
+        codec TEXT
+    );
+    """
+
+    CODECS = ("zlib", "lzma", "zdict")
+
+    # zlib only uses the last 32KB of a dictionary
+    ZDICT_SIZE = 32 * 1024
+
+    def __init__(
+        self,
+        pages_dir: str,
+        codec: str = "zdict",
+        *,
+        max_pack_size: int = 1 << 30,
+        commit_every: int = 1,
+    ):
+        """
+        :param pages_dir: directory of the packs and the index
+        :param codec: codec of the newly cached pages, see the class docstring
+        :param max_pack_size: max size of a pack file in bytes
+        :param commit_every: commit the index after every such number of
+          writes, the writers of the other processes are blocked until then
+        """
+        if codec not in self.CODECS:
+            raise ValueError("unsupported codec: {}".format(codec))
+
+        os.makedirs(pages_dir, exist_ok=True)
+
+        self.pages_dir = pages_dir
+        self.codec = codec
+        self.max_pack_size = max_pack_size
+        self.commit_every = commit_every
+        self.pending = 0
+
+        self.conn = sqlite3.connect(
+            os.path.join(pages_dir, "index.sqlite"),
+            timeout=60,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self.lock = threading.RLock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(self.SCHEMA)
+
+        self.read_fds: Dict[int, int] = {}
+        self.zdict: Optional[bytes] = None
+
+    def pack_path(self, pack: int) -> str:
+        return os.path.join(self.pages_dir, "pack-{:05d}.pack".format(pack))
+
+    def __contains__(self, item_id: str) -> bool:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM pages WHERE item_id = ?", (item_id,)
+            ).fetchone()
+        return row is not None
+
+    def get(self, item_id: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT pack, offset, length, codec FROM pages "
+                "WHERE item_id = ?",
+                (item_id,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        pack, offset, length, codec = row
+        data = self._read(pack, offset, length)
+        return self._decompress(data, codec).decode("utf-8")
+
+    def put(self, item_id: str, page_source: str):
+        raw = page_source.encode("utf-8")
+
+        with self.lock:
+            began = self.pending == 0
+            if began:
+                # lock the index against the writers of the other processes
+                self.conn.execute("BEGIN IMMEDIATE")
+
+            appended = None
+            try:
+                data = self._compress(raw)
+                appended = self._append(data)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                    (item_id, *appended, len(data), len(raw), self.codec),
+                )
+            except BaseException:
+                # drop the page never indexed, while keeping the pages put
+                # before in the transaction unless it is gone with the error
+                if appended is not None:
+                    self._truncate(*appended)
+                if began or not self.conn.in_transaction:
+                    if self.conn.in_transaction:
+                        self.conn.execute("ROLLBACK")
+                    self.pending = 0
+                raise
+
+            self.pending += 1
+            if self.pending >= self.commit_every:
+                self.commit()
+
+    def stamp(self, item_id: str) -> Optional[str]:
+        # the packs are append-only, so that a page put again moves
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT pack, offset, length FROM pages WHERE item_id = ?",
+                (item_id,),
+            ).fetchone()
+        return "{}:{}:{}".format(*row) if row else None
+
+    def ids(self) -> Iterator[str]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT item_id FROM pages ORDER BY pack, offset"
+            ).fetchall()
+        return (item_id for (item_id,) in rows)
+
+    def stats(self) -> dict:
+        """
+        Get the number of pages, and their raw and compressed sizes in bytes.
+        """
+        with self.lock:
+            pages, raw_size, size = self.conn.execute(
+                "SELECT count(*), sum(raw_length), sum(length) FROM pages"
+            ).fetchone()
+        return dict(pages=pages, raw_size=raw_size or 0, size=size or 0)
+
+    def commit(self):
+        with self.lock:
+            if self.pending:
+                self.conn.execute("COMMIT")
+                self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.conn.close()
+            for fd in self.read_fds.values():
+                os.close(fd)
+            self.read_fds.clear()
+
+    def _append(self, data: bytes):
+        pack = self.conn.execute(
+            "SELECT coalesce(max(pack), 0) FROM pages"
+        ).fetchone()[0]
+        pack = max(pack, 1)
+
+        pack_path = self.pack_path(pack)
+        if os.path.exists(pack_path):
+            if os.path.getsize(pack_path) + len(data) > self.max_pack_size:
+                pack += 1
+                pack_path = self.pack_path(pack)
+
+        f = open(pack_path, "ab")
+        offset = f.tell()
+        try:
+            with f:
+                f.write(data)
+        except BaseException:
+            # truncated after closed, so that no buffered bytes follow
+            self._truncate(pack, offset)
+            raise
+
+        return pack, offset
+
+    def _truncate(self, pack: int, offset: int):
+        """
+        Truncate the pack to the offset, dropping the page appended there.
+        """
+        try:
+            os.truncate(self.pack_path(pack), offset)
+        except OSError as e:
+            # the bytes are never indexed, only wasting the space
+            logger.warning(
+                "failed to truncate pack {} to {}: {}".format(pack, offset, e)
+            )
+
+    def _read(self, pack: int, offset: int, length: int) -> bytes:
+        with self.lock:
+            fd = self.read_fds.get(pack)
+            if fd is None:
+                fd = os.open(self.pack_path(pack), os.O_RDONLY)
+                self.read_fds[pack] = fd
+
+        if hasattr(os, "pread"):
+            return os.pread(fd, length, offset)
+
+        with self.lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, length)
+
+    def _compress(self, raw: bytes) -> bytes:
+        if self.codec == "zlib":
+            return zlib.compress(raw, 6)
+        if self.codec == "lzma":
+            return lzma.compress(raw)
+
+        compressor = zlib.compressobj(6, zdict=self._load_zdict(raw))
+        return compressor.compress(raw) + compressor.flush()
+
+    def _decompress(self, data: bytes, codec: str) -> bytes:
+        if codec == "zlib":
+            return zlib.decompress(data)
+        if codec == "lzma":
+            return lzma.decompress(data)
+        if codec == "zdict":
+            decompressor = zlib.decompressobj(zdict=self._load_zdict())
+            return decompressor.decompress(data) + decompressor.flush()
+        raise ValueError("unsupported codec: {}".format(codec))
+
+    def _load_zdict(self, sample: Optional[bytes] = None) -> bytes:
+        """
+        Load the shared dictionary, or build it from the sample page if it has
+        not been built yet.
+        """
+        if self.zdict is not None:
+            return self.zdict
+
+        zdict_path = os.path.join(self.pages_dir, "zdict.bin")
+        if not os.path.exists(zdict_path):
+            if sample is None:
+                raise FileNotFoundError(zdict_path)
+
+            # the head and the tail of the pages are mostly boilerplate
+            half = self.ZDICT_SIZE // 2
+            zdict = sample[:half] + sample[-half:]
+
+            # create exclusively, in case another process is building it
+            try:
+                with open(zdict_path, "xb") as f:
+                    f.write(zdict)
+            except FileExistsError:
+                pass
+
+        with open(zdict_path, "rb") as f:
+            self.zdict = f.read()
+        return self.zdict
+
+
+def open_page_cache(page_cache: str, pages_dir: str, **kwargs) -> PageCache:
+    """
+    Open the page cache.
+
+    :param page_cache: the backend of the cache:
+      - 'dir': one file per page, i.e. '<pages_dir>/<item_id>.html';
+      - 'pack': compressed pages packed in '<pages_dir>/pack-*.pack';
+      - 'pack:<codec>': the same but using the codec, see `PackPageCache`.
+    :param pages_dir: directory of the pages
+    :param kwargs: passed to `PackPageCache`
+    """
+    if page_cache == "dir":
+        return DirPageCache(pages_dir)
+
+    if page_cache == "pack":
+        return PackPageCache(pages_dir, **kwargs)
+
+    if page_cache.startswith("pack:"):
+        return PackPageCache(
+            pages_dir, codec=page_cache[len("pack:") :], **kwargs
+        )
+
+    raise ValueError("unsupported page cache: {}".format(page_cache))
+
+
+def copy_pages(
+    src: PageCache, dst: PageCache, item_ids: Iterable[str], on_copied=None
+):
+    """
+    Copy the pages of the item ids from one cache to another.
+    """
+    for item_id in item_ids:
+        page_source = src.get(item_id)
+        if page_source is not None:
+            dst.put(item_id, page_source)
+        if on_copied is not None:
+            on_copied(item_id)
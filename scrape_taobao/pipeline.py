@@ -0,0 +1,97 @@
+"""
+Background stage of the pipelined scrape.
+
+Without the pipeline, each browser thread fetches a page, caches it, parses it
+and dumps the item before fetching the next page, so that the browser idles
+while parsing. With the pipeline, the fetching threads hand the cache writing,
+the parsing and the dumping over to a few background threads, and go on
+fetching. The hand-over queue is bounded, so that the fetching threads block
+once the parsing falls behind, and the pending page sources never pile up.
+"""
+import logging
+import queue
+import threading
+from typing import Callable, Optional
+
+from scrape_taobao.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ParseStage:
+    """
+    A pool of threads running the tasks handed over by the fetching threads.
+
+    The outcome of each task is reported to `on_done` with the key of the
+    task, e.g. its url, and the error if failed, from the thread running it.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        max_pending: Optional[int] = None,
+        on_done: Optional[Callable[[str, Optional[Exception]], None]] = None,
+        metrics: Optional[Metrics] = None,
+    ):
+        """
+        :param workers: number of the background threads
+        :param max_pending: max number of the tasks waiting in the queue,
+          default to twice the number of the workers
+        :param on_done: called with the key and the error, None if succeeded,
+          once each task is done
+        :param metrics: the metrics to time the blocking of the submitters
+          into, as the stage 'parse_wait'
+        """
+        self.tasks = queue.Queue(maxsize=max_pending or 2 * workers)
+        self.on_done = on_done
+        self.metrics = metrics or Metrics()
+
+        self.threads = [
+            threading.Thread(
+                target=self._work, name="parse-{}".format(i), daemon=True
+            )
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def submit(self, key: str, task: Callable[[], None]):
+        """
+        Queue the task, blocking while the queue is full.
+        """
+        with self.metrics.timer("parse_wait"):
+            self.tasks.put((key, task))
+
+    def close(self):
+        """
+        Wait for the queued tasks to be done, and stop the threads.
+        """
+        for _ in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            entry = self.tasks.get()
+            if entry is None:
+                return
+
+            key, task = entry
+            error = None
+            try:
+                task()
+            except Exception as e:
+                error = e
+
+            if self.on_done is not None:
+                try:
+                    self.on_done(key, error)
+                except Exception as e:
+                    logger.exception('failed to finish "{}": {}'.format(key, e))
@@ -0,0 +1,223 @@
+"""
+Recovery of a long scrape from the failures in the middle of the run.
+
+The failures of the items are classified, see `classify_failure`, so that
+only the ones not of the items themselves are retried. The failures telling
+that the session is broken, i.e. a login redirection, or a captcha or an
+emptied sku map, trip the circuit breaker shared by the workers: every worker
+pauses before its next fetch, while the worker tripping it cools down and logs
+its browser in again in place, whose cookies are then taken by the other
+browsers. A run thus recovers on its own once the login expires, instead of
+failing every item left.
+"""
+import logging
+import threading
+import time
+from typing import Callable, List, Optional
+
+from selenium.common.exceptions import WebDriverException
+
+from scrape_taobao.core.fetch_item_page import (
+    PAGE_LOGIN,
+    ItemNotFoundError,
+    ValidationPageError,
+)
+from scrape_taobao.core.parse_item_page import PageParseError
+from scrape_taobao.utils import env_or
+
+logger = logging.getLogger(__name__)
+
+# kinds of the failures, see `classify_failure`
+FAILURE_NETWORK = "network"
+FAILURE_LOGIN = "login"
+FAILURE_CAPTCHA = "captcha"
+FAILURE_PARSE = "parse"
+FAILURE_NOT_FOUND = "not_found"
+FAILURE_OTHER = "other"
+
+# the failures of the session, which are recovered by logging in again
+SESSION_FAILURES = (FAILURE_LOGIN, FAILURE_CAPTCHA)
+# the failures not of the items themselves, which are worth retrying
+RETRIABLE_FAILURES = SESSION_FAILURES + (FAILURE_NETWORK,)
+
+
+def classify_failure(error: Exception) -> str:
+    """
+    Tell the kind of the failure of an item from its error.
+
+    :return: one of `FAILURE_LOGIN` for a login redirection, `FAILURE_CAPTCHA`
+      for a captcha or the other validations, or an emptied sku map,
+      `FAILURE_NOT_FOUND` if the item does not exist, `FAILURE_PARSE` if the
+      page is not parsed, `FAILURE_NETWORK` for the errors of the connection
+      or the browser, otherwise `FAILURE_OTHER`
+    """
+    if isinstance(error, ItemNotFoundError):
+        return FAILURE_NOT_FOUND
+    if isinstance(error, ValidationPageError):
+        return FAILURE_LOGIN if error.signal == PAGE_LOGIN else FAILURE_CAPTCHA
+    if isinstance(error, PageParseError):
+        return FAILURE_PARSE
+
+    # the http errors, e.g. `aiohttp.ClientResponseError` or the errors of
+    # urllib, without importing aiohttp
+    status = getattr(error, "status", None)
+    if status == 404:
+        return FAILURE_NOT_FOUND
+    if isinstance(status, int):
+        return FAILURE_NETWORK
+
+    if isinstance(error, (OSError, TimeoutError, WebDriverException)):
+        return FAILURE_NETWORK
+    return FAILURE_OTHER
+
+
+class CircuitBreaker:
+    """
+    Breaker shared by the workers of a scrape, which pauses all of them while
+    the session is being recovered.
+
+    It trips on a login failure at once, or on `threshold` consecutive
+    captcha or network failures. The worker tripping it is to call `recover`,
+    while the others wait in `wait` until it closes again. The recoveries are
+    retried with a doubled cooldown each time, until any item succeeds in
+    between; after `max_recoveries` failed ones, the breaker gives up, and
+    the workers are to stop, leaving the rest items for resuming.
+    """
+
+    def __init__(
+        self,
+        *,
+        threshold: int = 3,
+        cooldown: float = 60.0,
+        max_cooldown: float = 900.0,
+        max_recoveries: int = 3,
+    ):
+        """
+        :param threshold: number of the consecutive captcha or network
+          failures tripping the breaker
+        :param cooldown: pause in seconds before the first recovery
+        :param max_cooldown: max pause in seconds before a recovery
+        :param max_recoveries: max number of the consecutive recoveries
+          without any success in between
+        """
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_recoveries = max_recoveries
+
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.closed.set()
+        self.streak = 0
+        self.recoveries = 0
+        self.gave_up = False
+
+        # increased by each recovery, with the cookies of the browser logged
+        # in again if any, for the other browsers to take
+        self.generation = 0
+        self.cookies: Optional[List[dict]] = None
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        """
+        Create a breaker, whose cooldown is configured by the environment.
+        """
+        return cls(cooldown=float(env_or(None, "RECOVERY_COOLDOWN", 60.0)))
+
+    def record(self, kind: Optional[str]) -> bool:
+        """
+        Record the outcome of an item.
+
+        :param kind: the kind of the failure, None if succeeded
+        :return: whether the failure trips the breaker, then the caller is to
+          recover it
+        """
+        with self.lock:
+            if kind not in RETRIABLE_FAILURES:
+                # the session works as the item is served, but only a success
+                # tells that the recovery did
+                self.streak = 0
+                if kind is None:
+                    self.recoveries = 0
+                return False
+
+            if not self.closed.is_set() or self.gave_up:
+                # being recovered by another worker, or never again
+                return False
+
+            self.streak += 1
+            if kind != FAILURE_LOGIN and self.streak < self.threshold:
+                return False
+
+            self.streak = 0
+            self.closed.clear()
+            return True
+
+    def wait(self, stopped: Optional[threading.Event] = None) -> bool:
+        """
+        Wait until the breaker is closed.
+
+        :param stopped: stop waiting early once it is set
+        :return: False if the breaker has given up, or waiting is stopped
+        """
+        while not self.closed.wait(0.5):
+            if stopped is not None and stopped.is_set():
+                return False
+        return not self.gave_up
+
+    def recover(
+        self,
+        kind: str,
+        login: Callable[[], Optional[List[dict]]],
+        stopped: Optional[threading.Event] = None,
+    ) -> bool:
+        """
+        Cool down, and log in again for the session failures, then close the
+        breaker.
+
+        :param kind: the kind of the failure tripping the breaker
+        :param login: log the browser in again, returning its cookies for the
+          other browsers, if any
+        :param stopped: stop cooling down early once it is set
+        :return: False if the breaker gives up
+        """
+        with self.lock:
+            self.recoveries += 1
+            attempt = self.recoveries
+
+        if attempt > self.max_recoveries:
+            logger.error(
+                "still failing after {} recoveries, give up".format(
+                    self.max_recoveries
+                )
+            )
+            self.gave_up = True
+            self.closed.set()
+            return False
+
+        cooldown = min(self.max_cooldown, self.cooldown * 2 ** (attempt - 1))
+        logger.warning(
+            "{} failures, pause the workers for {:.0f}s{}".format(
+                kind,
+                cooldown,
+                " and login again" if kind in SESSION_FAILURES else "",
+            )
+        )
+        if stopped is not None:
+            stopped.wait(cooldown)
+        else:
+            time.sleep(cooldown)
+
+        cookies = None
+        if kind in SESSION_FAILURES:
+            try:
+                cookies = login()
+            except Exception as e:
+                # tripped again by the following failures, and retried
+                logger.exception("failed to login again: {}".format(e))
+
+        with self.lock:
+            self.generation += 1
+            self.cookies = cookies
+        self.closed.set()
+        return True
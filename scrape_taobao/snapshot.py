@@ -0,0 +1,194 @@
+"""
+Columnar snapshot of the filterable fields of the items.
+
+The snapshot keeps the price range, the total stock, the sales and the
+platform of all the items in numpy arrays, saved as '.npy' files and loaded as
+memory-mapped arrays. Queries are evaluated as vectorized masks over the
+arrays, so that only the matching items have to be loaded from the store.
+"""
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from scrape_taobao.bean.item_query import PRICE_KEYS, SORT_KEYS, ItemQuery
+from scrape_taobao.store import ItemStore
+
+PLATFORMS = ("taobao", "tmall")
+
+COLUMNS = (
+    "item_ids",
+    "min_price",
+    "max_price",
+    "total_stock",
+    "sales",
+    "platform",
+)
+
+
+class ItemSnapshot:
+    def __init__(self, columns: dict, store_version: str):
+        self.columns = columns
+        self.store_version = store_version
+
+    def __len__(self):
+        return len(self.columns["item_ids"])
+
+    @classmethod
+    def build(cls, store: ItemStore) -> "ItemSnapshot":
+        """
+        Build the snapshot by loading all the items from the store once.
+        """
+        store_version = store.version()
+
+        item_ids, platforms = [], []
+        min_prices, max_prices, total_stocks, sales = [], [], [], []
+        for item_id, item in store.items():
+            item_ids.append(item_id)
+            min_prices.append(item["price_range"][0])
+            max_prices.append(item["price_range"][1])
+            total_stocks.append(item["total_stock"])
+            sales.append(item["sales"])
+            platforms.append(
+                PLATFORMS.index(item["platform"])
+                if item["platform"] in PLATFORMS
+                else -1
+            )
+
+        columns = dict(
+            item_ids=np.array(item_ids, dtype=str),
+            min_price=np.array(min_prices, dtype=np.float64),
+            max_price=np.array(max_prices, dtype=np.float64),
+            total_stock=np.array(total_stocks, dtype=np.int64),
+            sales=np.array(sales, dtype=np.int64),
+            platform=np.array(platforms, dtype=np.int8),
+        )
+        return cls(columns, store_version)
+
+    @classmethod
+    def load(cls, snapshot_dir: str) -> Optional["ItemSnapshot"]:
+        """
+        Load the snapshot as memory-mapped arrays, None if there is none.
+        """
+        meta_path = os.path.join(snapshot_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        columns = {
+            name: np.load(
+                os.path.join(snapshot_dir, "{}.npy".format(name)), mmap_mode="r"
+            )
+            for name in COLUMNS
+        }
+        return cls(columns, meta["store_version"])
+
+    def save(self, snapshot_dir: str):
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+        meta_path = os.path.join(snapshot_dir, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        for name in COLUMNS:
+            np.save(
+                os.path.join(snapshot_dir, "{}.npy".format(name)),
+                self.columns[name],
+            )
+
+        # written at last, so that a partially saved snapshot is never loaded
+        with open(meta_path, "w") as f:
+            json.dump(dict(store_version=self.store_version), f)
+
+    def mask(self, query: ItemQuery) -> np.ndarray:
+        """
+        Evaluate the query as a mask over the items, keeping the same semantics
+        as `ItemQuery.match`.
+        """
+        c = self.columns
+        mask = np.ones(len(self), dtype=bool)
+
+        if query.min_price:
+            min_price = c["min_price"]
+            mask &= ~((min_price != 0.0) & (min_price < query.min_price))
+        if query.max_price:
+            mask &= c["max_price"] <= query.max_price
+        if query.min_total_stock:
+            mask &= c["total_stock"] >= query.min_total_stock
+        if query.max_total_stock:
+            mask &= c["total_stock"] <= query.max_total_stock
+        if query.min_sales:
+            mask &= c["sales"] >= query.min_sales
+        if query.max_sales:
+            mask &= c["sales"] <= query.max_sales
+        if query.platform:
+            codes = [i for i, p in enumerate(PLATFORMS) if p in query.platform]
+            mask &= np.isin(c["platform"], codes)
+
+        return mask
+
+    def select(
+        self,
+        query: ItemQuery,
+        sort: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Select the ids of the items matching the query.
+
+        :param query: the filter rules
+        :param sort: the sort key, see `SORT_KEYS`, prefix with '-' to sort in
+          the descending order. Items with unknown prices, i.e. 0, are always
+          put at the end when sorting by prices.
+        :param limit: max number of items to select
+        """
+        if limit is not None and limit <= 0:
+            return []
+
+        (indices,) = np.nonzero(self.mask(query))
+
+        if sort:
+            keys = sort_keys(self.columns, sort, indices)
+            if limit is not None and limit < len(indices):
+                # only the top-k items are sorted
+                top = np.argpartition(keys, limit - 1)[:limit]
+                indices = indices[top[np.argsort(keys[top], kind="stable")]]
+            else:
+                indices = indices[np.argsort(keys, kind="stable")]
+
+        if limit is not None:
+            indices = indices[:limit]
+
+        return [str(item_id) for item_id in self.columns["item_ids"][indices]]
+
+
+def sort_keys(columns: dict, sort: str, indices: np.ndarray) -> np.ndarray:
+    """
+    Get the keys of the items at `indices` to sort in the ascending order.
+    """
+    descending = sort.startswith("-")
+    name = sort.lstrip("-")
+    if name not in SORT_KEYS:
+        raise ValueError("unsupported sort key: {}".format(name))
+
+    values = columns[SORT_KEYS[name]][indices]
+    keys = np.asarray(values, dtype=np.float64)
+    if descending:
+        keys = -keys
+    if SORT_KEYS[name] in PRICE_KEYS:
+        keys[values == 0.0] = np.inf
+    return keys
+
+
+def load_or_build_snapshot(store: ItemStore, snapshot_dir: str) -> ItemSnapshot:
+    """
+    Load the snapshot, or rebuild it if it is missing or out of date.
+    """
+    snapshot = ItemSnapshot.load(snapshot_dir)
+    if snapshot is None or snapshot.store_version != store.version():
+        snapshot = ItemSnapshot.build(store)
+        snapshot.save(snapshot_dir)
+    return snapshot
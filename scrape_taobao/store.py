@@ -0,0 +1,536 @@
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from scrape_taobao.bean.item_data import CompactItemData
+from scrape_taobao.bean.item_query import ItemQuery
+from scrape_taobao.io import dump, dump_jsonl_line, load
+
+try:
+    import fcntl
+except ImportError:  # not on windows
+    fcntl = None
+
+
+class ItemStore:
+    """
+    Storage of the parsed item data, keyed by item id such as 'id=123'.
+
+    See `open_item_store` for the available backends.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def exists(self, item_id: str) -> bool:
+        raise NotImplementedError
+
+    def put(self, item_id: str, item: dict):
+        """
+        Insert or update the item.
+        """
+        raise NotImplementedError
+
+    def get(self, item_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        """
+        Iterate over all the items as (item id, item data).
+        """
+        raise NotImplementedError
+
+    def version(self) -> str:
+        """
+        Get a version string of the store, which changes whenever any item is
+        inserted, updated or removed.
+        """
+        raise NotImplementedError
+
+    def query(self, query: ItemQuery) -> Iterator[Tuple[str, dict]]:
+        """
+        Iterate over the items matching the query, as (item id, item data).
+        """
+        for item_id, item in self.items():
+            if query.match(CompactItemData.from_dict(item)):
+                yield item_id, item
+
+    def close(self):
+        pass
+
+
+class FileItemStore(ItemStore):
+    """
+    Store each item in a file '<out_dir>/<item_id>.<fmt>'.
+    """
+
+    def __init__(self, out_dir: str, fmt: str = "yaml", on_error=None):
+        """
+        :param out_dir: directory of the item files
+        :param fmt: format of the item files, 'json' or 'yaml'
+        :param on_error: called with the file path and the error when an item
+          file fails to load during iteration, raise the error if None
+        """
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.on_error = on_error
+
+    def path_of(self, item_id: str) -> str:
+        return os.path.join(self.out_dir, "{}.{}".format(item_id, self.fmt))
+
+    def exists(self, item_id: str) -> bool:
+        return os.path.exists(self.path_of(item_id))
+
+    def put(self, item_id: str, item: dict):
+        dump(item, self.path_of(item_id), fmt=self.fmt)
+
+    def get(self, item_id: str) -> Optional[dict]:
+        item_path = self.path_of(item_id)
+        return (
+            load(item_path, fmt=self.fmt) if os.path.exists(item_path) else None
+        )
+
+    def version(self) -> str:
+        suffix = ".{}".format(self.fmt)
+        count, last_mtime = 0, 0
+        with os.scandir(self.out_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(suffix):
+                    count += 1
+                    last_mtime = max(last_mtime, entry.stat().st_mtime_ns)
+        return "{}:{}".format(count, last_mtime)
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        suffix = ".{}".format(self.fmt)
+        for item_path in glob.glob(os.path.join(self.out_dir, "*" + suffix)):
+            item_id = os.path.basename(item_path)[: -len(suffix)]
+            try:
+                item = load(item_path, fmt=self.fmt)
+            except Exception as e:
+                if self.on_error is None:
+                    raise
+                self.on_error(item_path, e)
+                continue
+
+            yield item_id, item
+
+    def query(self, query: ItemQuery) -> Iterator[Tuple[str, dict]]:
+        for item_id, item in self.items():
+            try:
+                item_data = CompactItemData.from_dict(item)
+            except Exception as e:
+                if self.on_error is None:
+                    raise
+                self.on_error(self.path_of(item_id), e)
+                continue
+
+            if query.match(item_data):
+                yield item_id, item
+
+
+class SqliteItemStore(ItemStore):
+    """
+    Store all the items in a single sqlite database.
+
+    The fields used for filtering are stored in indexed columns, while the
+    `details` and the `choices` are stored as json blobs. Writes are committed
+    in batches, and on close.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS items (
+        item_id TEXT PRIMARY KEY,
+        platform TEXT,
+        title TEXT,
+        details BLOB,
+        delivery_info TEXT,
+        choices BLOB,
+        min_price REAL,
+        max_price REAL,
+        total_stock INTEGER,
+        sales INTEGER,
+        updated_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS items_platform ON items (platform);
+    CREATE INDEX IF NOT EXISTS items_min_price ON items (min_price);
+    CREATE INDEX IF NOT EXISTS items_max_price ON items (max_price);
+    CREATE INDEX IF NOT EXISTS items_total_stock ON items (total_stock);
+    CREATE INDEX IF NOT EXISTS items_sales ON items (sales);
+    """
+
+    COLUMNS = (
+        "item_id, platform, title, details, delivery_info, choices, "
+        "min_price, max_price, total_stock, sales"
+    )
+
+    def __init__(self, db_path: str, commit_every: int = 100):
+        """
+        :param db_path: path to the database file
+        :param commit_every: commit after every such number of writes, use 1
+          when there are writers in the other processes, as the write lock of
+          the database is held until the commit
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self.db_path = db_path
+        self.commit_every = commit_every
+        self.pending = 0
+
+        # shared by the threads of a scrape pool, guarded by the lock
+        self.conn = sqlite3.connect(
+            db_path, timeout=60, check_same_thread=False
+        )
+        self.lock = threading.RLock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(self.SCHEMA)
+
+    def exists(self, item_id: str) -> bool:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM items WHERE item_id = ?", (item_id,)
+            ).fetchone()
+        return row is not None
+
+    def put(self, item_id: str, item: dict):
+        min_price, max_price = item["price_range"]
+        row = (
+            item_id,
+            item["platform"],
+            item["title"],
+            _to_blob(item["details"]),
+            item["delivery_info"],
+            _to_blob(item["choices"]),
+            min_price,
+            max_price,
+            item["total_stock"],
+            item["sales"],
+            time.time(),
+        )
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO items ({}, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)".format(self.COLUMNS),
+                row,
+            )
+            self.pending += 1
+            if self.pending >= self.commit_every:
+                self.commit()
+
+    def get(self, item_id: str) -> Optional[dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT {} FROM items WHERE item_id = ?".format(self.COLUMNS),
+                (item_id,),
+            ).fetchone()
+        return _from_row(row)[1] if row else None
+
+    def version(self) -> str:
+        self.commit()
+        with self.lock:
+            count, last_updated_at = self.conn.execute(
+                "SELECT count(*), max(updated_at) FROM items"
+            ).fetchone()
+        return "{}:{}".format(count, last_updated_at)
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        return self._select("", ())
+
+    def query(self, query: ItemQuery) -> Iterator[Tuple[str, dict]]:
+        # keep the same semantics as `ItemQuery.match`
+        conditions, params = [], []
+        if query.min_price:
+            conditions.append("NOT (min_price != 0.0 AND min_price < ?)")
+            params.append(query.min_price)
+        if query.max_price:
+            conditions.append("max_price <= ?")
+            params.append(query.max_price)
+        if query.min_total_stock:
+            conditions.append("total_stock >= ?")
+            params.append(query.min_total_stock)
+        if query.max_total_stock:
+            conditions.append("total_stock <= ?")
+            params.append(query.max_total_stock)
+        if query.min_sales:
+            conditions.append("sales >= ?")
+            params.append(query.min_sales)
+        if query.max_sales:
+            conditions.append("sales <= ?")
+            params.append(query.max_sales)
+        if query.platform:
+            conditions.append("instr(?, platform) > 0")
+            params.append(query.platform)
+
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        return self._select(where, tuple(params))
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.conn.close()
+
+    def _select(self, where: str, params: tuple):
+        self.commit()
+
+        # read with a separate connection, so that the iteration is neither
+        # blocked by nor blocking the writes
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            cursor = conn.execute(
+                "SELECT {} FROM items {}".format(self.COLUMNS, where), params
+            )
+            for row in cursor:
+                yield _from_row(row)
+        finally:
+            conn.close()
+
+
+class JsonlItemStore(ItemStore):
+    """
+    Store all the items as the lines of a single JSON Lines file, each line
+    being the item data with its id as the first field `item_id`.
+
+    Items are appended in batches under an exclusive lock of the file, so that
+    the writers of several processes never interleave their lines, and a line
+    being written by another process is never taken as the partial line left
+    by a crash. An updated item is simply appended again, and its last line
+    wins. The offsets of the last lines are indexed in memory when the store is
+    first looked up.
+    """
+
+    # matches the item id at the beginning of a line without parsing the line
+    RX_ITEM_ID = re.compile(rb'^\{"item_id":("(?:[^"\\]|\\.)*")')
+
+    def __init__(self, jsonl_path: str, flush_every: int = 100):
+        """
+        :param jsonl_path: path to the JSON Lines file
+        :param flush_every: write after every such number of puts
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+
+        self.jsonl_path = jsonl_path
+        self.flush_every = flush_every
+
+        self.lock = threading.RLock()
+        self.offsets: Optional[Dict[str, int]] = None
+        self.pending_ids: List[str] = []
+        self.pending_lines: List[bytes] = []
+
+        self.fd = os.open(jsonl_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        with self._file_lock():
+            self._drop_partial_line()
+
+    def exists(self, item_id: str) -> bool:
+        with self.lock:
+            return item_id in self._index() or item_id in self.pending_ids
+
+    def put(self, item_id: str, item: dict):
+        line = dump_jsonl_line(dict(item_id=item_id, **item))
+        with self.lock:
+            self.pending_ids.append(item_id)
+            self.pending_lines.append(line.encode("utf-8"))
+            if len(self.pending_lines) >= self.flush_every:
+                self.flush()
+
+    def get(self, item_id: str) -> Optional[dict]:
+        with self.lock:
+            self.flush()
+            offset = self._index().get(item_id)
+        if offset is None:
+            return None
+
+        with open(self.jsonl_path, "rb") as f:
+            f.seek(offset)
+            return _from_line(f.readline())[1]
+
+    def version(self) -> str:
+        self.flush()
+        stat = os.stat(self.jsonl_path)
+        return "{}:{}".format(stat.st_size, stat.st_mtime_ns)
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        with self.lock:
+            self.flush()
+            offsets = dict(self._index())
+
+        with open(self.jsonl_path, "rb") as f:
+            offset = 0
+            for line in f:
+                m = self.RX_ITEM_ID.match(line)
+                if m and offsets.get(json.loads(m.group(1))) == offset:
+                    yield _from_line(line)
+                offset += len(line)
+
+    def flush(self):
+        with self.lock:
+            if not self.pending_lines:
+                return
+
+            data = b"".join(self.pending_lines)
+            with self._file_lock():
+                # no other process appends until the lock is released
+                offset = os.lseek(self.fd, 0, os.SEEK_END)
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(self.fd, view) :]
+
+            if self.offsets is not None:
+                for item_id, line in zip(self.pending_ids, self.pending_lines):
+                    self.offsets[item_id] = offset
+                    offset += len(line)
+
+            self.pending_ids.clear()
+            self.pending_lines.clear()
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            os.close(self.fd)
+
+    def _index(self) -> Dict[str, int]:
+        if self.offsets is None:
+            self.offsets = {}
+            with open(self.jsonl_path, "rb") as f:
+                offset = 0
+                for line in f:
+                    m = self.RX_ITEM_ID.match(line)
+                    if m:
+                        self.offsets[json.loads(m.group(1))] = offset
+                    offset += len(line)
+        return self.offsets
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Lock the file exclusively against the stores of the other processes.
+        """
+        if fcntl is None:
+            yield
+            return
+
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _drop_partial_line(self):
+        """
+        Drop the partially written last line left by a crash, if any, which
+        must be called under the file lock.
+        """
+        size = os.lseek(self.fd, 0, os.SEEK_END)
+        if size == 0:
+            return
+
+        with open(self.jsonl_path, "rb") as f:
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+
+            # find the end of the last complete line
+            end = size
+            while end > 0:
+                start = max(0, end - 64 * 1024)
+                f.seek(start)
+                i = f.read(end - start).rfind(b"\n")
+                if i != -1:
+                    end = start + i + 1
+                    break
+                end = start
+
+        os.ftruncate(self.fd, end)
+
+
+def open_item_store(
+    store: str,
+    out_dir: str,
+    fmt: str = "yaml",
+    on_error=None,
+    commit_every: int = 100,
+) -> ItemStore:
+    """
+    Open the item store.
+
+    :param store: the backend of the store:
+      - 'file': one file per item, i.e. '<out_dir>/<item_id>.<fmt>';
+      - 'sqlite': a sqlite database at '<out_dir>/items.sqlite';
+      - 'sqlite:<path>': a sqlite database at the given path;
+      - 'jsonl': a JSON Lines file at '<out_dir>/items.jsonl';
+      - 'jsonl:<path>': a JSON Lines file at the given path.
+    :param out_dir: directory of the items
+    :param fmt: format of the item files, only used by the file store
+    :param on_error: see `FileItemStore`
+    :param commit_every: see `SqliteItemStore`, only used by the sqlite store
+    """
+    if store == "file":
+        return FileItemStore(out_dir, fmt=fmt, on_error=on_error)
+
+    if store == "sqlite":
+        return SqliteItemStore(
+            os.path.join(out_dir, "items.sqlite"), commit_every=commit_every
+        )
+
+    if store.startswith("sqlite:"):
+        return SqliteItemStore(
+            store[len("sqlite:") :], commit_every=commit_every
+        )
+
+    if store == "jsonl":
+        return JsonlItemStore(os.path.join(out_dir, "items.jsonl"))
+
+    if store.startswith("jsonl:"):
+        return JsonlItemStore(store[len("jsonl:") :])
+
+    raise ValueError("unsupported store: {}".format(store))
+
+
+def _to_blob(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def _from_row(row: tuple) -> Tuple[str, dict]:
+    (
+        item_id,
+        platform,
+        title,
+        details,
+        delivery_info,
+        choices,
+        min_price,
+        max_price,
+        total_stock,
+        sales,
+    ) = row
+
+    return item_id, dict(
+        platform=platform,
+        title=title,
+        details=json.loads(details),
+        delivery_info=delivery_info,
+        choices=json.loads(choices),
+        price_range=(min_price, max_price),
+        total_stock=total_stock,
+        sales=sales,
+    )
+
+
+def _from_line(line: bytes) -> Tuple[str, dict]:
+    item = json.loads(line)
+    item["price_range"] = tuple(item["price_range"])
+    return item.pop("item_id"), item
@@ -1,11 +1,18 @@
+import datetime
 import os
 import random
+import re
 import time
+from typing import Optional, Union
+
+# a duration before now, e.g. '7d', '12h', '30m' or '90s'
+RX_DURATION = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+DURATION_UNITS = dict(s=1, m=60, h=3600, d=86400, w=7 * 86400)
 
 
 def fake_pause(min_gap=None, max_gap=None):
-    min_gap = env_or(min_gap, "FAKE_PAUSE_MIN_GAP", 0.5)
-    max_gap = env_or(max_gap, "FAKE_PAUSE_MAX_GAP", 3.0)
+    min_gap = float(env_or(min_gap, "FAKE_PAUSE_MIN_GAP", 0.5))
+    max_gap = float(env_or(max_gap, "FAKE_PAUSE_MAX_GAP", 3.0))
     time.sleep(random.random() * (max_gap - min_gap) + min_gap)
 
 
@@ -14,3 +21,34 @@ def env_or(val, key, default):
         return val
 
     return os.environ.get(key, default)
+
+
+def to_timestamp(time_: Union[str, float, None]) -> Optional[float]:
+    """
+    Convert a time to a timestamp.
+
+    :param time_: a timestamp, a time in ISO format such as '2023-05-01' or
+      '2023-05-01T12:00:00', or a duration before now such as '7d' or '12h'
+    """
+    if time_ is None or isinstance(time_, (int, float)):
+        return time_
+
+    if RX_DURATION.match(str(time_)):
+        return time.time() - to_seconds(time_)
+    return datetime.datetime.fromisoformat(str(time_)).timestamp()
+
+
+def to_seconds(duration: Union[str, float]) -> float:
+    """
+    Convert a duration such as '7d' or '12h' to seconds.
+
+    :param duration: seconds, or a number with a unit of 's', 'm', 'h', 'd' or
+      'w'
+    """
+    if isinstance(duration, (int, float)):
+        return duration
+
+    m = RX_DURATION.match(str(duration))
+    if not m:
+        raise ValueError("invalid duration: {}".format(duration))
+    return float(m.group(1)) * DURATION_UNITS[m.group(2)]
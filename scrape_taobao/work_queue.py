@@ -0,0 +1,288 @@
+"""
+Shared work queue of the items, for several scrape processes, possibly on
+different hosts or with different accounts, to scrape one item list together.
+
+Each worker claims the items one by one, i.e. takes a lease of the item for a
+while, and keeps its leases alive by heartbeats while working. The items are
+keyed by their canonical ids, so that an item is leased to one worker at a
+time and never scraped again once done. If a worker dies, its heartbeats stop
+and its leases expire, and the items are claimed by the other workers.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# states of the items in the queue
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class WorkQueue:
+    """
+    Work queue stored in a sqlite database, which can be on a volume shared by
+    the hosts.
+
+    Every change is committed at once in its own transaction, as the other
+    workers have to see it. The database is in the rollback journal mode, as
+    the WAL mode does not work over network filesystems. The volume must
+    support file locks, e.g. NFS with the lock daemon.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS work (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_id TEXT UNIQUE NOT NULL,
+        url TEXT NOT NULL,
+        state TEXT NOT NULL,
+        owner TEXT,
+        lease_until REAL,
+        attempts INTEGER DEFAULT 0,
+        last_error TEXT,
+        updated_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS work_state ON work (state, lease_until);
+    CREATE TABLE IF NOT EXISTS workers (
+        worker_id TEXT PRIMARY KEY,
+        host TEXT,
+        pid INTEGER,
+        started_at REAL,
+        heartbeat_at REAL
+    );
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        lease_seconds: float = 300.0,
+        max_attempts: int = 3,
+    ):
+        """
+        :param db_path: path to the database file
+        :param lease_seconds: how long a lease lasts without heartbeats
+        :param max_attempts: max number of the attempts of an item, after
+          which an expired lease fails the item instead of releasing it
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        # in the autocommit mode, with the transactions begun explicitly
+        self.conn = sqlite3.connect(
+            db_path,
+            timeout=60,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self.lock = threading.RLock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=DELETE")
+            self.conn.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def add(self, items: Iterable[Tuple[str, str]]) -> int:
+        """
+        Add the items as (item id, url), ignoring the ones already added, e.g.
+        by the other workers starting with the same item list.
+
+        :return: number of the items added
+        """
+        with self.lock, self._transaction():
+            cursor = self.conn.executemany(
+                "INSERT OR IGNORE INTO work (item_id, url, state, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    (item_id, url, PENDING, time.time())
+                    for item_id, url in items
+                ),
+            )
+        return cursor.rowcount
+
+    def register(self, worker_id: str):
+        """
+        Register the worker, for the status of the workers.
+        """
+        now = time.time()
+        with self.lock, self._transaction():
+            self.conn.execute(
+                "INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?, ?)",
+                (worker_id, socket.gethostname(), os.getpid(), now, now),
+            )
+
+    def claim(self, worker_id: str) -> Optional[Tuple[str, str]]:
+        """
+        Lease the next pending item, or an item whose lease has expired, to
+        the worker.
+
+        :return: (item id, url) of the item, or None if there is none left
+        """
+        now = time.time()
+        with self.lock, self._transaction():
+            # the items which have used up their attempts are not retried
+            self.conn.execute(
+                "UPDATE work SET state = ?, owner = NULL, "
+                "last_error = 'lease expired', updated_at = ? "
+                "WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts),
+            )
+            row = self.conn.execute(
+                "SELECT seq, item_id, url FROM work "
+                "WHERE state = ? OR (state = ? AND lease_until < ?) "
+                "ORDER BY seq LIMIT 1",
+                (PENDING, LEASED, now),
+            ).fetchone()
+            if row is None:
+                return None
+
+            seq, item_id, url = row
+            self.conn.execute(
+                "UPDATE work SET state = ?, owner = ?, lease_until = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE seq = ?",
+                (LEASED, worker_id, now + self.lease_seconds, now, seq),
+            )
+        return item_id, url
+
+    def heartbeat(self, worker_id: str) -> int:
+        """
+        Extend the leases of the worker.
+
+        :return: number of the leases extended
+        """
+        now = time.time()
+        with self.lock, self._transaction():
+            self.conn.execute(
+                "UPDATE workers SET heartbeat_at = ? WHERE worker_id = ?",
+                (now, worker_id),
+            )
+            cursor = self.conn.execute(
+                "UPDATE work SET lease_until = ? "
+                "WHERE state = ? AND owner = ? AND lease_until >= ?",
+                (now + self.lease_seconds, LEASED, worker_id, now),
+            )
+        return cursor.rowcount
+
+    def complete(
+        self, worker_id: str, item_id: str, error: Optional[str] = None
+    ) -> bool:
+        """
+        Mark the item leased to the worker as done, or failed with the error.
+
+        :return: False if the lease has been lost, e.g. it expired and the
+          item was claimed by another worker
+        """
+        with self.lock, self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE work SET state = ?, owner = NULL, lease_until = NULL, "
+                "last_error = ?, updated_at = ? "
+                "WHERE item_id = ? AND state = ? AND owner = ?",
+                (
+                    DONE if error is None else FAILED,
+                    error,
+                    time.time(),
+                    item_id,
+                    LEASED,
+                    worker_id,
+                ),
+            )
+        return cursor.rowcount > 0
+
+    def release(self, worker_id: str) -> int:
+        """
+        Put the items leased to the worker back to pending, e.g. when it is
+        interrupted, and unregister the worker.
+
+        :return: number of the items released
+        """
+        with self.lock, self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE work SET state = ?, owner = NULL, lease_until = NULL, "
+                "attempts = max(attempts - 1, 0), updated_at = ? "
+                "WHERE state = ? AND owner = ?",
+                (PENDING, time.time(), LEASED, worker_id),
+            )
+            self.conn.execute(
+                "DELETE FROM workers WHERE worker_id = ?", (worker_id,)
+            )
+        return cursor.rowcount
+
+    def retry_failed(self) -> int:
+        """
+        Mark the failed items as pending again, with their attempts reset.
+
+        :return: number of the items to retry
+        """
+        with self.lock, self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE work SET state = ?, attempts = 0, updated_at = ? "
+                "WHERE state = ?",
+                (PENDING, time.time(), FAILED),
+            )
+        return cursor.rowcount
+
+    def summary(self) -> Dict[str, int]:
+        """
+        Get the number of items in each state, where the expired leases are
+        counted as 'expired'.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT CASE WHEN state = ? AND lease_until < ? "
+                "THEN 'expired' ELSE state END AS s, count(*) "
+                "FROM work GROUP BY s",
+                (LEASED, time.time()),
+            ).fetchall()
+        counts = dict(rows)
+        return {
+            state: counts[state]
+            for state in (PENDING, LEASED, "expired", DONE, FAILED)
+            if state in counts
+        }
+
+    def workers(self) -> List[Tuple[str, str, int, float, float]]:
+        """
+        Get the registered workers as (worker id, host, pid, started at, last
+        heartbeat at).
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT * FROM workers ORDER BY started_at"
+            ).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """
+        A write transaction, which takes the database lock at once, so that
+        the claims of the workers never interleave.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+
+def make_worker_id() -> str:
+    """
+    Make a unique id of the worker, readable as '<host>:<pid>:<random>'.
+    """
+    return "{}:{}:{}".format(
+        socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8]
+    )
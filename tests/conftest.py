@@ -0,0 +1,39 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks")
+)
+
+from page_generator import generate_pages  # noqa: E402
+from scrape_taobao.commands.serve_pages import make_pages_server  # noqa: E402
+
+# number of the generated pages served by `pages_server`
+N_PAGES = 12
+
+
+@pytest.fixture
+def pages_server(tmp_path):
+    """
+    Serve small generated pages at a random free port, like `serve-pages`.
+
+    :return: the urls of the served items
+    """
+    pages_dir = str(tmp_path / "served-pages")
+    generate_pages(pages_dir, n=N_PAGES, skus=(1, 8), page_size=8_000)
+
+    server = make_pages_server(pages_dir, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield [
+            "http://{}:{}/item.htm?id={}".format(*server.server_address, i)
+            for i in range(1, N_PAGES + 1)
+        ]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
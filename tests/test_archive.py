@@ -0,0 +1,116 @@
+import gzip
+import io
+import tarfile
+
+import pytest
+from page_generator import generate_page
+
+from scrape_taobao.archive import (
+    is_archive,
+    iter_archive,
+    open_archive_writer,
+    read_archive_page,
+)
+
+ARCHIVES = [
+    "pages.tar",
+    "pages.tar.gz",
+    "pages.tgz",
+    "pages.warc",
+    "pages.warc.gz",
+]
+
+
+def _pages() -> dict:
+    return {
+        "id={}".format(i): generate_page(i, page_size=4_000) for i in (1, 2, 3)
+    }
+
+
+@pytest.mark.parametrize("name", ARCHIVES)
+def test_archive_round_trip(tmp_path, name):
+    path = str(tmp_path / name)
+    pages = _pages()
+    with open_archive_writer(path) as writer:
+        for item_id, page_source in pages.items():
+            writer.put(
+                item_id,
+                page_source,
+                url="https://detail.tmall.com/item.htm?spm=a&{}".format(
+                    item_id
+                ),
+                fetched_at=1_700_000_000,
+            )
+
+    assert is_archive(path)
+    assert list(iter_archive(path)) == list(pages.items())
+    assert read_archive_page(path) == ("id=1", pages["id=1"])
+    assert read_archive_page(path, "id=3") == ("id=3", pages["id=3"])
+    with pytest.raises(LookupError):
+        read_archive_page(path, "id=4")
+
+    # the streamed archives can not be appended to
+    with pytest.raises(FileExistsError):
+        open_archive_writer(path)
+
+
+def test_tar_skips_other_members(tmp_path):
+    path = str(tmp_path / "pages.tar.gz")
+    with tarfile.open(path, "w:gz") as tar:
+        for name, data in [
+            ("./", None),
+            ("./README.txt", b"pages"),
+            ("./id=1.html", "<html>商品</html>".encode("utf-8")),
+        ]:
+            info = tarfile.TarInfo(name)
+            if data is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            else:
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+    assert list(iter_archive(path)) == [("id=1", "<html>商品</html>")]
+
+
+def _warc_record(warc_type: str, uri: str, block: bytes) -> bytes:
+    return (
+        "WARC/1.0\r\n"
+        "WARC-Type: {}\r\n"
+        "WARC-Target-URI: <{}>\r\n"
+        "Content-Length: {}\r\n"
+        "\r\n".format(warc_type, uri, len(block)).encode("utf-8")
+        + block
+        + b"\r\n\r\n"
+    )
+
+
+def test_warc_reads_captured_responses(tmp_path):
+    body = gzip.compress("<html>商品</html>".encode("gbk"))
+    chunked = b"%x\r\n%s\r\n0\r\n\r\n" % (len(body), body)
+    records = [
+        _warc_record("warcinfo", "", b"software: test"),
+        _warc_record(
+            "response",
+            "https://item.taobao.com/item.htm?id=1",
+            b"HTTP/1.1 302 Found\r\nLocation: https://login.taobao.com\r\n\r\n",
+        ),
+        _warc_record("request", "https://item.taobao.com/item.htm?id=2", b""),
+        _warc_record(
+            "response",
+            "https://item.taobao.com/item.htm?id=2",
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/html; charset=GBK\r\n"
+            b"Content-Encoding: gzip\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n" + chunked,
+        ),
+        _warc_record(
+            "response",
+            "https://img.alicdn.com/i1.jpg?id=3",
+            b"HTTP/1.1 200 OK\r\nContent-Type: image/jpeg\r\n\r\n\xff\xd8",
+        ),
+    ]
+    path = tmp_path / "capture.warc.gz"
+    path.write_bytes(b"".join(gzip.compress(record) for record in records))
+
+    assert list(iter_archive(str(path))) == [("id=2", "<html>商品</html>")]
@@ -0,0 +1,60 @@
+import pytest
+from page_generator import generate_taobao_page, generate_tmall_page
+
+from scrape_taobao.core.extract_item_page import extract_item_page
+from scrape_taobao.core.parse_item_page import parse_item_page
+
+# node markup in the strings of a script, which is no node of the page
+SCRIPT_DECOY = """<script>
+var tpl = '<div id="J_StrPrice"><em class="tb-rmb-num">0.01</em></div>'
+  + '<strong id="J_SellCounter">99999</strong>'
+  + '<span class="ItemHeader--salesDesc--x">月销 99999+</span>';
+</script>
+<!-- <span id="J_SpanStock">99999</span> -->
+"""
+
+
+def _pages():
+    for index in range(1, 21):
+        for skus in (0, 1, 35):
+            yield "taobao-{}-{}".format(index, skus), generate_taobao_page(
+                index, skus=skus, page_size=20_000
+            )
+            yield "tmall-{}-{}".format(index, skus), generate_tmall_page(
+                index, skus=skus, page_size=20_000
+            )
+
+
+def _with_decoy(page_source: str) -> str:
+    # before the nodes, so that a scan taking the first match would take it
+    return page_source.replace("</head>", SCRIPT_DECOY + "</head>", 1)
+
+
+PAGES = dict(_pages())
+
+
+@pytest.mark.parametrize("name", sorted(PAGES))
+def test_fast_path_matches_tree_parser(name):
+    page_source = PAGES[name]
+    # never falling back, which would make the comparison vacuous
+    assert extract_item_page(page_source) is not None
+    assert parse_item_page(page_source, fast=True) == parse_item_page(
+        page_source, fast=False
+    )
+
+
+@pytest.mark.parametrize(
+    "page_source",
+    [
+        generate_taobao_page(1, skus=0, page_size=20_000),
+        generate_tmall_page(1, skus=0, page_size=20_000),
+        generate_taobao_page(2, skus=10, page_size=20_000),
+    ],
+    ids=["taobao", "tmall", "taobao-skus"],
+)
+def test_fast_path_skips_script_decoys(page_source):
+    page_source = _with_decoy(page_source)
+    data = extract_item_page(page_source)
+    assert data is not None
+    assert data == parse_item_page(page_source, fast=False)
+    assert data.sales != 99999
@@ -0,0 +1,130 @@
+import pytest
+
+from scrape_taobao.history import ItemHistory
+
+
+def _item(sales: int, **sku_prices) -> dict:
+    choices = [
+        dict(sku_id=sku_id, name=sku_id, price=price, stock=10)
+        for sku_id, price in sku_prices.items()
+    ]
+    prices = [choice["price"] for choice in choices]
+    return dict(
+        price_range=(min(prices), max(prices)),
+        total_stock=10 * len(choices),
+        sales=sales,
+        choices=choices,
+    )
+
+
+def _state(scraped_at, min_price, max_price, total_stock, sales, **kwargs):
+    return dict(
+        scraped_at=scraped_at,
+        min_price=min_price,
+        max_price=max_price,
+        total_stock=total_stock,
+        sales=sales,
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def history(tmp_path):
+    with ItemHistory(str(tmp_path / "history.sqlite")) as history:
+        yield history
+
+
+def _snapshots(history: ItemHistory, item_id: str) -> list:
+    history.commit()
+    return history.conn.execute(
+        "SELECT scraped_at, min_price, max_price, total_stock, sales, skus "
+        "FROM snapshots WHERE item_id = ? ORDER BY scraped_at",
+        (item_id,),
+    ).fetchall()
+
+
+def test_history_records_deltas(history):
+    assert history.record("id=1", _item(100, a=10, b=20), scraped_at=1)
+    assert not history.record("id=1", _item(100, a=10, b=20), scraped_at=2)
+    assert history.record("id=1", _item(150, a=10, b=20), scraped_at=3)
+    assert history.record("id=1", _item(150, a=12), scraped_at=4)
+    # an older scrape never rewrites the history
+    assert not history.record("id=1", _item(999, a=1), scraped_at=3.5)
+
+    assert _snapshots(history, "id=1") == [
+        (1, 10, 20, 20, 100, '{"a": [10, 10], "b": [20, 10]}'),
+        (2, None, None, None, None, None),
+        (3, None, None, None, 150, None),
+        (4, 12, 12, 10, None, '{"a": [12, 10], "b": null}'),
+    ]
+
+    assert history.history("id=1") == [
+        _state(1, 10, 20, 20, 100),
+        _state(2, 10, 20, 20, 100),
+        _state(3, 10, 20, 20, 150),
+        _state(4, 12, 12, 10, 150),
+    ]
+    # the states before the range are carried into it
+    assert history.history("id=1", since=2.5, until=3, skus=True) == [
+        _state(3, 10, 20, 20, 150, skus={"a": (10, 10), "b": (20, 10)}),
+    ]
+    assert history.history("id=1", since=4, skus=True) == [
+        _state(4, 12, 12, 10, 150, skus={"a": (12, 10)}),
+    ]
+    assert history.history("id=2") == []
+
+
+def test_history_compact(history):
+    for t in range(10):
+        # the sales change every other scrape
+        history.record("id=1", _item(100 + t // 2, a=10), scraped_at=t)
+    states = history.history("id=1", skus=True)
+
+    assert history.compact() == (10, 5)
+    assert history.history("id=1", skus=True) == [
+        state for state in states if state["scraped_at"] % 2 == 0
+    ]
+
+    # merged into the last snapshot of each period of 4 seconds
+    assert history.compact(before=8, resolution=4) == (5, 3)
+    assert history.history("id=1", skus=True) == [
+        state for state in states if state["scraped_at"] in (2, 6, 8)
+    ]
+    assert _snapshots(history, "id=1")[0] == (
+        2,
+        10,
+        10,
+        10,
+        101,
+        '{"a": [10, 10]}',
+    )
+
+
+def test_history_growth(history):
+    history.record("id=1", _item(100, a=10), scraped_at=1)
+    history.record("id=1", _item(200, a=10), scraped_at=5)
+    history.record("id=1", _item(300, a=10), scraped_at=10)
+    history.record("id=2", _item(100, a=10), scraped_at=1)
+    history.record("id=2", _item(110, a=20), scraped_at=10)
+    # first scraped in the range
+    history.record("id=3", _item(50, a=10), scraped_at=6)
+    history.record("id=3", _item(100, a=10), scraped_at=9)
+    # never sold before
+    history.record("id=4", _item(0, a=10), scraped_at=1)
+    history.record("id=4", _item(10, a=10), scraped_at=10)
+
+    assert list(history.growth()) == [
+        ("id=1", 100, 300, 2.0),
+        ("id=3", 50, 100, 1.0),
+        ("id=2", 100, 110, pytest.approx(0.1)),
+    ]
+    # the ties are in no particular order
+    assert sorted(history.growth(since=5, until=9, min_growth=0.5)) == [
+        ("id=1", 100, 200, 1.0),
+        ("id=3", 50, 100, 1.0),
+    ]
+    assert list(history.growth("max_price", since=2)) == [
+        ("id=2", 10, 20, 1.0),
+    ]
+    with pytest.raises(ValueError):
+        list(history.growth("title"))
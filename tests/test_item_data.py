@@ -0,0 +1,92 @@
+import dacite
+import pytest
+from page_generator import generate_page, generate_tmall_page
+
+from scrape_taobao.bean.item_data import (
+    CompactItemData,
+    ItemData,
+    item_to_dict,
+)
+from scrape_taobao.bean.item_query import ItemQuery
+from scrape_taobao.core.parse_item_page import parse_item_page
+
+
+def _parsed_items() -> list:
+    items = [parse_item_page(generate_page(i, page_size=0)) for i in range(30)]
+    # thousands of skus, which is what the compact choices are for
+    items.append(parse_item_page(generate_tmall_page(1, skus=3000)))
+    return items
+
+
+ITEMS = _parsed_items()
+
+
+@pytest.mark.parametrize("item", ITEMS, ids=lambda item: item.title)
+def test_compact_item_round_trip(item):
+    item_dict = item_to_dict(item)
+    compact = CompactItemData.from_dict(item_dict)
+
+    assert item_to_dict(compact) == item_dict
+    assert compact.to_item() == item
+    assert CompactItemData.from_item(item).to_dict() == item_dict
+    assert len(compact.choices) == len(item.choices)
+    assert compact.choices[-1] == item.choices[-1]
+    assert compact.choices[1:3] == item.choices[1:3]
+
+
+def test_compact_items_with_thousands_of_skus():
+    assert len(ITEMS[-1].choices) == 3000
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        ItemQuery(),
+        ItemQuery(min_price=100),
+        ItemQuery(max_price=980, platform="tmall"),
+        ItemQuery(min_total_stock=10000, max_sales=20),
+        ItemQuery(min_sales=10, max_total_stock=30000),
+        ItemQuery(platform="taobao"),
+    ],
+)
+def test_item_query_matches_compact_items_alike(query):
+    matched = [query.match(item) for item in ITEMS]
+    # neither all nor none, or the comparison tells nothing
+    assert len(set(matched)) == 2 or query == ItemQuery()
+    assert [
+        query.match(CompactItemData.from_item(item)) for item in ITEMS
+    ] == matched
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [("sales", 1.5), ("title", None), ("choices", ()), ("price_range", [])],
+)
+def test_compact_item_rejects_wrong_types_as_dacite(field, value):
+    item_dict = dict(item_to_dict(ITEMS[0]), **{field: value})
+    with pytest.raises(dacite.DaciteError):
+        dacite.from_dict(ItemData, item_dict)
+    with pytest.raises(TypeError):
+        CompactItemData.from_dict(item_dict)
+
+
+@pytest.mark.parametrize("field", ["total_stock", "sales"])
+def test_compact_item_rejects_bools_as_ints(field):
+    item_dict = dict(item_to_dict(ITEMS[0]), **{field: True})
+    with pytest.raises(TypeError):
+        CompactItemData.from_dict(item_dict)
+
+    item_dict = item_to_dict(ITEMS[0])
+    item_dict["choices"] = [dict(item_dict["choices"][0], stock=False)]
+    with pytest.raises(TypeError):
+        CompactItemData.from_dict(item_dict)
+
+
+@pytest.mark.parametrize("field, value", [("oversold", 1), ("name", None)])
+def test_compact_choices_reject_wrong_types_as_dacite(field, value):
+    item_dict = item_to_dict(ITEMS[0])
+    item_dict["choices"] = [dict(item_dict["choices"][0], **{field: value})]
+    with pytest.raises(dacite.DaciteError):
+        dacite.from_dict(ItemData, item_dict)
+    with pytest.raises(TypeError):
+        CompactItemData.from_dict(item_dict)
@@ -0,0 +1,86 @@
+import gzip
+
+import pytest
+
+from scrape_taobao.item_list import (
+    canonical_item_id,
+    iter_item_list,
+    load_item_list,
+)
+
+ITEM_LIST = """\
+# the first items
+https://item.taobao.com/item.htm?id=123&spm=a.b
+
+https://detail.tmall.com/item.htm?spm=c.d&id=123
+https://detail.tmall.com/item.htm?id=456&skuId=789
+not an item url
+  0456
+https://a.m.taobao.com/i789.htm
+https://item.taobao.com/item.htm?id=1001
+"""
+
+
+@pytest.mark.parametrize(
+    "url, item_id",
+    [
+        ("https://item.taobao.com/item.htm?id=123&spm=a.b", "id=123"),
+        ("https://detail.tmall.com/item.htm?spm=c.d&id=123", "id=123"),
+        ("https://detail.tmall.com/item.htm?skuId=789&id=456", "id=456"),
+        ("https://detail.tmall.com/item.htm?skuId=789", None),
+        ("https://a.m.taobao.com/i789.htm?spm=a", "id=789"),
+        ("https://item.taobao.com/item.htm#id=42", "id=42"),
+        ("0123", "id=123"),
+        ("123abc", None),
+        ("", None),
+    ],
+)
+def test_canonical_item_id(url, item_id):
+    assert canonical_item_id(url) == item_id
+
+
+@pytest.mark.parametrize("gzipped", [False, True])
+def test_iter_item_list_dedups_by_item_id(tmp_path, gzipped):
+    item_list = tmp_path / "items.txt"
+    if gzipped:
+        with gzip.open(item_list, "wt") as f:
+            f.write(ITEM_LIST)
+    else:
+        item_list.write_text(ITEM_LIST)
+
+    skipped = []
+    items = list(
+        iter_item_list(
+            str(item_list),
+            skip=lambda item_id: item_id == "id=1001",
+            on_skipped=lambda url, reason: skipped.append((url, reason)),
+        )
+    )
+    assert items == [
+        ("id=123", "https://item.taobao.com/item.htm?id=123&spm=a.b"),
+        ("id=456", "https://detail.tmall.com/item.htm?id=456&skuId=789"),
+        ("id=789", "https://a.m.taobao.com/i789.htm"),
+    ]
+    assert skipped == [
+        ("https://detail.tmall.com/item.htm?spm=c.d&id=123", "duplicated"),
+        ("not an item url", "invalid"),
+        ("0456", "duplicated"),
+        ("https://item.taobao.com/item.htm?id=1001", "skipped"),
+    ]
+
+
+def test_load_item_list_samples(tmp_path):
+    item_list = tmp_path / "items.txt"
+    item_list.write_text("".join("{}\n".format(i) for i in range(1, 101)))
+
+    urls = [
+        "https://item.taobao.com/item.htm?id={}".format(i)
+        for i in range(1, 101)
+    ]
+    assert load_item_list(str(item_list)) == urls
+    assert load_item_list(str(item_list), n=5) == urls[:5]
+
+    sample = load_item_list(str(item_list), n=10, shuffle=True)
+    assert len(sample) == len(set(sample)) == 10
+    assert set(sample) <= set(urls)
+    assert sorted(load_item_list(str(item_list), shuffle=True)) == sorted(urls)
@@ -0,0 +1,52 @@
+from scrape_taobao.journal import (
+    FAILED,
+    FETCHED,
+    PARSED,
+    PENDING,
+    ScrapeJournal,
+)
+
+
+def _journal(tmp_path) -> ScrapeJournal:
+    return ScrapeJournal(str(tmp_path / "journal.sqlite"))
+
+
+def test_journal_resumes_unfinished_in_order(tmp_path):
+    with _journal(tmp_path) as journal:
+        journal.reset(["u3", "u1", "u2", "u4"])
+        journal.mark("u1", PARSED)
+        journal.mark("u2", FETCHED)
+        journal.mark("u4", FAILED, "timeout")
+
+    with _journal(tmp_path) as journal:
+        assert journal.unfinished() == ["u3", "u2"]
+        assert journal.unfinished(download_only=True) == ["u3"]
+        assert journal.failed() == [("u4", 1, "timeout")]
+        assert journal.summary() == {
+            PENDING: 1,
+            FETCHED: 1,
+            PARSED: 1,
+            FAILED: 1,
+        }
+
+
+def test_journal_reset_keeps_the_other_urls(tmp_path):
+    with _journal(tmp_path) as journal:
+        journal.reset(["u1", "u2", "u3"])
+        journal.mark("u1", FAILED, "timeout")
+        journal.mark("u2", FAILED, "captcha")
+        journal.mark("u3", PARSED)
+
+        # a plain rerun of another list, with u2 listed again
+        journal.reset(["u2", "u4"])
+        assert journal.failed() == [("u1", 1, "timeout")]
+        assert journal.unfinished() == ["u2", "u4"]
+
+        # the attempts of u2 are kept across the runs
+        journal.mark("u2", FAILED, "captcha")
+        assert journal.retry_failed(max_attempts=2) == 1
+        assert journal.unfinished() == ["u1", "u4"]
+
+        journal.reset(["u5"], fresh=True)
+        assert journal.unfinished() == ["u5"]
+        assert journal.summary() == {PENDING: 1}
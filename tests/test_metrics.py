@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from scrape_taobao.metrics import Histogram, Metrics
+
+
+def _histogram(*values, buckets=(1.0, 2.0, 4.0)) -> Histogram:
+    histogram = Histogram(buckets)
+    for value in values:
+        histogram.observe(value)
+    return histogram
+
+
+@pytest.mark.parametrize(
+    "q, expected",
+    [
+        # clamped to the min and the max observed
+        (0.0, 0.5),
+        # the whole bucket (0.5, 1] up to the first value
+        (0.25, 1.0),
+        # halfway through the 2 values in (1, 2]
+        (0.5, 1.5),
+        (0.75, 2.0),
+        (1.0, 3.0),
+    ],
+)
+def test_histogram_quantile_interpolates_in_bucket(q, expected):
+    histogram = _histogram(0.5, 1.5, 1.5, 3.0)
+    assert histogram.counts == [1, 2, 1, 0]
+    assert histogram.quantile(q) == pytest.approx(expected)
+
+
+def test_histogram_quantile_edge_cases():
+    assert Histogram().quantile(0.5) is None
+    # a single value is every quantile
+    assert _histogram(1.5).quantile(0.01) == 1.5
+    assert _histogram(1.5).quantile(0.99) == 1.5
+    # above all the buckets, bounded by the max
+    assert _histogram(10.0, 20.0).quantile(0.5) == pytest.approx(15.0)
+    # a value on a bound is in the bucket of the bound, as `le`
+    assert _histogram(2.0).counts == [0, 1, 0, 0]
+
+
+def test_metrics_state_merge_round_trip():
+    worker = Metrics()
+    worker.inc("items_total", outcome="parsed")
+    worker.inc("items_total", 2, outcome="failed")
+    for value in (0.002, 0.02, 0.2):
+        worker.observe("stage_seconds", value, stage="parse")
+
+    parent = Metrics()
+    parent.inc("items_total", outcome="parsed")
+    parent.observe("stage_seconds", 3.0, stage="parse")
+    # as sent back from a worker process
+    parent.merge(json.loads(json.dumps(worker.state())))
+
+    summary = parent.summary()
+    assert summary["counters"]["items_total"] == {
+        "outcome=failed": 2,
+        "outcome=parsed": 2,
+    }
+    parse = summary["histograms"]["stage_seconds"]["stage=parse"]
+    assert parse["count"] == 4
+    assert parse["sum"] == pytest.approx(3.222)
+    assert (parse["min"], parse["max"]) == (0.002, 3.0)
+
+    # merged as if observed by the parent
+    expected = Metrics()
+    for value in (0.002, 0.02, 0.2, 3.0):
+        expected.observe("stage_seconds", value, stage="parse")
+    (histogram,) = parent.histograms.values()
+    (expected_histogram,) = expected.histograms.values()
+    assert histogram.state() == pytest.approx(expected_histogram.state())
+
+
+def test_metrics_to_prometheus():
+    metrics = Metrics()
+    metrics.inc("items_total", outcome="parsed")
+    metrics.inc("failures_total", stage="fetch", reason='say "hi"\\\n')
+    metrics.observe("stage_seconds", 0.003, stage="fetch")
+    metrics.observe("stage_seconds", 0.003, stage="fetch")
+    metrics.observe("stage_seconds", 500.0, stage="fetch")
+
+    lines = metrics.to_prometheus().splitlines()
+    assert lines[:4] == [
+        "# TYPE scrape_taobao_failures_total counter",
+        'scrape_taobao_failures_total{reason="say \\"hi\\"\\\\\\n",'
+        'stage="fetch"} 1',
+        "# TYPE scrape_taobao_items_total counter",
+        'scrape_taobao_items_total{outcome="parsed"} 1',
+    ]
+    assert lines[4] == "# TYPE scrape_taobao_stage_seconds histogram"
+
+    buckets = [line for line in lines if "_bucket" in line]
+    assert buckets[0] == (
+        'scrape_taobao_stage_seconds_bucket{stage="fetch",le="0.001"} 0'
+    )
+    assert buckets[1] == (
+        'scrape_taobao_stage_seconds_bucket{stage="fetch",le="0.005"} 2'
+    )
+    # cumulative up to `+Inf`, which counts all the values
+    assert buckets[-2] == (
+        'scrape_taobao_stage_seconds_bucket{stage="fetch",le="120.0"} 2'
+    )
+    assert buckets[-1] == (
+        'scrape_taobao_stage_seconds_bucket{stage="fetch",le="+Inf"} 3'
+    )
+    counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert counts == sorted(counts)
+    assert lines[-2:] == [
+        'scrape_taobao_stage_seconds_sum{stage="fetch"} 500.006',
+        'scrape_taobao_stage_seconds_count{stage="fetch"} 3',
+    ]
@@ -0,0 +1,91 @@
+import pytest
+
+from scrape_taobao.core.fetch_item_page import (
+    PAGE_CLEAN,
+    PAGE_ERROR,
+    PAGE_LOGIN,
+    PAGE_NOT_FOUND,
+    JunkPageError,
+    SeleniumItemPageFetcher,
+)
+from scrape_taobao.pacing import AdaptivePacer, PacedItemPageFetcher
+
+ITEM_PAGE = '<title>商品</title><div id="J_StrPrice"></div>'
+
+
+class StubDriver:
+    """
+    A browser redirected to the pages of the routes.
+    """
+
+    def __init__(self, routes: dict):
+        self.routes = routes
+        self.current_url = None
+        self.page_source = None
+
+    def get(self, url: str):
+        if url not in self.routes:
+            raise ConnectionError("connection reset")
+        self.current_url, self.page_source = self.routes[url]
+
+
+def _pacer() -> AdaptivePacer:
+    return AdaptivePacer(1000, min_rate=1, max_rate=1000, cooldown=0)
+
+
+def test_paced_fetcher_reports_the_signals_of_the_fetcher():
+    driver = StubDriver(
+        {
+            "https://item.taobao.com/item.htm?id=1": (
+                "https://item.taobao.com/item.htm?id=1",
+                ITEM_PAGE,
+            ),
+            # redirected to the login page, whose source tells nothing
+            "https://item.taobao.com/item.htm?id=2": (
+                "https://login.taobao.com/member/login.jhtml?redirect=id%3D2",
+                "<title>登录</title>",
+            ),
+            "https://item.taobao.com/item.htm?id=3": (
+                "https://item.taobao.com/noitem.htm",
+                "<title>宝贝不存在</title>",
+            ),
+        }
+    )
+    pacer = _pacer()
+    fetcher = PacedItemPageFetcher(SeleniumItemPageFetcher(driver), pacer)
+
+    assert fetcher.fetch("https://item.taobao.com/item.htm?id=1") == ITEM_PAGE
+    for index in (2, 3):
+        with pytest.raises(JunkPageError):
+            fetcher.fetch(
+                "https://item.taobao.com/item.htm?id={}".format(index)
+            )
+    with pytest.raises(ConnectionError):
+        fetcher.fetch("https://item.taobao.com/item.htm?id=4")
+
+    assert pacer.stats()["signals"] == {
+        PAGE_CLEAN: 1,
+        PAGE_LOGIN: 1,
+        PAGE_NOT_FOUND: 1,
+        PAGE_ERROR: 1,
+    }
+    assert pacer.stats()["backoffs"] == 1
+
+
+def test_selenium_fetcher_takes_page_source_once():
+    class CountingDriver(StubDriver):
+        reads = 0
+
+        @property
+        def page_source(self):
+            self.reads += 1
+            return self._page_source
+
+        @page_source.setter
+        def page_source(self, page_source):
+            self._page_source = page_source
+
+    url = "https://item.taobao.com/item.htm?id=1"
+    driver = CountingDriver({url: (url, ITEM_PAGE)})
+    assert SeleniumItemPageFetcher(driver).fetch(url) == ITEM_PAGE
+    assert driver.reads == 1
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+from page_generator import generate_page
+
+from scrape_taobao.page_cache import PackPageCache, open_page_cache
+
+
+@pytest.mark.parametrize("page_cache", ["dir", "pack:zlib", "pack:zdict"])
+def test_page_cache_round_trip(tmp_path, page_cache):
+    pages = {
+        "id={}".format(i): generate_page(i, page_size=4_000) for i in (1, 2)
+    }
+    os.makedirs(tmp_path / "pages")
+    with open_page_cache(page_cache, str(tmp_path / "pages")) as cache:
+        for item_id, page_source in pages.items():
+            cache.put(item_id, page_source)
+
+    with open_page_cache(page_cache, str(tmp_path / "pages")) as cache:
+        assert "id=1" in cache and "id=3" not in cache
+        assert cache.get("id=3") is None
+        assert {item_id: cache.get(item_id) for item_id in cache.ids()} == pages
+
+
+@pytest.mark.parametrize("fail_at", ["_compress", "_append", "insert"])
+def test_pack_put_failure_leaves_no_trace(tmp_path, monkeypatch, fail_at):
+    cache = PackPageCache(str(tmp_path), codec="zlib")
+    cache.put("id=1", "<html>1</html>")
+    pack_size = os.path.getsize(cache.pack_path(1))
+
+    def fail(*_):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        if fail_at == "insert":
+            # an item id the index can not take
+            item_id = object()
+        else:
+            item_id = "id=2"
+            m.setattr(cache, fail_at, fail)
+        with pytest.raises(Exception):
+            cache.put(item_id, "<html>2</html>")
+
+    assert os.path.getsize(cache.pack_path(1)) == pack_size
+    assert not cache.conn.in_transaction
+
+    # neither blocked by an open transaction nor the index lock
+    cache.put("id=3", "<html>3</html>")
+    with PackPageCache(str(tmp_path), codec="zlib") as other:
+        other.put("id=4", "<html>4</html>")
+        assert sorted(other.ids()) == ["id=1", "id=3", "id=4"]
+        assert other.get("id=3") == "<html>3</html>"
+    cache.close()
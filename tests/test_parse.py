@@ -0,0 +1,106 @@
+import collections
+import os
+
+import pytest
+from page_generator import generate_page, generate_pages
+
+from scrape_taobao.commands.parse import parse
+from scrape_taobao.manifest import open_manifest
+from scrape_taobao.page_cache import (
+    DirPageCache,
+    PackPageCache,
+    open_page_cache,
+)
+from scrape_taobao.store import open_item_store
+
+
+@pytest.fixture
+def page_reads(monkeypatch):
+    """
+    Count the reads of the cached pages by item id.
+    """
+    reads = collections.Counter()
+    for cls in (DirPageCache, PackPageCache):
+
+        def get(self, item_id, _get=cls.get):
+            reads[item_id] += 1
+            return _get(self, item_id)
+
+        monkeypatch.setattr(cls, "get", get)
+    return reads
+
+
+def _parse(tmp_path, page_cache, **kwargs):
+    parse(
+        str(tmp_path / "pages"),
+        str(tmp_path / "items"),
+        "json",
+        store="sqlite",
+        page_cache=page_cache,
+        metrics="",
+        **kwargs,
+    )
+    with open_item_store("sqlite", str(tmp_path / "items")) as item_store:
+        return dict(item_store.items())
+
+
+def _page(index: int) -> str:
+    return generate_page(index, page_size=4_000)
+
+
+def _put_page(tmp_path, page_cache, item_id, page_source):
+    with open_page_cache(page_cache, str(tmp_path / "pages")) as pages:
+        pages.put(item_id, page_source)
+
+
+@pytest.mark.parametrize("page_cache", ["dir", "pack:zlib"])
+def test_parse_reads_only_changed_pages(tmp_path, page_reads, page_cache):
+    os.makedirs(tmp_path / "pages")
+    for i in range(1, 7):
+        _put_page(tmp_path, page_cache, "id={}".format(i), _page(i))
+
+    items = _parse(tmp_path, page_cache)
+    assert len(items) == 6
+    assert set(page_reads.values()) == {1}
+
+    # up to date by the stamps, without reading any page
+    page_reads.clear()
+    assert _parse(tmp_path, page_cache) == items
+    assert not page_reads
+
+    # rewritten unchanged, read once to check and restamp, but not parsed
+    page_reads.clear()
+    with open_manifest(str(tmp_path / "items")) as manifest:
+        parsed_at = manifest.get("id=2").parsed_at
+    _put_page(tmp_path, page_cache, "id=2", _page(2))
+    assert _parse(tmp_path, page_cache) == items
+    assert page_reads == {"id=2": 1}
+    with open_manifest(str(tmp_path / "items")) as manifest:
+        assert manifest.get("id=2").parsed_at == parsed_at
+
+    page_reads.clear()
+    _parse(tmp_path, page_cache)
+    assert not page_reads
+
+    # changed, read once and parsed
+    page_reads.clear()
+    _put_page(tmp_path, page_cache, "id=3", _page(4))
+    changed_items = _parse(tmp_path, page_cache)
+    assert page_reads == {"id=3": 1}
+    assert changed_items["id=3"] == items["id=4"]
+
+
+def test_parse_in_pool_checks_changed_pages(tmp_path):
+    generate_pages(str(tmp_path / "pages"), n=8, page_size=4_000)
+    items = _parse(tmp_path, "dir", workers=2, chunk_size=3)
+    assert len(items) == 8
+
+    _put_page(tmp_path, "dir", "id=2", _page(2))
+    _put_page(tmp_path, "dir", "id=3", _page(5))
+    changed_items = _parse(tmp_path, "dir", workers=2, chunk_size=3)
+    assert changed_items == dict(items, **{"id=3": items["id=5"]})
+
+    with open_manifest(str(tmp_path / "items")) as manifest:
+        with open_page_cache("dir", str(tmp_path / "pages")) as pages:
+            for item_id in pages.ids():
+                assert manifest.get(item_id).page_stamp == pages.stamp(item_id)
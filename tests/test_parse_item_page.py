@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from scrape_taobao.core.parse_item_page import (
+    build_tmall_choices,
+    extract_tmall_sku_state,
+)
+
+SKU_BASE = {
+    "props": [
+        {
+            "pid": "1627207",
+            "values": [
+                {"vid": "1", "name": "红色"},
+                {"vid": "2", "name": "蓝色"},
+                {"vid": "3", "name": "绿色"},
+            ],
+        }
+    ],
+    "skus": [
+        {"skuId": "101", "propPath": "1627207:1"},
+        {"skuId": "102", "propPath": "1627207:2"},
+        {"skuId": "103", "propPath": "1627207:3"},
+    ],
+}
+
+
+def test_tmall_sold_out_skus_have_zero_stock():
+    sku2info = {
+        "101": {"price": {"priceText": "9.9"}, "quantity": "5"},
+        "102": {"price": {"priceText": "19.9"}, "quantity": "0"},
+        "103": {"price": {"priceText": "29.9"}},
+    }
+    choices = build_tmall_choices(SKU_BASE, sku2info)
+
+    assert [(c.name, c.stock, c.oversold) for c in choices] == [
+        ("红色", 5, False),
+        ("蓝色", 0, True),
+        ("绿色", -1, False),
+    ]
+
+
+@pytest.mark.parametrize(
+    "quantity, total_stock", [(0, 0), ("0", 0), ("", -1), (None, -1)]
+)
+def test_tmall_item_stock_without_skus(quantity, total_stock):
+    item_info = {"price": {"priceMoney": "990"}, "quantity": quantity}
+    page_source = '"skuCore": {}'.format(
+        json.dumps({"sku2info": {"0": item_info}})
+    )
+    assert extract_tmall_sku_state(page_source) == ([], (9.9, 9.9), total_stock)
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from scrape_taobao.pipeline import ParseStage
+
+
+class Recorder:
+    """
+    Collects the outcomes reported to `on_done`.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.done = []
+
+    def __call__(self, key, error):
+        with self.lock:
+            self.done.append((key, error))
+
+
+def test_submit_blocks_once_max_pending_is_reached():
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(10)
+
+    stage = ParseStage(workers=1, max_pending=2)
+    # taken by the worker, then 2 pending
+    stage.submit("0", blocking)
+    assert started.wait(10)
+    stage.submit("1", lambda: None)
+    stage.submit("2", lambda: None)
+
+    submitted = threading.Event()
+    submitter = threading.Thread(
+        target=lambda: (stage.submit("3", lambda: None), submitted.set())
+    )
+    submitter.start()
+    assert not submitted.wait(0.2)
+
+    release.set()
+    assert submitted.wait(10)
+    submitter.join()
+    stage.close()
+
+    waits = stage.metrics.summary()["histograms"]["stage_seconds"]
+    assert waits["stage=parse_wait"]["max"] >= 0.2
+
+
+def test_failed_task_is_reported_to_on_done():
+    error = ValueError("bad page")
+
+    def failing():
+        raise error
+
+    recorder = Recorder()
+    with ParseStage(workers=2, on_done=recorder) as stage:
+        stage.submit("good", lambda: None)
+        stage.submit("bad", failing)
+
+    assert sorted(recorder.done, key=lambda done: done[0]) == [
+        ("bad", error),
+        ("good", None),
+    ]
+
+
+def test_failing_on_done_does_not_stop_the_worker():
+    def on_done(key, error):
+        raise RuntimeError("dump failed")
+
+    ran = []
+    with ParseStage(workers=1, on_done=on_done) as stage:
+        for i in range(3):
+            stage.submit(str(i), lambda i=i: ran.append(i))
+
+    assert ran == [0, 1, 2]
+
+
+def test_close_drains_the_queued_tasks():
+    recorder = Recorder()
+    stage = ParseStage(workers=2, max_pending=50, on_done=recorder)
+    for i in range(50):
+        stage.submit(str(i), lambda: time.sleep(0.001))
+    stage.close()
+
+    assert sorted(int(key) for key, _ in recorder.done) == list(range(50))
+    assert all(error is None for _, error in recorder.done)
+    assert not any(thread.is_alive() for thread in stage.threads)
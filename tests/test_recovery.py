@@ -0,0 +1,100 @@
+import socket
+import urllib.error
+
+import pytest
+from selenium.common.exceptions import TimeoutException
+
+from scrape_taobao.core.fetch_item_page import (
+    PAGE_EMPTY_SKU,
+    PAGE_LOGIN,
+    ItemNotFoundError,
+    ValidationPageError,
+)
+from scrape_taobao.core.parse_item_page import PageParseError
+from scrape_taobao.recovery import (
+    FAILURE_CAPTCHA,
+    FAILURE_LOGIN,
+    FAILURE_NETWORK,
+    FAILURE_NOT_FOUND,
+    FAILURE_OTHER,
+    FAILURE_PARSE,
+    CircuitBreaker,
+    classify_failure,
+)
+
+
+@pytest.mark.parametrize(
+    "error, kind",
+    [
+        (ValidationPageError("login", PAGE_LOGIN), FAILURE_LOGIN),
+        (ValidationPageError("captcha"), FAILURE_CAPTCHA),
+        (ValidationPageError("emptied", PAGE_EMPTY_SKU), FAILURE_CAPTCHA),
+        (ItemNotFoundError("taken down"), FAILURE_NOT_FOUND),
+        (PageParseError("no price"), FAILURE_PARSE),
+        (
+            urllib.error.HTTPError("http://x", 404, "Not Found", {}, None),
+            FAILURE_NOT_FOUND,
+        ),
+        (
+            urllib.error.HTTPError("http://x", 503, "Unavailable", {}, None),
+            FAILURE_NETWORK,
+        ),
+        (ConnectionResetError(), FAILURE_NETWORK),
+        (socket.timeout(), FAILURE_NETWORK),
+        (TimeoutException("page load"), FAILURE_NETWORK),
+        (KeyError("price"), FAILURE_OTHER),
+    ],
+)
+def test_classify_failure(error, kind):
+    assert classify_failure(error) == kind
+
+
+def test_breaker_trips_on_login_at_once():
+    breaker = CircuitBreaker(threshold=3, cooldown=0)
+    assert breaker.record(FAILURE_LOGIN)
+    assert not breaker.closed.is_set()
+
+    # the others fail too while it is being recovered
+    assert not breaker.record(FAILURE_LOGIN)
+    assert breaker.recover(FAILURE_LOGIN, lambda: [dict(name="c")])
+    assert breaker.closed.is_set() and breaker.wait()
+    assert (breaker.generation, breaker.cookies) == (1, [dict(name="c")])
+
+
+@pytest.mark.parametrize("kind", [FAILURE_CAPTCHA, FAILURE_NETWORK])
+def test_breaker_trips_on_threshold(kind):
+    breaker = CircuitBreaker(threshold=3, cooldown=0)
+    assert not breaker.record(kind)
+    assert not breaker.record(kind)
+    # the streak is broken by a served item
+    assert not breaker.record(FAILURE_NOT_FOUND)
+    assert not breaker.record(kind)
+    assert not breaker.record(kind)
+    assert breaker.record(kind)
+
+    logins = []
+    assert breaker.recover(kind, lambda: logins.append(kind))
+    assert logins == ([kind] if kind == FAILURE_CAPTCHA else [])
+
+
+def test_breaker_gives_up_after_max_recoveries():
+    breaker = CircuitBreaker(cooldown=0, max_recoveries=2)
+    for _ in range(2):
+        assert breaker.record(FAILURE_LOGIN)
+        assert breaker.recover(FAILURE_LOGIN, lambda: None)
+        # served, but not a success of the session
+        breaker.record(FAILURE_PARSE)
+
+    assert breaker.record(FAILURE_LOGIN)
+    assert not breaker.recover(FAILURE_LOGIN, lambda: None)
+    assert breaker.gave_up and not breaker.wait()
+    assert not breaker.record(FAILURE_LOGIN)
+
+
+def test_breaker_success_resets_the_recoveries():
+    breaker = CircuitBreaker(cooldown=0, max_recoveries=1)
+    for _ in range(3):
+        assert breaker.record(FAILURE_LOGIN)
+        assert breaker.recover(FAILURE_LOGIN, lambda: None)
+        breaker.record(None)
+    assert not breaker.gave_up
@@ -0,0 +1,158 @@
+import os
+import threading
+import urllib.request
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+from scrape_taobao.commands import scrape
+from scrape_taobao.commands.scrape import _ScrapePool
+from scrape_taobao.core.fetch_item_page import ItemPageFetcher
+from scrape_taobao.core.fetch_profile import get_fetch_profile
+from scrape_taobao.item_list import canonical_item_id
+from scrape_taobao.journal import PARSED, ScrapeJournal
+from scrape_taobao.manifest import open_manifest
+from scrape_taobao.metrics import Metrics, make_progress
+from scrape_taobao.page_cache import open_page_cache
+from scrape_taobao.recovery import CircuitBreaker
+from scrape_taobao.store import open_item_store
+
+
+class UrlItemPageFetcher(ItemPageFetcher):
+    """
+    Fetch the pages of the local pages server, in place of a browser.
+    """
+
+    def __init__(self):
+        self.fetched = []
+
+    def fetch(self, url: str) -> str:
+        self.fetched.append(url)
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            return resp.read().decode("utf-8")
+
+
+def _scrape(tmp_path, item_urls, workers=3):
+    out_dir, pages_dir = str(tmp_path / "items"), str(tmp_path / "pages")
+    os.makedirs(out_dir)
+    os.makedirs(pages_dir)
+    fetcher = UrlItemPageFetcher()
+    metrics = Metrics()
+
+    journal = ScrapeJournal(str(tmp_path / "journal.sqlite"))
+    store = open_item_store("sqlite", out_dir)
+    pages = open_page_cache("dir", pages_dir)
+    manifest = open_manifest(out_dir)
+
+    with journal, store, pages, manifest, make_progress() as progress:
+        journal.reset(item_urls)
+        pool = _ScrapePool(
+            item_urls,
+            login=False,
+            session_path=None,
+            share_login=False,
+            journal=journal,
+            pacer=None,
+            fetch_profile=get_fetch_profile("default"),
+            parse_workers=0,
+            breaker=CircuitBreaker(cooldown=0),
+            max_retries=1,
+            metrics=metrics,
+            scrape_kwargs=dict(
+                out_dir=out_dir,
+                pages_dir=pages_dir,
+                store=store,
+                page_cache=pages,
+                manifest=manifest,
+                metrics=metrics,
+            ),
+        )
+        task_id = progress.add_task("scraping", total=len(item_urls))
+        pool._run_workers(
+            workers,
+            lambda _: nullcontext(fetcher),
+            progress,
+            task_id,
+            pause=False,
+        )
+
+        return pool, fetcher, journal.summary(), dict(store.items()), pages
+
+
+def test_scrape_pool_scrapes_served_pages(tmp_path, pages_server):
+    pool, fetcher, summary, items, pages = _scrape(tmp_path, pages_server)
+
+    item_ids = {canonical_item_id(url) for url in pages_server}
+    assert pool.failed_item_urls == []
+    assert summary == {PARSED: len(pages_server)}
+    assert set(items) == item_ids
+    assert all(items[item_id]["choices"] for item_id in item_ids)
+    assert set(pages.ids()) == item_ids
+    assert sorted(fetcher.fetched) == sorted(pages_server)
+    assert "retries_total" not in pool.metrics.summary()["counters"]
+
+
+def test_scrape_pool_skips_duplicated_urls(tmp_path, pages_server):
+    # the same item by another url, which must never be fetched twice
+    item_urls = pages_server[:4] + [pages_server[0] + "&spm=a1z10"]
+    pool, fetcher, summary, items, _ = _scrape(tmp_path, item_urls)
+
+    assert pool.failed_item_urls == []
+    assert len(fetcher.fetched) == 4
+    assert set(items) == {canonical_item_id(url) for url in pages_server[:4]}
+    counters = pool.metrics.summary()["counters"]
+    assert counters["items_total"]["outcome=duplicated"] == 1
+
+
+def test_scrape_pool_fails_missing_items(tmp_path, pages_server):
+    missing_url = pages_server[0].replace("id=1", "id=99999")
+    pool, _, summary, items, _ = _scrape(
+        tmp_path, pages_server[:3] + [missing_url]
+    )
+
+    assert pool.failed_item_urls == [missing_url]
+    assert summary == {PARSED: 3, "failed": 1}
+    assert len(items) == 3
+
+
+def test_scrape_pool_logs_in_again_under_fallback_lock(monkeypatch):
+    # the browser shared as the fallback of the http fetcher
+    browser = SimpleNamespace(driver=object())
+    http_fetcher = SimpleNamespace(
+        fallback_lock=threading.Lock(), update_cookies=lambda cookies: None
+    )
+    driven = []
+
+    def drive(name):
+        def driving(driver, *_):
+            assert driver is browser.driver
+            assert http_fetcher.fallback_lock.locked()
+            driven.append(name)
+            return [{"name": "cookie2"}]
+
+        return driving
+
+    for name in ("login_with_session", "export_login_cookies"):
+        monkeypatch.setattr(scrape, name, drive(name))
+    monkeypatch.setattr(scrape, "import_login_cookies", drive("import"))
+
+    breaker = CircuitBreaker(cooldown=0)
+    pool = _ScrapePool(
+        [],
+        login=True,
+        session_path=None,
+        share_login=False,
+        journal=None,
+        pacer=None,
+        fetch_profile=get_fetch_profile("default"),
+        parse_workers=0,
+        breaker=breaker,
+        max_retries=1,
+        metrics=Metrics(),
+        scrape_kwargs={},
+    )
+    assert pool.login_again(browser, http_fetcher) == [{"name": "cookie2"}]
+
+    breaker.cookies = [{"name": "cookie2"}]
+    pool.take_login(browser, http_fetcher)
+    assert driven == ["login_with_session", "export_login_cookies", "import"]
+    assert not http_fetcher.fallback_lock.locked()
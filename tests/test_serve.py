@@ -0,0 +1,151 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from scrape_taobao.commands.serve import make_jobs_server
+from scrape_taobao.jobs import DONE, FAILED, PARSE, QUEUED, JobBoard
+from scrape_taobao.metrics import Metrics
+
+
+class StubDaemon:
+    """
+    Takes the parse jobs without running them, for the test to finish them.
+    """
+
+    def __init__(self):
+        self.jobs = JobBoard()
+        self.metrics = Metrics()
+        self.items = {"id=1": dict(title="商品")}
+
+    @property
+    def store(self):
+        return self.items
+
+    def submit(self, request: dict):
+        if request.get("kind") != PARSE:
+            raise ValueError("unsupported job kind")
+        return self.jobs.add(PARSE, request.get("item", ""), {})
+
+    def health(self) -> dict:
+        return dict(browsers=0, ready_browsers=0, jobs=self.jobs.counts())
+
+
+@pytest.fixture
+def jobs_server():
+    daemon = StubDaemon()
+    server = make_jobs_server(daemon, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield daemon, "http://{}:{}".format(*server.server_address)
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def _request(url: str, data: dict = None):
+    """
+    :return: the status and the json body of the response
+    """
+    body = None if data is None else json.dumps(data).encode()
+    try:
+        with urllib.request.urlopen(url, body, timeout=10) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        with e:
+            return e.code, json.loads(e.read())
+
+
+def test_job_board_evicts_the_oldest_finished_jobs():
+    board = JobBoard(max_finished=2)
+    jobs = [board.add(PARSE, str(i), {}) for i in range(4)]
+    with pytest.raises(ValueError):
+        board.add("unknown", "", {})
+
+    for job in jobs[:3]:
+        board.start(job)
+        board.finish(job, result=dict(title=job.target))
+    assert jobs[0].finished.is_set()
+
+    # the unfinished job is kept however old
+    assert board.get(jobs[0].id) is None
+    assert [job.target for job in board.list()] == ["1", "2", "3"]
+    assert board.counts() == {DONE: 2, QUEUED: 1}
+
+    board.finish(jobs[3], error=KeyError("no page"))
+    assert board.get(jobs[1].id) is None
+    assert [job.target for job in board.list(FAILED)] == ["3"]
+    assert board.get(jobs[3].id).error == "'no page'"
+
+
+def test_submit_and_query_jobs(jobs_server):
+    daemon, base = jobs_server
+
+    status, job = _request(base + "/jobs", dict(kind=PARSE, item="1"))
+    assert status == 202
+    assert job["state"] == QUEUED and job["result"] is None
+
+    assert _request(base + "/jobs")[1] == [
+        {key: value for key, value in job.items() if key != "result"}
+    ]
+    assert _request(base + "/jobs?state=done") == (200, [])
+
+    # finished while waiting
+    timer = threading.Timer(
+        0.1,
+        daemon.jobs.finish,
+        (daemon.jobs.get(job["id"]),),
+        dict(result=dict(title="商品")),
+    )
+    timer.start()
+    status, job = _request(base + "/jobs/{}?wait=10".format(job["id"]))
+    timer.join()
+    assert status == 200
+    assert job["state"] == DONE and job["result"] == dict(title="商品")
+
+    # still queued after the wait
+    status, _ = _request(base + "/jobs?wait=0.1", dict(kind=PARSE, item="2"))
+    assert status == 202
+    assert _request(base + "/health")[1]["jobs"] == {DONE: 1, QUEUED: 1}
+    assert _request(base + "/items/1") == (200, dict(title="商品"))
+
+
+@pytest.mark.parametrize(
+    "path", ["/jobs/42", "/jobs/42?wait=abc", "/items/2", "/unknown"]
+)
+def test_get_not_found(jobs_server, path):
+    status, body = _request(jobs_server[1] + path)
+    assert status == 404 and body["error"]
+
+
+@pytest.mark.parametrize("wait", ["abc", "-1", "nan", "inf"])
+def test_bad_wait_is_rejected(jobs_server, wait):
+    daemon, base = jobs_server
+    job = daemon.jobs.add(PARSE, "1", {})
+
+    status, body = _request(base + "/jobs/{}?wait={}".format(job.id, wait))
+    assert status == 400 and "wait" in body["error"]
+
+    status, body = _request(
+        base + "/jobs?wait={}".format(wait), dict(kind=PARSE, item="1")
+    )
+    assert status == 400 and "wait" in body["error"]
+    # nothing submitted by the bad request
+    assert len(daemon.jobs.list()) == 1
+
+
+def test_bad_post_is_rejected(jobs_server):
+    daemon, base = jobs_server
+    assert _request(base + "/jobs", dict(kind="unknown"))[0] == 400
+    assert _request(base + "/unknown", dict(kind=PARSE))[0] == 404
+
+    req = urllib.request.Request(base + "/jobs", b"[1, 2]", method="POST")
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(req, timeout=10)
+    with e.value:
+        assert e.value.code == 400
+    assert daemon.jobs.list() == []
@@ -0,0 +1,54 @@
+import json
+import os
+import threading
+
+from scrape_taobao.core.session import save_session
+
+
+class StubDriver:
+    """
+    A browser at a page of the origin, with a local storage item and a
+    cookie of its own.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+
+    def execute_script(self, script: str):
+        if "location.origin" in script:
+            return "https://item{}.taobao.com".format(self.index)
+        return {"key": str(self.index)}
+
+    def execute_cdp_cmd(self, cmd: str, params: dict):
+        assert cmd == "Network.getAllCookies"
+        return {"cookies": [{"name": "c", "value": str(self.index)}]}
+
+
+def test_save_session_by_concurrent_browsers(tmp_path):
+    session_path = str(tmp_path / "session.json")
+    errors = []
+
+    def save(driver):
+        try:
+            for _ in range(50):
+                save_session(driver, session_path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=save, args=(StubDriver(i),)) for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    # no temp file is left behind
+    assert os.listdir(tmp_path) == ["session.json"]
+    with open(session_path) as f:
+        session = json.load(f)
+    # the local storages of all the browsers are merged
+    assert session["local_storage"] == {
+        "https://item{}.taobao.com".format(i): {"key": str(i)} for i in range(4)
+    }
@@ -0,0 +1,176 @@
+import collections
+import multiprocessing
+import time
+
+import pytest
+from bench_io import make_item
+
+from scrape_taobao.bean.item_query import ItemQuery
+from scrape_taobao.commands.export_items import export_items
+from scrape_taobao.commands.import_items import import_items
+from scrape_taobao.store import (
+    FileItemStore,
+    ItemStore,
+    JsonlItemStore,
+    SqliteItemStore,
+    open_item_store,
+)
+
+STORES = ["file", "sqlite", "jsonl"]
+
+
+def _items(n: int = 20) -> dict:
+    return {"id={}".format(i): make_item(i) for i in range(1, n + 1)}
+
+
+def _normalized(items) -> dict:
+    # the price range is loaded as a list from json or yaml files
+    return {
+        item_id: dict(item, price_range=tuple(item["price_range"]))
+        for item_id, item in items
+    }
+
+
+@pytest.mark.parametrize("store", STORES)
+def test_store_round_trip(tmp_path, store):
+    items = _items()
+    with open_item_store(store, str(tmp_path), fmt="json") as item_store:
+        for item_id, item in items.items():
+            item_store.put(item_id, item)
+
+        assert item_store.exists("id=1")
+        assert not item_store.exists("id=999")
+        assert item_store.get("id=999") is None
+        assert _normalized([("id=3", item_store.get("id=3"))]) == {
+            "id=3": items["id=3"]
+        }
+
+    # reopened, as by the next run
+    with open_item_store(store, str(tmp_path), fmt="json") as item_store:
+        assert _normalized(item_store.items()) == items
+
+
+@pytest.mark.parametrize("store", STORES)
+def test_store_put_replaces_item(tmp_path, store):
+    with open_item_store(store, str(tmp_path), fmt="json") as item_store:
+        item_store.put("id=1", make_item(1))
+        version = item_store.version()
+
+        # so that the mtime of the file changes, whose resolution is coarse
+        time.sleep(0.05)
+        item_store.put("id=1", make_item(2))
+        assert item_store.version() != version
+        assert _normalized(item_store.items()) == {"id=1": make_item(2)}
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        ItemQuery(),
+        ItemQuery(min_price=100),
+        ItemQuery(max_price=300, platform="tmall"),
+        ItemQuery(min_total_stock=1000, max_sales=5000),
+        ItemQuery(min_sales=2000, max_total_stock=8000),
+        ItemQuery(platform="taobao,tmall", min_price=50, max_price=450),
+    ],
+)
+def test_sqlite_query_matches_item_query(tmp_path, query):
+    items = _items(60)
+    with SqliteItemStore(str(tmp_path / "items.sqlite")) as item_store:
+        for item_id, item in items.items():
+            item_store.put(item_id, item)
+
+        # the sql conditions must keep the semantics of `ItemQuery.match`
+        expected = dict(ItemStore.query(item_store, query))
+        assert _normalized(item_store.query(query)) == expected
+
+
+@pytest.mark.parametrize(
+    "store", ["sqlite:{tmp}/items.sqlite", "jsonl:{tmp}/items.jsonl"]
+)
+def test_import_and_export_items(tmp_path, store):
+    store = store.format(tmp=tmp_path)
+    items = _items()
+    src_dir, dst_dir = tmp_path / "src", tmp_path / "dst"
+    src_dir.mkdir()
+    with FileItemStore(str(src_dir), fmt="yaml") as item_store:
+        for item_id, item in items.items():
+            item_store.put(item_id, item)
+
+    import_items(str(src_dir), fmt="yaml", store=store)
+    with open_item_store(store, str(src_dir)) as item_store:
+        assert _normalized(item_store.items()) == items
+
+    export_items(str(dst_dir), fmt="json", store=store)
+    with FileItemStore(str(dst_dir), fmt="json") as item_store:
+        assert _normalized(item_store.items()) == items
+
+
+def _put_in_chunks(jsonl_path: str, worker: int, n_chunks: int):
+    # reopened per chunk, as by the workers of the parse command
+    for chunk in range(n_chunks):
+        with JsonlItemStore(jsonl_path, flush_every=3) as item_store:
+            for i in range(10):
+                index = (worker * n_chunks + chunk) * 10 + i + 1
+                item_store.put("id={}".format(index), make_item(index))
+
+
+def test_jsonl_store_concurrent_writers(tmp_path):
+    jsonl_path = str(tmp_path / "items.jsonl")
+    n_workers, n_chunks = 4, 5
+    processes = [
+        multiprocessing.Process(
+            target=_put_in_chunks, args=(jsonl_path, worker, n_chunks)
+        )
+        for worker in range(n_workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    with JsonlItemStore(jsonl_path) as item_store:
+        items = _normalized(item_store.items())
+        assert items == _items(n_workers * n_chunks * 10)
+        assert _normalized([("id=77", item_store.get("id=77"))]) == {
+            "id=77": make_item(77)
+        }
+
+
+def _put_slowly(db_path: str, first: int, start, times):
+    # opened as by the workers of the parse command
+    with open_item_store("sqlite:" + db_path, "", commit_every=1) as item_store:
+        start.wait()
+        for index in range(first, first + 10):
+            item_store.put("id={}".format(index), make_item(index))
+            times.put((first, time.time()))
+            time.sleep(0.05)
+
+
+def test_sqlite_store_concurrent_writers(tmp_path):
+    db_path = str(tmp_path / "items.sqlite")
+    start, times = multiprocessing.Event(), multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=_put_slowly, args=(db_path, first, start, times)
+        )
+        for first in (1, 11)
+    ]
+    for process in processes:
+        process.start()
+    start.set()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    put_times = collections.defaultdict(list)
+    for _ in range(20):
+        first, put_time = times.get(timeout=10)
+        put_times[first].append(put_time)
+    # never waiting for each other to close the store
+    assert min(put_times[11]) < max(put_times[1])
+    assert min(put_times[1]) < max(put_times[11])
+
+    with SqliteItemStore(db_path) as item_store:
+        assert _normalized(item_store.items()) == _items(20)
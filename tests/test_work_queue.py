@@ -0,0 +1,118 @@
+import multiprocessing
+import time
+import urllib.request
+
+from scrape_taobao.item_list import canonical_item_id
+from scrape_taobao.work_queue import (
+    DONE,
+    LEASED,
+    PENDING,
+    WorkQueue,
+    make_worker_id,
+)
+
+
+def _work(db_path: str, claims_path: str):
+    # a scrape process, fetching the claimed items from the pages server
+    worker_id = make_worker_id()
+    with WorkQueue(db_path) as work_queue, open(claims_path, "w") as f:
+        work_queue.register(worker_id)
+        while True:
+            claimed = work_queue.claim(worker_id)
+            if claimed is None:
+                break
+            item_id, url = claimed
+            with urllib.request.urlopen(url, timeout=10) as resp:
+                assert resp.status == 200
+            print(item_id, file=f, flush=True)
+            assert work_queue.complete(worker_id, item_id)
+        work_queue.release(worker_id)
+
+
+def _work_until_killed(db_path: str, worker_id: str, lease_seconds: float):
+    # claims an item, and keeps its lease alive by heartbeats until killed
+    with WorkQueue(db_path, lease_seconds=lease_seconds) as work_queue:
+        work_queue.register(worker_id)
+        work_queue.claim(worker_id)
+        while True:
+            work_queue.heartbeat(worker_id)
+            time.sleep(lease_seconds / 5)
+
+
+def _items(urls) -> list:
+    return [(canonical_item_id(url), url) for url in urls]
+
+
+def test_work_queue_shared_by_processes(tmp_path, pages_server):
+    db_path = str(tmp_path / "queue.sqlite")
+    with WorkQueue(db_path) as work_queue:
+        assert work_queue.add(_items(pages_server)) == len(pages_server)
+        # added again by another worker starting with the same list
+        assert work_queue.add(_items(pages_server)) == 0
+
+    claims_paths = [str(tmp_path / "claims-{}".format(i)) for i in range(3)]
+    processes = [
+        multiprocessing.Process(target=_work, args=(db_path, claims_path))
+        for claims_path in claims_paths
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    claimed = []
+    for claims_path in claims_paths:
+        with open(claims_path) as f:
+            claimed += f.read().split()
+    # never claimed twice
+    assert sorted(claimed) == sorted(
+        item_id for item_id, _ in _items(pages_server)
+    )
+
+    with WorkQueue(db_path) as work_queue:
+        assert work_queue.summary() == {DONE: len(pages_server)}
+        assert work_queue.workers() == []
+
+
+def test_work_queue_reclaims_expired_lease(tmp_path, pages_server):
+    db_path = str(tmp_path / "queue.sqlite")
+    lease_seconds = 1.0
+    items = _items(pages_server[:3])
+    with WorkQueue(db_path, lease_seconds=lease_seconds) as work_queue:
+        work_queue.add(items)
+
+        killed_id = make_worker_id()
+        process = multiprocessing.Process(
+            target=_work_until_killed, args=(db_path, killed_id, lease_seconds)
+        )
+        process.start()
+        deadline = time.time() + 10
+        while LEASED not in work_queue.summary():
+            assert time.time() < deadline
+            time.sleep(0.05)
+
+        # kept alive by the heartbeats beyond the lease
+        time.sleep(lease_seconds * 1.5)
+        worker_id = make_worker_id()
+        assert work_queue.claim(worker_id) == items[1]
+        assert work_queue.complete(worker_id, items[1][0])
+
+        process.kill()
+        process.join()
+        time.sleep(lease_seconds * 1.5)
+        assert work_queue.summary() == {"expired": 1, DONE: 1, PENDING: 1}
+
+        # the expired lease goes before the pending items
+        assert work_queue.claim(worker_id) == items[0]
+        assert not work_queue.complete(killed_id, items[0][0])
+        assert work_queue.complete(worker_id, items[0][0])
+        assert work_queue.claim(worker_id) == items[2]
+        assert work_queue.complete(worker_id, items[2][0])
+        assert work_queue.claim(worker_id) is None
+        assert work_queue.summary() == {DONE: 3}
+
+        (attempts,) = work_queue.conn.execute(
+            "SELECT attempts FROM work WHERE item_id = ?", (items[0][0],)
+        ).fetchone()
+        assert attempts == 2